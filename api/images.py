@@ -0,0 +1,86 @@
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
+# A directory changed this recently may change again within the same mtime
+# tick, which the mtime wouldn't show, so its listing isn't trusted yet
+RACY_NS = 2 * 10 ** 9
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+class ImageIndex:
+    """
+    Sorted names of the image files in a directory, kept in memory and only
+    rescanned when the directory's mtime changes (files added, removed or
+    renamed), so a request costs one stat() rather than a directory listing.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.snapshot = (None, [])  # (directory mtime in ns, names), swapped as one
+
+    def refresh(self):
+        """
+        The current (mtime_ns, names), rescanning if the directory changed.
+        Raises FileNotFoundError if it doesn't exist.
+        """
+        mtime_ns = os.stat(self.directory).st_mtime_ns
+        if mtime_ns != self.snapshot[0]:
+            with self.lock:
+                if mtime_ns != self.snapshot[0]:
+                    self.snapshot = self.scan()
+        return self.snapshot
+
+    def scan(self):
+        mtime_ns = os.stat(self.directory).st_mtime_ns
+        with os.scandir(self.directory) as entries:
+            names = sorted(
+                entry.name for entry in entries
+                if os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS and entry.is_file()
+            )
+        if time.time_ns() - mtime_ns < RACY_NS:
+            # Scan again next time, in case of a change the mtime didn't show
+            return None, names
+        return mtime_ns, names
+
+
+def image_directory():
+    return os.path.join(settings.MEDIA_ROOT, 'images', 'rsps')
+
+
+def image_index(directory=None):
+    """The shared index of a directory, by default the gallery's"""
+    directory = directory or image_directory()
+    index = _indexes.get(directory)
+    if index is None:
+        with _indexes_lock:
+            index = _indexes.setdefault(directory, ImageIndex(directory))
+    return index
+
+
+def index_etag(request, *args, **kwargs):
+    """ETag of the gallery listing: changes whenever the directory does"""
+    try:
+        mtime_ns, names = image_index().refresh()
+    except FileNotFoundError:
+        return None
+    if mtime_ns is None:
+        return None
+    return f'"{mtime_ns:x}-{len(names)}"'
+
+
+def index_last_modified(request, *args, **kwargs):
+    try:
+        mtime_ns, _ = image_index().refresh()
+    except FileNotFoundError:
+        return None
+    if mtime_ns is None:
+        return None
+    return datetime.fromtimestamp(mtime_ns / 10 ** 9, tz=timezone.utc)
@@ -0,0 +1,29 @@
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+
+
+class CatalogCursorPagination(CursorPagination):
+    """
+    Cursor pagination keeps page fetches constant-time on large catalogs and
+    doesn't skip or repeat rows while new uploads arrive.
+    """
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    ordering = '-pk'
+
+
+class ImagePagination(PageNumberPagination):
+    """Pages of the image gallery listing, keeping the original response keys"""
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+    def get_paginated_response(self, data):
+        return Response({
+            'status': 'success',
+            'count': self.page.paginator.count,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'images': data,
+        })
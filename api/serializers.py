@@ -0,0 +1,92 @@
+from rest_framework import serializers
+
+from tracker.models import DataSource, SchemaDefinition, PrimaryKeyCandidate, SchemaChange, SchemaRelationship
+
+
+def field_list(request, param):
+    """Parse a comma-separated query parameter such as ?fields=a,b into a set"""
+    value = request.query_params.get(param, '') if request is not None else ''
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+class SparseFieldsetMixin:
+    """
+    Lets clients pick fields with ?fields=a,b or drop them with ?omit=a,b.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        fields = field_list(request, 'fields')
+        omit = field_list(request, 'omit')
+
+        for name in list(self.fields):
+            if (fields and name not in fields) or name in omit:
+                self.fields.pop(name)
+
+
+class DataSourceSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    class Meta:
+        model = DataSource
+        fields = ['id', 'original_filename', 'upload_date', 'file', 'canonical_name', 'schema_version',
+                  'source_type', 'normalized_filename']
+        read_only_fields = ['upload_date', 'normalized_filename']
+        extra_kwargs = {'original_filename': {'required': False}}
+
+    def create(self, validated_data):
+        if not validated_data.get('original_filename') and validated_data.get('file'):
+            validated_data['original_filename'] = validated_data['file'].name
+        return super().create(validated_data)
+
+
+class ColumnDefinitionsField(serializers.JSONField):
+    """
+    Column definitions put back together from the schema's columns and samples.
+    ?omit=sample_values keeps the column types without loading the samples.
+    """
+
+    def get_attribute(self, schema):
+        sample_values = 'sample_values' not in field_list(self.context.get('request'), 'omit')
+        return schema.get_column_definitions(sample_values)
+
+
+class SchemaDefinitionSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    column_definitions = ColumnDefinitionsField()
+    canonical_name = serializers.CharField(source='data_source.canonical_name', read_only=True)
+    schema_version = serializers.IntegerField(source='data_source.schema_version', read_only=True)
+    column_count = serializers.SerializerMethodField()
+    path_stats = serializers.JSONField(read_only=True)
+
+    class Meta:
+        model = SchemaDefinition
+        fields = ['id', 'data_source', 'canonical_name', 'schema_version', 'detected_date', 'row_count',
+                  'column_count', 'column_definitions', 'path_stats']
+        read_only_fields = ['detected_date']
+
+    def get_column_count(self, schema):
+        return len(schema.columns)
+
+
+class PrimaryKeyCandidateSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    data_source = serializers.IntegerField(source='schema.data_source_id', read_only=True)
+
+    class Meta:
+        model = PrimaryKeyCandidate
+        fields = ['id', 'schema', 'data_source', 'column_name', 'uniqueness_ratio', 'is_confirmed']
+
+
+class SchemaChangeSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    class Meta:
+        model = SchemaChange
+        fields = ['id', 'source', 'previous_version', 'change_date', 'change_type', 'details']
+        read_only_fields = ['change_date']
+
+
+class SchemaRelationshipSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    source_data_source = serializers.IntegerField(source='source_schema.data_source_id', read_only=True)
+    target_data_source = serializers.IntegerField(source='target_schema.data_source_id', read_only=True)
+
+    class Meta:
+        model = SchemaRelationship
+        fields = ['id', 'source_schema', 'target_schema', 'source_data_source', 'target_data_source',
+                  'relationship_type', 'source_columns', 'target_columns', 'similarity_score', 'details']
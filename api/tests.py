@@ -1,3 +1,263 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
 
-# Create your tests here.
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from tracker.models import DataSource, SchemaDefinition, PrimaryKeyCandidate, SchemaRelationship
+
+try:
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+class CatalogExportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.schemas = []
+        for n in range(3):
+            source = DataSource.objects.create(original_filename=f"orders_v{n + 1}.csv", canonical_name='orders',
+                                               schema_version=n + 1)
+            schema = SchemaDefinition.objects.create(
+                data_source=source,
+                column_definitions={
+                    'order_id': {'type': 'int64', 'sample_values': [1, 2]},
+                    'total': {'type': 'float64', 'sample_values': [9.5]},
+                },
+                row_count=10
+            )
+            PrimaryKeyCandidate.objects.create(schema=schema, column_name='order_id', uniqueness_ratio=1.0)
+            cls.schemas.append(schema)
+        SchemaRelationship.objects.create(source_schema=cls.schemas[0], target_schema=cls.schemas[1],
+                                          relationship_type='version', similarity_score=0.9)
+        cls.source = cls.schemas[1].data_source
+
+    def export(self, export_format='json', **params):
+        if export_format == 'json':
+            url = reverse('api:catalog_export')
+        else:
+            url = reverse('api:catalog_export_format', args=[export_format])
+        response = self.client.get(url, params)
+        if response.status_code == 200:
+            self.assertTrue(response.streaming)
+        return response
+
+    def test_json(self):
+        catalog = json.loads(b''.join(self.export(omit='sample_values').streaming_content))
+        self.assertEqual(list(catalog), ['data_sources', 'schemas', 'primary_keys', 'changes', 'relationships'])
+        self.assertEqual(len(catalog['schemas']), 3)
+        self.assertNotIn('sample_values', catalog['schemas'][0]['column_definitions']['order_id'])
+
+    @mock.patch('tracker.export.EXPORT_BUFFER_SIZE', 1)
+    async def test_asgi_reads_incrementally(self):
+        from tracker import export
+
+        rows_read = []
+        iter_section_rows = export.iter_section_rows
+
+        def counted_rows(*args, **kwargs):
+            for row in iter_section_rows(*args, **kwargs):
+                rows_read.append(row)
+                yield row
+
+        with mock.patch('tracker.export.iter_section_rows', counted_rows):
+            response = await self.async_client.get(reverse('api:catalog_export_format', args=['jsonl']))
+            self.assertTrue(response.is_async)
+            content = aiter(response.streaming_content)
+            first = await anext(content)
+            self.assertEqual(len(rows_read), 1)
+            rest = [piece async for piece in content]
+        rows = [json.loads(line) for line in b''.join([first, *rest]).splitlines()]
+        self.assertEqual(len(rows), len(rows_read))
+        self.assertGreater(len(rows), 1)
+
+    def test_source_filter(self):
+        catalog = json.loads(b''.join(self.export(source=self.source.pk).streaming_content))
+        self.assertEqual([row['id'] for row in catalog['data_sources']], [self.source.pk])
+        self.assertEqual([row['id'] for row in catalog['schemas']], [self.schemas[1].pk])
+        # Relationships in either direction belong to the source
+        self.assertEqual(len(catalog['relationships']), 1)
+
+    def test_jsonl(self):
+        response = self.export('jsonl', sections='schemas,primary_keys')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        records = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([record['section'] for record in records], ['schemas'] * 3 + ['primary_keys'] * 3)
+
+    def test_csv_columns(self):
+        response = self.export('csv', source=self.source.pk)
+        self.assertIn('catalog_source_', response['Content-Disposition'])
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual([row['column_name'] for row in rows], ['order_id', 'total'])
+        self.assertEqual(json.loads(rows[0]['sample_values']), [1, 2])
+
+    def test_bad_requests(self):
+        self.assertEqual(self.export(sections='nope').status_code, 400)
+        self.assertEqual(self.export('csv', sections='schemas,columns').status_code, 400)
+        self.assertEqual(self.export(source='abc').status_code, 400)
+        self.assertEqual(self.export('xml').status_code, 404)
+
+    @unittest.skipIf(pyarrow is None, "pyarrow isn't installed")
+    def test_parquet(self):
+        response = self.export('parquet', section='primary_keys')
+        table = pyarrow.parquet.read_table(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(table.num_rows, 3)
+        self.assertEqual(table.column('column_name').to_pylist(), ['order_id'] * 3)
+
+
+class CatalogViewSetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.schemas = []
+        for n in range(5):
+            source = DataSource.objects.create(original_filename=f"orders_v{n + 1}.csv", canonical_name='orders',
+                                               schema_version=n + 1, source_type='csv')
+            cls.schemas.append(SchemaDefinition.objects.create(
+                data_source=source,
+                column_definitions={'order_id': {'type': 'int64', 'sample_values': [1, 2]}},
+                row_count=10
+            ))
+        SchemaRelationship.objects.create(source_schema=cls.schemas[0], target_schema=cls.schemas[1],
+                                          relationship_type='version', similarity_score=0.9,
+                                          details={'method': 'name'})
+
+    def get(self, name, **params):
+        response = self.client.get(reverse(f'api:{name}-list'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_cursor_pagination(self):
+        ids = []
+        page = self.get('datasource', page_size=2)
+        self.assertIsNone(page['previous'])
+        while True:
+            self.assertLessEqual(len(page['results']), 2)
+            ids.extend(row['id'] for row in page['results'])
+            if not page['next']:
+                break
+            # Rows added while paging don't shift the pages still to come
+            DataSource.objects.create(original_filename='late.csv', canonical_name='late')
+            response = self.client.get(page['next'])
+            self.assertEqual(response.status_code, 200)
+            page = response.json()
+            self.assertIsNotNone(page['previous'])
+        expected = sorted((schema.data_source_id for schema in self.schemas), reverse=True)
+        self.assertEqual(ids, expected)
+
+    def test_sparse_fieldsets(self):
+        rows = self.get('datasource', fields='id,canonical_name')['results']
+        self.assertEqual([set(row) for row in rows], [{'id', 'canonical_name'}] * 5)
+
+        row = self.get('schemadefinition', omit='column_definitions,path_stats')['results'][0]
+        self.assertNotIn('column_definitions', row)
+        self.assertEqual(row['column_count'], 1)
+
+        row = self.get('schemadefinition', fields='id,column_definitions', omit='sample_values')['results'][0]
+        self.assertEqual(row['column_definitions'], {'order_id': {'type': 'int64'}})
+
+    def test_filters(self):
+        rows = self.get('datasource', schema_version=2)['results']
+        self.assertEqual([row['schema_version'] for row in rows], [2])
+        self.assertEqual(len(self.get('schemadefinition', data_source__canonical_name='orders')['results']), 5)
+
+    def test_invalid_filter_is_400(self):
+        response = self.client.get(reverse('api:datasource-list'), {'schema_version': 'abc'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'schema_version': "Invalid value 'abc'"})
+        self.assertEqual(self.client.get(reverse('api:schemadefinition-list'), {'data_source': 'x'}).status_code, 400)
+
+    def select(self, name, **params):
+        """The SQL of the main query of a list request"""
+        with CaptureQueriesContext(connection) as queries:
+            self.get(name, **params)
+        return next(query['sql'] for query in queries if query['sql'].startswith('SELECT'))
+
+    def test_large_fields_are_deferred(self):
+        self.assertIn('"tracker_schemadefinition"."columns"', self.select('schemadefinition'))
+        self.assertIn('tracker_schemasamples', self.select('schemadefinition'))
+        sql = self.select('schemadefinition', fields='id,row_count')
+        self.assertNotIn('"tracker_schemadefinition"."columns"', sql)
+        self.assertNotIn('tracker_schemasamples', sql)
+        # The column types without the samples
+        sql = self.select('schemadefinition', omit='sample_values,path_stats')
+        self.assertIn('"tracker_schemadefinition"."columns"', sql)
+        self.assertNotIn('tracker_schemasamples', sql)
+
+        self.assertIn('"tracker_schemarelationship"."details"', self.select('schemarelationship'))
+        self.assertNotIn('"tracker_schemarelationship"."details"', self.select('schemarelationship', omit='details'))
+
+        # Related schemas are only joined for their data source
+        PrimaryKeyCandidate.objects.create(schema=self.schemas[0], column_name='order_id', uniqueness_ratio=1.0)
+        for name in ['primarykeycandidate', 'schemarelationship']:
+            with self.subTest(name=name):
+                sql = self.select(name)
+                self.assertIn('"data_source_id"', sql)
+                self.assertNotIn('."columns"', sql)
+        row = self.get('schemarelationship')['results'][0]
+        self.assertEqual((row['source_data_source'], row['target_data_source']),
+                         (self.schemas[0].data_source_id, self.schemas[1].data_source_id))
+
+
+class ImageIndexTests(TestCase):
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.directory = os.path.join(media_root, 'images', 'rsps')
+        os.makedirs(self.directory)
+        self.add_files('b.jpg', 'a.png', 'notes.txt', age=60)
+
+    def add_files(self, *names, age):
+        for name in names:
+            open(os.path.join(self.directory, name), 'wb').close()
+        # Old enough that the index trusts the directory's mtime
+        mtime = time.time() - age
+        os.utime(self.directory, (mtime, mtime))
+
+    def test_listing_is_indexed_and_revalidated(self):
+        with mock.patch('api.images.os.scandir', wraps=os.scandir) as scandir:
+            response = self.client.get(reverse('api:get_images'))
+            self.assertEqual(response.json()['images'], ['a.png', 'b.jpg'])
+            self.assertIn('Last-Modified', response)
+
+            # Unchanged directory: not listed again, and a client with the ETag gets a 304
+            response = self.client.get(reverse('api:get_images'), HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(scandir.call_count, 1)
+
+        etag = response['ETag']
+        self.add_files('c.webp', age=30)
+        response = self.client.get(reverse('api:get_images'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], 3)
+
+    def test_pages(self):
+        page = self.client.get(reverse('api:get_images'), {'page_size': 1, 'page': 2}).json()
+        self.assertEqual(page['images'], ['b.jpg'])
+        self.assertEqual(page['count'], 2)
+        self.assertIsNotNone(page['previous'])
+
+    def test_random_image(self):
+        response = self.client.get(reverse('api:get_random_image'))
+        self.assertIn(response.json()['image'], ['a.png', 'b.jpg'])
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        self.assertIn('ETag', response)
+
+        shutil.rmtree(self.directory)
+        self.assertEqual(self.client.get(reverse('api:get_random_image')).status_code, 404)
+        self.assertEqual(self.client.get(reverse('api:get_images')).status_code, 404)
@@ -1,11 +1,22 @@
 # urls.py
-from django.urls import path
+from django.urls import path, include
+from rest_framework.routers import DefaultRouter
 from . import views
 
 app_name = 'api'
 
+router = DefaultRouter()
+router.register('datasources', views.DataSourceViewSet)
+router.register('schemas', views.SchemaDefinitionViewSet)
+router.register('primary-keys', views.PrimaryKeyCandidateViewSet)
+router.register('changes', views.SchemaChangeViewSet)
+router.register('relationships', views.SchemaRelationshipViewSet)
+
 urlpatterns = [
     path('images/', views.get_images, name='get_images'),
     path('images/random/', views.get_random_image, name='get_random_image'),
+    path('catalog/export/', views.catalog_export, name='catalog_export'),
+    path('catalog/export.<str:export_format>', views.catalog_export, name='catalog_export_format'),
+    path('catalog/', include(router.urls)),
 ]
 
@@ -1,96 +1,221 @@
 # views.py
-import os
 import random
 from django.conf import settings
-from django.http import JsonResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import condition
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
-from rest_framework import status
+from rest_framework import status, viewsets, permissions
+from rest_framework.exceptions import ValidationError
+from django.core.exceptions import ValidationError as DjangoValidationError
+from tracker.models import DataSource, SchemaDefinition, PrimaryKeyCandidate, SchemaChange, SchemaRelationship
+from tracker.export import EXPORT_FORMATS, iter_catalog, iterate_in_thread
+from .images import image_index, index_etag, index_last_modified
+from .pagination import CatalogCursorPagination, ImagePagination
+from .serializers import (
+    field_list, DataSourceSerializer, SchemaDefinitionSerializer, PrimaryKeyCandidateSerializer,
+    SchemaChangeSerializer, SchemaRelationshipSerializer
+)
 
+@condition(etag_func=index_etag, last_modified_func=index_last_modified)
 @api_view(['GET'])
 def get_images(request):
     """
-    API endpoint that returns a list of all images in the rsps directory.
+    API endpoint that returns a page of the images in the rsps directory
+    (?page=, ?page_size=), from an index rebuilt only when the directory changes.
     """
-    # Path to the rsps directory, relative to your MEDIA_ROOT
-    rsps_dir = os.path.join(settings.MEDIA_ROOT, 'images', 'rsps')
-    
-    # Check if directory exists
-    if not os.path.exists(rsps_dir):
+    try:
+        _, image_files = image_index().refresh()
+    except FileNotFoundError:
         return Response(
-            {"error": "Image directory not found"}, 
+            {"error": "Image directory not found"},
             status=status.HTTP_404_NOT_FOUND
         )
-    
-    # Get all files in the directory
-    try:
-        files = os.listdir(rsps_dir)
-        
-        # Filter out non-image files by extension
-        image_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.webp']
-        image_files = [
-            file for file in files 
-            if os.path.splitext(file)[1].lower() in image_extensions
-        ]
-        
-        return Response({
-            "status": "success",
-            "count": len(image_files),
-            "images": image_files
-        })
-    
-    except Exception as e:
+    except OSError as e:
         return Response(
-            {"error": str(e)}, 
+            {"error": str(e)},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
+    paginator = ImagePagination()
+    page = paginator.paginate_queryset(image_files, request)
+    return paginator.get_paginated_response(page)
+
 @api_view(['GET'])
 def get_random_image(request):
     """
     API endpoint that returns a random image from the rsps directory.
     """
-    # Path to the rsps directory, relative to your MEDIA_ROOT
-    rsps_dir = os.path.join(settings.MEDIA_ROOT, 'images', 'rsps')
-    
-    # Check if directory exists
-    if not os.path.exists(rsps_dir):
+    try:
+        mtime_ns, image_files = image_index().refresh()
+    except FileNotFoundError:
         return Response(
-            {"error": "Image directory not found"}, 
+            {"error": "Image directory not found"},
             status=status.HTTP_404_NOT_FOUND
         )
-    
-    # Get all files in the directory
-    try:
-        files = os.listdir(rsps_dir)
-        
-        # Filter out non-image files by extension
-        image_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.webp']
-        image_files = [
-            file for file in files 
-            if os.path.splitext(file)[1].lower() in image_extensions
-        ]
-        
-        if not image_files:
-            return Response(
-                {"error": "No images found in directory"}, 
-                status=status.HTTP_404_NOT_FOUND
-            )
-        
-        # Select a random image
-        random_image = random.choice(image_files)
-        
-        # Construct the URL (adjust as needed for your MEDIA_URL configuration)
-        image_url = f"{settings.MEDIA_URL}images/rsps/{random_image}"
-        
-        return Response({
-            "status": "success",
-            "image": random_image,
-            "url": image_url
-        })
-    
-    except Exception as e:
+    except OSError as e:
         return Response(
-            {"error": str(e)}, 
+            {"error": str(e)},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
+
+    if not image_files:
+        return Response(
+            {"error": "No images found in directory"},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    # Select a random image
+    position = random.randrange(len(image_files))
+    random_image = image_files[position]
+
+    # Construct the URL (adjust as needed for your MEDIA_URL configuration)
+    image_url = f"{settings.MEDIA_URL}images/rsps/{random_image}"
+
+    response = Response({
+        "status": "success",
+        "image": random_image,
+        "url": image_url
+    })
+    # Each request picks anew, so caches must revalidate rather than replay one pick
+    response['Cache-Control'] = 'no-cache'
+    response['ETag'] = quote_etag(f"{mtime_ns or 0:x}-{position}")
+    if mtime_ns:
+        response['Last-Modified'] = http_date(mtime_ns // 10 ** 9)
+    return response
+
+
+class CatalogViewSet(viewsets.ModelViewSet):
+    """
+    Base for the tracker catalog endpoints: cursor pagination, sparse
+    fieldsets (?fields= / ?omit=) and simple ?<field>=<value> filters.
+    """
+    pagination_class = CatalogCursorPagination
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    filter_fields = []
+    # Large model fields deferred in the query when the client asks for none of
+    # the response fields that are built from them
+    deferrable_fields = {}
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+
+        for name in self.filter_fields:
+            value = self.request.query_params.get(name)
+            if value is not None:
+                if value.lower() in ('true', 'false'):
+                    value = value.lower() == 'true'
+                try:
+                    queryset = queryset.filter(**{name: value})
+                except (ValueError, DjangoValidationError):
+                    raise ValidationError({name: f"Invalid value '{value}'"})
+
+        fields = field_list(self.request, 'fields')
+        omit = field_list(self.request, 'omit')
+        deferred = [
+            name for name, response_fields in self.deferrable_fields.items()
+            if all(field in omit or (fields and field not in fields) for field in response_fields)
+        ]
+        if deferred and self.request.method == 'GET':
+            queryset = queryset.defer(*deferred)
+
+        return queryset
+
+
+class DataSourceViewSet(CatalogViewSet):
+    queryset = DataSource.objects.all()
+    serializer_class = DataSourceSerializer
+    filter_fields = ['canonical_name', 'source_type', 'schema_version']
+
+    def perform_create(self, serializer):
+        from tracker.views import process_file
+
+        datasource = serializer.save()
+        # Same as the upload page: detect the schema straight away
+        if datasource.file:
+            process_file(datasource)
+
+
+class SchemaDefinitionViewSet(CatalogViewSet):
+    queryset = SchemaDefinition.objects.select_related('data_source')
+    serializer_class = SchemaDefinitionSerializer
+    filter_fields = ['data_source', 'data_source__canonical_name']
+    deferrable_fields = {'columns': ['column_definitions', 'column_count']}
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        fields = field_list(self.request, 'fields')
+        omit = field_list(self.request, 'omit')
+        shown = {name for name in ('column_definitions', 'path_stats') if (not fields or name in fields)} - omit
+        # Sample values and path stats live in their own table; join it only when they're in the response
+        if 'path_stats' in shown or ('column_definitions' in shown and 'sample_values' not in omit):
+            queryset = queryset.select_related('samples')
+        return queryset
+
+
+class PrimaryKeyCandidateViewSet(CatalogViewSet):
+    # The schema is only there for its data_source_id, not its (large) columns
+    queryset = PrimaryKeyCandidate.objects.select_related('schema').defer('schema__columns')
+    serializer_class = PrimaryKeyCandidateSerializer
+    filter_fields = ['schema', 'schema__data_source', 'is_confirmed']
+
+
+class SchemaChangeViewSet(CatalogViewSet):
+    queryset = SchemaChange.objects.all()
+    serializer_class = SchemaChangeSerializer
+    filter_fields = ['source', 'previous_version', 'change_type']
+    deferrable_fields = {'details': ['details']}
+
+
+class SchemaRelationshipViewSet(CatalogViewSet):
+    queryset = SchemaRelationship.objects.select_related('source_schema', 'target_schema').defer(
+        'source_schema__columns', 'target_schema__columns'
+    )
+    serializer_class = SchemaRelationshipSerializer
+    filter_fields = ['source_schema', 'target_schema', 'relationship_type']
+    deferrable_fields = {
+        'source_columns': ['source_columns'],
+        'target_columns': ['target_columns'],
+        'details': ['details'],
+    }
+
+
+@api_view(['GET'])
+def catalog_export(request, export_format='json'):
+    """
+    Streams the catalog as JSON, JSON Lines, CSV or Parquet (export.<format>).
+    Supports ?omit=column_definitions or ?omit=sample_values to shrink it,
+    ?sections=schemas,columns to pick sections and ?source=<id> to export a
+    single data source. CSV and Parquet hold one section, columns by default.
+    """
+    if export_format not in EXPORT_FORMATS:
+        return Response({"error": f"Unknown export format '{export_format}'"}, status=status.HTTP_404_NOT_FOUND)
+
+    source = request.query_params.get('source')
+    if source is not None and not source.isdigit():
+        raise ValidationError({'source': f"Invalid value '{source}'"})
+    sections = field_list(request, 'sections') or field_list(request, 'section')
+
+    try:
+        content = iter_catalog(export_format, omit=field_list(request, 'omit'), sections=sorted(sections),
+                               source=int(source) if source is not None else None)
+    except ValueError as e:
+        raise ValidationError({'sections': str(e)})
+    except ImportError:
+        return Response(
+            {"error": "Parquet export needs pyarrow, which isn't installed"},
+            status=status.HTTP_501_NOT_IMPLEMENTED
+        )
+
+    if isinstance(request._request, ASGIRequest):
+        # Served from the event loop: stream it a piece at a time there too
+        content = iterate_in_thread(content)
+
+    name = 'catalog' if source is None else f"catalog_source_{source}"
+    if len(sections) == 1 or export_format in ('csv', 'parquet'):
+        name += '_' + (next(iter(sections)) if sections else 'columns')
+    response = StreamingHttpResponse(content, content_type=EXPORT_FORMATS[export_format])
+    response['Content-Disposition'] = f'attachment; filename="{name}.{export_format}"'
+    return response
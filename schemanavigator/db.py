@@ -0,0 +1,110 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+PRIMARY = 'default'
+REPLICA_APPS = {'tracker'}  # Apps whose reads may be served by a replica
+PRIMARY_COOKIE = 'use_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Set once the current request or command has written to the catalog: its
+# later reads go to the primary too, so it sees its own writes however far
+# behind the replicas are. Each request starts unset (see PrimaryPinningMiddleware).
+_use_primary = ContextVar('use_primary', default=False)
+_wrote = ContextVar('wrote_to_primary', default=False)
+
+
+@contextmanager
+def use_primary():
+    """Read from the primary for the duration of the block"""
+    token = _use_primary.set(True)
+    try:
+        yield
+    finally:
+        _use_primary.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """
+    Sends catalog reads to a random replica in DATABASE_REPLICAS and every
+    write to the primary. Reads go to the primary instead inside a transaction
+    on it and after the request or command has written, so code never reads
+    older data than it wrote. Only the primary is migrated; replicas get the
+    schema by replication.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if (not replicas or model._meta.app_label not in REPLICA_APPS or _use_primary.get()
+                or connections[PRIMARY].in_atomic_block):
+            return PRIMARY
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label in REPLICA_APPS:
+            _use_primary.set(True)
+            _wrote.set(True)
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {PRIMARY, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY
+
+
+class PrimaryPinningMiddleware:
+    """
+    Starts each GET request reading from replicas, unless the client wrote to
+    the catalog in the last REPLICA_LAG seconds: a request that writes sets a
+    short-lived cookie, so the page it redirects to is read from the primary
+    and shows the new data. Only installed when there are replicas.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        tokens = self.start(request)
+        try:
+            return self.finish(self.get_response(request))
+        finally:
+            self.reset(tokens)
+
+    async def __acall__(self, request):
+        tokens = self.start(request)
+        try:
+            return self.finish(await self.get_response(request))
+        finally:
+            self.reset(tokens)
+
+    def start(self, request):
+        # Requests that may write read from the primary from the start, so they don't act on stale data
+        use_primary = request.method not in SAFE_METHODS or PRIMARY_COOKIE in request.COOKIES
+        return _use_primary.set(use_primary), _wrote.set(False)
+
+    def finish(self, response):
+        if _wrote.get():
+            response.set_cookie(PRIMARY_COOKIE, '1', max_age=settings.REPLICA_LAG, httponly=True, samesite='Lax')
+        return response
+
+    @staticmethod
+    def reset(tokens):
+        _use_primary.reset(tokens[0])
+        _wrote.reset(tokens[1])
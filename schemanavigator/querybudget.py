@@ -0,0 +1,121 @@
+import functools
+import logging
+from contextlib import ContextDecorator, ExitStack
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Budgets open in the current context. Concurrent async requests can share a
+# thread, and so a connection, but each keeps its own context.
+_active_budgets = ContextVar('active_query_budgets', default=())
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class query_budget(ContextDecorator):
+    """
+    Declare the most queries a view or block of code may run:
+
+        @query_budget(5)
+        def schema_list(request):
+            ...
+
+    Going over budget raises QueryBudgetExceeded when QUERY_BUDGET_RAISE is
+    set (as it is under QueryBudgetTestRunner) and logs a warning otherwise.
+    The budget should not depend on the amount of data, so an N+1 query
+    pattern shows up as soon as a test renders a few rows.
+
+    Async views are supported as long as they run their queries through
+    sync_to_async() (as the async ORM methods do): the counter is installed on
+    the connections of the thread those calls share.
+    """
+
+    def __init__(self, limit, name=None):
+        self.limit = limit
+        self.name = name
+
+    def __call__(self, func):
+        if self.name is None:
+            self.name = f"{func.__module__}.{func.__qualname__}"
+        if not iscoroutinefunction(func):
+            return super().__call__(func)
+
+        @functools.wraps(func)
+        async def inner(*args, **kwargs):
+            budget = self._recreate_cm()
+            await sync_to_async(budget.__enter__)()
+            try:
+                result = await func(*args, **kwargs)
+            except BaseException as e:
+                if not await sync_to_async(budget.__exit__)(type(e), e, e.__traceback__):
+                    raise
+            else:
+                await sync_to_async(budget.__exit__)(None, None, None)
+                return result
+        return inner
+
+    def _recreate_cm(self):
+        # A fresh counter per call, so concurrent requests don't share one
+        return type(self)(self.limit, self.name)
+
+    def __enter__(self):
+        self.queries = []
+        self.outer_budgets = _active_budgets.get()
+        _active_budgets.set(self.outer_budgets + (self,))
+
+        def count_query(execute, sql, params, many, context):
+            if self in _active_budgets.get():
+                self.queries.append(sql)
+            return execute(sql, params, many, context)
+
+        self.stack = ExitStack()
+        for connection in connections.all():
+            self.stack.enter_context(connection.execute_wrapper(count_query))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stack.close()
+        _active_budgets.set(self.outer_budgets)
+        if exc_type is not None or len(self.queries) <= self.limit:
+            return False
+
+        message = f"{self.name or 'Code block'} ran {len(self.queries)} queries, budget is {self.limit}"
+        if getattr(settings, 'QUERY_BUDGET_RAISE', False):
+            raise QueryBudgetExceeded(message + ":\n" + "\n".join(self.queries))
+        logger.warning(message)
+        return False
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+
+class QueryBudgetAdminMixin:
+    """
+    Puts the admin list and edit pages of a ModelAdmin on a query budget.
+    Admin views return lazy TemplateResponses, so they're rendered inside the
+    budget to count the queries made by the templates.
+    """
+    changelist_query_budget = 5
+    change_query_budget = 8
+
+    def changelist_view(self, request, extra_context=None):
+        with query_budget(self.changelist_query_budget, f"{type(self).__name__}.changelist_view"):
+            return self.render_now(super().changelist_view(request, extra_context))
+
+    def change_view(self, request, object_id, form_url='', extra_context=None):
+        with query_budget(self.change_query_budget, f"{type(self).__name__}.change_view"):
+            return self.render_now(super().change_view(request, object_id, form_url, extra_context))
+
+    @staticmethod
+    def render_now(response):
+        if hasattr(response, 'render') and not response.is_rendered:
+            response.render()
+        return response
+
@@ -10,10 +10,12 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+from importlib.util import find_spec
 from pathlib import Path
 import os
 from dotenv import load_dotenv
 from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 from django.conf.urls.static import static
 
 load_dotenv()
@@ -57,10 +59,12 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'schemanavigator.db.PrimaryPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'tracker.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -89,19 +93,90 @@ WSGI_APPLICATION = 'schemanavigator.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-#         'ENGINE': 'django.db.backends.postgresql',
-#         'NAME': os.getenv('DB_NAME'),
-#         'USER': os.getenv('DB_USER'),
-#         'PASSWORD': os.getenv('DB_PASSWORD'),
-#         'HOST': os.getenv('DB_HOST'),
-#         'PORT': os.getenv('DB_PORT'),
-#         'OPTIONS': {
-#             'options': '-c search_path=schemanav_schema,public'
-#         },
+# A primary and optional read replicas (DB_REPLICAS): catalog reads are routed
+# to a replica and writes to the primary, see schemanavigator/db.py.
+# Connections are kept open for DB_CONN_MAX_AGE seconds and reused. Under ASGI,
+# connections can't be reused across requests, so set DB_CONN_MAX_AGE=0 and,
+# on PostgreSQL, use psycopg 3's pool with DB_POOL=True instead.
+
+DB_ENGINE = os.getenv('DB_ENGINE', 'sqlite')  # or 'postgresql'
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', '60'))
+# Comma-separated: replica hosts for PostgreSQL, replica database files (e.g. LiteFS or Litestream copies) for SQLite
+DB_REPLICAS = [replica.strip() for replica in os.getenv('DB_REPLICAS', '').split(',') if replica.strip()]
+REPLICA_LAG = int(os.getenv('REPLICA_LAG', '5'))  # Seconds a client reads from the primary after writing
+
+# Applied on every new SQLite connection. WAL lets pages read while an ingest
+# writes; NORMAL sync is still safe in WAL mode and commits don't wait for fsync.
+SQLITE_PRAGMAS = [
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA cache_size = -20000',  # 20 MB page cache
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA mmap_size = 268435456',
+]
+
+if DB_ENGINE == 'postgresql':
+    PRIMARY_DATABASE = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.getenv('DB_NAME'),
+        'USER': os.getenv('DB_USER'),
+        'PASSWORD': os.getenv('DB_PASSWORD'),
+        'HOST': os.getenv('DB_HOST'),
+        'PORT': os.getenv('DB_PORT'),
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'options': '-c search_path=schemanav_schema,public'
+        },
+    }
+    if os.getenv('DB_POOL', 'False') == 'True':
+        # Pooled connections replace persistent ones. Django would otherwise pick
+        # psycopg2 and only fail once the first connection is opened.
+        if find_spec('psycopg') is None or find_spec('psycopg_pool') is None:
+            raise ImproperlyConfigured("DB_POOL=True needs psycopg 3 and its pool: pip install 'psycopg[pool]'")
+        PRIMARY_DATABASE['OPTIONS']['pool'] = {'min_size': 2, 'max_size': int(os.getenv('DB_POOL_SIZE', '10'))}
+        PRIMARY_DATABASE['CONN_MAX_AGE'] = 0
+    REPLICA_DATABASES = [dict(PRIMARY_DATABASE, HOST=host) for host in DB_REPLICAS]
+else:
+    PRIMARY_DATABASE = {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': ';'.join(['PRAGMA journal_mode = WAL'] + SQLITE_PRAGMAS),
+            # Take the write lock when a transaction starts, so concurrent writers wait for
+            # it (up to timeout seconds) instead of failing with "database is locked"
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+    }
+    # Replicas are opened read-only, so they keep whatever journal mode they were copied with
+    REPLICA_DATABASES = [
+        dict(PRIMARY_DATABASE, NAME=f"file:{path}?mode=ro", OPTIONS={'init_command': ';'.join(SQLITE_PRAGMAS)})
+        for path in DB_REPLICAS
+    ]
+
+DATABASES = {'default': PRIMARY_DATABASE}
+for number, replica in enumerate(REPLICA_DATABASES, 1):
+    # Tests read replicas through the test primary
+    DATABASES[f"replica_{number}"] = dict(replica, TEST={'MIRROR': 'default'})
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['schemanavigator.db.PrimaryReplicaRouter']
+
+
+# Cache
+# Tracker pages are cached until the data they show changes (see tracker/caching.py).
+# The cache must be shared by every process that writes to the catalog, including
+# management commands, so a per-process LocMemCache won't do. The file cache lists
+# its whole directory to cull once it holds MAX_ENTRIES, so keep that small; large
+# catalogs should use django.core.cache.backends.redis.RedisCache instead.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', os.path.join(BASE_DIR, 'cache')),
+        'TIMEOUT': None,
+        'OPTIONS': {'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', '300'))},
     }
 }
 
@@ -149,6 +224,28 @@ STATICFILES_DIRS = [
 # Media files (for uploaded files)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# 'zstd' stores uploads compressed (seekable zstd, needs the zstandard package)
+UPLOAD_COMPRESSION = os.getenv('UPLOAD_COMPRESSION') or None
+# New versions of a known canonical name are read with the previous version's column types as hints
+GUIDED_INGEST = os.getenv('GUIDED_INGEST', 'True') == 'True'
+# Nested JSON is flattened to dotted paths this many levels deep, keeping at most this many paths
+JSON_MAX_DEPTH = int(os.getenv('JSON_MAX_DEPTH', '10'))
+JSON_MAX_PATHS = int(os.getenv('JSON_MAX_PATHS', '2000'))
+
+# On-demand request profiling: staff add ?profile=1 to a URL, results are listed at /profiles/
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'False') == 'True'
+PROFILING_DIR = os.path.join(BASE_DIR, 'profiles')
+PROFILING_KEEP = 200  # Older profiles are deleted
+
+# Async views parse files on a bounded pool so concurrent previews can't exhaust the server
+PARSE_EXECUTOR = os.getenv('PARSE_EXECUTOR', 'thread')  # or 'process'
+PARSE_WORKERS = int(os.getenv('PARSE_WORKERS', '4'))
+PARSE_CONCURRENCY = PARSE_WORKERS * 2  # Parses running or queued on the pool; the rest wait for a slot
+PARSE_QUEUE_TIMEOUT = 30  # Seconds to wait for a slot before answering 503
+
+# Going over a query_budget() logs a warning, or fails under the test runner
+QUERY_BUDGET_RAISE = False
+TEST_RUNNER = 'schemanavigator.test_runner.QueryBudgetTestRunner'
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
@@ -0,0 +1,22 @@
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class QueryBudgetTestRunner(DiscoverRunner):
+    """
+    Test runner that turns query budget warnings into failures. Tests also get
+    a cache of their own, so nothing cached from the test database leaks into
+    the development cache or back.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        # Undone in teardown_test_environment(), so the settings are as they were after the run
+        self.settings_override = override_settings(QUERY_BUDGET_RAISE=True, CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'TIMEOUT': None}
+        })
+        self.settings_override.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.settings_override.disable()
+        super().teardown_test_environment(**kwargs)
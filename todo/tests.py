@@ -1,3 +1,81 @@
+from django.contrib.auth.models import User
 from django.test import TestCase
+from django.urls import reverse
 
-# Create your tests here.
+from .models import Board, Task, Project
+
+ROWS = 5  # Enough rows that an N+1 query pattern goes over budget
+
+
+class TodoViewQueryTests(TestCase):
+    """
+    Renders every todo view over several boards, projects and tasks. The
+    views are on query budgets, which fail the request under the test runner
+    when exceeded, so these tests catch N+1 query regressions.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('user', password='password')
+        cls.projects = [Project.objects.create(name=f"Project {n}", user=cls.user) for n in range(ROWS)]
+        cls.boards = [Board.objects.create(name=f"Board {n}", user=cls.user) for n in range(ROWS)]
+        cls.board = cls.boards[0]
+        for n in range(ROWS * 3):
+            Task.objects.create(title=f"Task {n}", status=[key for key, _ in Task.STATUS_CHOICES][n % 3],
+                                project=cls.projects[n % ROWS], board=cls.board, user=cls.user)
+        cls.task = Task.objects.first()
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_board_list(self):
+        response = self.client.get(reverse('board_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['boards']), ROWS)
+
+    def test_board_list_creates_default_board(self):
+        other = User.objects.create_user('other', password='password')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(reverse('board_list')).status_code, 200)
+        self.assertTrue(Board.objects.filter(user=other).exists())
+
+    def test_board_detail(self):
+        response = self.client.get(reverse('board_detail', args=[self.board.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['todo_tasks']), ROWS)
+
+    def test_create_board(self):
+        self.assertEqual(self.client.get(reverse('create_board')).status_code, 200)
+        response = self.client.post(reverse('create_board'), {'name': 'New board'})
+        board = Board.objects.get(name='New board')
+        self.assertRedirects(response, reverse('board_detail', args=[board.pk]))
+
+    def test_create_task(self):
+        url = reverse('create_task', args=[self.board.pk])
+        self.assertEqual(self.client.get(url).status_code, 200)
+        response = self.client.post(url, {'title': 'New task', 'status': 'todo', 'start_date': '2025-01-01',
+                                          'project': self.projects[0].pk})
+        self.assertRedirects(response, reverse('board_detail', args=[self.board.pk]))
+        self.assertTrue(Task.objects.filter(title='New task', board=self.board).exists())
+
+    def test_edit_task(self):
+        url = reverse('edit_task', args=[self.task.pk])
+        self.assertEqual(self.client.get(url).status_code, 200)
+        response = self.client.post(url, {'title': 'Renamed', 'status': 'done', 'start_date': '2025-01-01'})
+        self.assertRedirects(response, reverse('board_detail', args=[self.board.pk]))
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.title, 'Renamed')
+
+    def test_update_task_status(self):
+        response = self.client.post(reverse('update_task_status', args=[self.task.pk]), {'status': 'done'})
+        self.assertTrue(response.json()['success'])
+
+    def test_create_project(self):
+        self.assertEqual(self.client.get(reverse('create_project')).status_code, 200)
+        response = self.client.post(reverse('create_project'), {'name': 'New project'})
+        self.assertRedirects(response, reverse('board_list'))
+
+    def test_project_list(self):
+        response = self.client.get(reverse('project_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([project.task_count for project in response.context['projects']], [3] * ROWS)
@@ -3,10 +3,13 @@ from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
 from django.views.decorators.http import require_POST
 from django.urls import reverse
+from django.db.models import Count
+from schemanavigator.querybudget import query_budget
 from .models import Board, Task, Project
 from .forms import BoardForm, TaskForm, ProjectForm
 
 @login_required
+@query_budget(3)
 def board_list(request):
     boards = Board.objects.filter(user=request.user)
 
@@ -25,15 +28,18 @@ def board_list(request):
     return render(request, 'todo/board_list.html', context)
 
 @login_required
+@query_budget(6)
 def board_detail(request, board_id):
     board = get_object_or_404(Board, id=board_id, user=request.user)
     boards = Board.objects.filter(user=request.user)
     projects = Project.objects.filter(user=request.user)
 
     # Get tasks for each status
-    todo_tasks = Task.objects.filter(board=board, status='todo', user=request.user)
-    in_progress_tasks = Task.objects.filter(board=board, status='in_progress', user=request.user)
-    done_tasks = Task.objects.filter(board=board, status='done', user=request.user)
+    # Task cards show the project name
+    tasks = Task.objects.filter(board=board, user=request.user).select_related('project')
+    todo_tasks = tasks.filter(status='todo')
+    in_progress_tasks = tasks.filter(status='in_progress')
+    done_tasks = tasks.filter(status='done')
 
     # Forms
     task_form = TaskForm(user=request.user)
@@ -51,6 +57,7 @@ def board_detail(request, board_id):
     return render(request, 'todo/board_detail.html', context)
 
 @login_required
+@query_budget(1)
 def create_board(request):
     if request.method == 'POST':
         form = BoardForm(request.POST)
@@ -65,6 +72,7 @@ def create_board(request):
     return render(request, 'todo/create_board.html', {'form': form})
 
 @login_required
+@query_budget(4)
 def create_task(request, board_id):
     board = get_object_or_404(Board, id=board_id, user=request.user)
 
@@ -82,9 +90,10 @@ def create_task(request, board_id):
     return render(request, 'todo/create_task.html', {'form': form, 'board': board})
 
 @login_required
+@query_budget(3)
 def edit_task(request, task_id):
     task = get_object_or_404(Task, id=task_id, user=request.user)
-    board_id = task.board.id
+    board_id = task.board_id
 
     if request.method == 'POST':
         form = TaskForm(request.POST, instance=task, user=request.user)
@@ -98,6 +107,7 @@ def edit_task(request, task_id):
 
 @login_required
 @require_POST
+@query_budget(2)
 def update_task_status(request, task_id):
     task = get_object_or_404(Task, id=task_id, user=request.user)
 
@@ -110,6 +120,7 @@ def update_task_status(request, task_id):
     return JsonResponse({'success': False, 'error': 'Invalid status'})
 
 @login_required
+@query_budget(1)
 def create_project(request):
     if request.method == 'POST':
         form = ProjectForm(request.POST)
@@ -124,8 +135,9 @@ def create_project(request):
     return render(request, 'todo/create_project.html', {'form': form})
 
 @login_required
+@query_budget(1)
 def project_list(request):
-    projects = Project.objects.filter(user=request.user)
+    projects = Project.objects.filter(user=request.user).annotate(task_count=Count('tasks'))
 
     context = {
         'projects': projects,
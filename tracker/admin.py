@@ -1,31 +1,50 @@
 from django.contrib import admin
-from .models import DataSource, SchemaDefinition, PrimaryKeyCandidate, SchemaChange, SchemaRelationship
+from schemanavigator.querybudget import QueryBudgetAdminMixin
+from .models import (
+    Workbook, DataSource, SchemaDefinition, PrimaryKeyCandidate, SchemaChange, SchemaRelationship, ColumnProfile
+)
+
+@admin.register(Workbook)
+class WorkbookAdmin(QueryBudgetAdminMixin, admin.ModelAdmin):
+    list_display = ('original_filename', 'canonical_name', 'upload_date')
+    search_fields = ('original_filename', 'canonical_name')
 
 @admin.register(DataSource)
-class DataSourceAdmin(admin.ModelAdmin):
+class DataSourceAdmin(QueryBudgetAdminMixin, admin.ModelAdmin):
     list_display = ('original_filename', 'canonical_name', 'schema_version', 'upload_date')
     search_fields = ('original_filename', 'canonical_name')
     list_filter = ('source_type', 'upload_date')
 
 @admin.register(SchemaDefinition)
-class SchemaDefinitionAdmin(admin.ModelAdmin):
+class SchemaDefinitionAdmin(QueryBudgetAdminMixin, admin.ModelAdmin):
     list_display = ('data_source', 'detected_date', 'row_count')
+    list_select_related = ('data_source',)
     search_fields = ('data_source__original_filename', 'data_source__canonical_name')
 
 @admin.register(PrimaryKeyCandidate)
-class PrimaryKeyCandidateAdmin(admin.ModelAdmin):
+class PrimaryKeyCandidateAdmin(QueryBudgetAdminMixin, admin.ModelAdmin):
     list_display = ('column_name', 'schema', 'uniqueness_ratio', 'is_confirmed')
+    list_select_related = ('schema__data_source',)
     list_filter = ('is_confirmed',)
     search_fields = ('column_name', 'schema__data_source__original_filename')
 
 @admin.register(SchemaChange)
-class SchemaChangeAdmin(admin.ModelAdmin):
+class SchemaChangeAdmin(QueryBudgetAdminMixin, admin.ModelAdmin):
     list_display = ('source', 'change_type', 'change_date')
+    list_select_related = ('source',)
     list_filter = ('change_type', 'change_date')
     search_fields = ('source__original_filename', 'source__canonical_name')
 
 @admin.register(SchemaRelationship)
-class SchemaRelationshipAdmin(admin.ModelAdmin):
+class SchemaRelationshipAdmin(QueryBudgetAdminMixin, admin.ModelAdmin):
     list_display = ('source_schema', 'target_schema', 'relationship_type', 'similarity_score')
+    list_select_related = ('source_schema__data_source', 'target_schema__data_source')
     list_filter = ('relationship_type',)
-    search_fields = ('source_schema__data_source__original_filename', 'target_schema__data_source__original_filename')
\ No newline at end of file
+    search_fields = ('source_schema__data_source__original_filename', 'target_schema__data_source__original_filename')
+
+@admin.register(ColumnProfile)
+class ColumnProfileAdmin(QueryBudgetAdminMixin, admin.ModelAdmin):
+    list_display = ('column_name', 'schema', 'distinct_count', 'uniqueness_ratio')
+    list_select_related = ('schema__data_source',)
+    search_fields = ('column_name', 'schema__data_source__original_filename')
+    exclude = ('minhash', 'bloom_filter')
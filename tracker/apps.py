@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class TrackerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'tracker'
+
+    def ready(self):
+        from . import checks  # Registers the system checks
+        from . import signals
+
+        # A new or reset database reuses primary keys that pages may be cached under
+        post_migrate.connect(signals.clear_cache, sender=self)
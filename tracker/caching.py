@@ -0,0 +1,76 @@
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+
+from schemanavigator.db import use_primary
+
+# Cached values are kept until evicted; they're never stale because their keys
+# include the generation of every scope they were computed from. Scopes:
+#   catalog            - any data source or schema
+#   source:<pk>        - a data source and its version history
+#   schema:<pk>        - a schema with its primary keys, profiles and relationships
+#   canonical:<name>   - every version of a canonical name
+GENERATION_KEY = 'tracker:generation:{}'
+_missing = object()
+
+
+def new_generation():
+    # Unique, so a generation that was evicted can't come back as an old value
+    return uuid.uuid4().hex
+
+
+def generations(scopes):
+    """Current generation of each scope, starting any that aren't known yet"""
+    keys = [GENERATION_KEY.format(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, new_generation(), None)
+            found[key] = cache.get(key)
+    return [found[key] for key in keys]
+
+
+def bump(*scopes):
+    """
+    Move scopes to new generations. Each gets a new unique value rather than
+    an increment, which not every backend does atomically (the file cache reads
+    and rewrites the value): of two concurrent bumps one value wins, but either
+    is a generation nothing was cached under.
+    """
+    cache.set_many({GENERATION_KEY.format(scope): new_generation() for scope in scopes}, None)
+
+
+def invalidate(*scopes):
+    """
+    Move the given scopes to a new generation once the current transaction
+    commits, so nothing can be cached from data that is about to change
+    """
+    scopes = set(scopes)
+    if scopes:
+        transaction.on_commit(lambda: bump(*scopes))
+
+
+def invalidate_sources(source_ids):
+    invalidate(*(f"source:{pk}" for pk in source_ids if pk is not None))
+
+
+def invalidate_schemas(schema_ids):
+    invalidate(*(f"schema:{pk}" for pk in schema_ids if pk is not None))
+
+
+def cached(name, scopes, compute, *args):
+    """
+    The cached result of compute(*args), keyed on name, args and the current
+    generation of every scope it depends on. Values are computed from the
+    primary database, as a lagging replica could cache data from before the
+    latest invalidation under its new generation.
+    """
+    versions = '.'.join(str(generation) for generation in generations(scopes))
+    key = ':'.join(['tracker', name, *map(str, args), versions])
+    value = cache.get(key, _missing)
+    if value is _missing:
+        with use_primary():
+            value = compute(*args)
+        cache.set(key, value, None)
+    return value
@@ -0,0 +1,26 @@
+from importlib.util import find_spec
+
+from django.conf import settings
+from django.core import checks
+
+
+@checks.register()
+def check_upload_compression(app_configs, **kwargs):
+    """UPLOAD_COMPRESSION names a known compression whose package is installed"""
+    compression = settings.UPLOAD_COMPRESSION
+    if not compression:
+        return []
+    if compression != 'zstd':
+        return [checks.Error(
+            f"UPLOAD_COMPRESSION is '{compression}'",
+            hint="The only supported compression is 'zstd'; leave it unset to store uploads as they are.",
+            id='tracker.E001',
+        )]
+    # Found without importing it, so workers still start without it loaded
+    if find_spec('zstandard') is None:
+        return [checks.Error(
+            "UPLOAD_COMPRESSION is 'zstd' but the zstandard package isn't installed",
+            hint="pip install -r requirements-optional.txt, or unset UPLOAD_COMPRESSION.",
+            id='tracker.E002',
+        )]
+    return []
@@ -0,0 +1,293 @@
+import gzip
+import io
+import os
+import struct
+import tempfile
+import zipfile
+from bisect import bisect_right
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+
+from .caching import invalidate
+
+COMPRESSIONS_BY_EXTENSION = {
+    '.gz': 'gzip',
+    '.gzip': 'gzip',
+    '.zst': 'zstd',
+    '.zip': 'zip',
+}
+# File extensions the ingest pipeline knows how to read
+SOURCE_TYPES_BY_EXTENSION = {
+    '.csv': 'csv',
+    '.tsv': 'csv',
+    '.txt': 'csv',
+    '.xlsx': 'excel',
+    '.xls': 'excel',
+    '.json': 'json',
+}
+ZSTD_LEVEL = 3
+SEEKABLE_FRAME_SIZE = 1024 * 1024  # Uncompressed bytes per zstd frame; a preview decompresses one
+SIZE_SAMPLE = 4 * 1024 * 1024  # Bytes decompressed to estimate the size of a gzip or plain zstd file
+
+# Zstandard seekable format: independent frames followed by a skippable frame
+# holding the compressed and decompressed size of each, so a reader can jump
+# to any offset by decompressing a single frame. Other zstd decoders skip the
+# table and read the file as usual.
+SKIPPABLE_MAGIC = 0x184D2A5E
+SEEKABLE_MAGIC = 0x8F92EAB1
+SEEK_TABLE_FOOTER_SIZE = 9
+SEEK_TABLE_ENTRY_SIZE = 8
+
+
+def import_zstandard():
+    """
+    The optional zstandard package (pip install -r requirements-optional.txt),
+    raising ImportError with what to install if it's missing
+    """
+    try:
+        import zstandard
+    except ImportError as e:
+        raise ImportError("Reading or writing .zst files needs the zstandard package: pip install zstandard") from e
+    return zstandard
+
+
+def detect_compression(file_path):
+    """The compression of a file from its extension, or None"""
+    return COMPRESSIONS_BY_EXTENSION.get(os.path.splitext(file_path)[1].lower())
+
+
+def zip_member(archive):
+    """The data file in a zip archive: its first member that isn't a folder or macOS metadata"""
+    for info in archive.infolist():
+        if not info.is_dir() and not info.filename.startswith('__MACOSX/'):
+            return info.filename
+    raise ValueError("Zip archive has no files")
+
+
+def inner_filename(file_path):
+    """
+    Name of the data inside a possibly compressed file: orders.csv.gz -> orders.csv,
+    and for a zip archive the name of the file in it
+    """
+    compression = detect_compression(file_path)
+    if compression == 'zip':
+        try:
+            with zipfile.ZipFile(file_path) as archive:
+                return os.path.basename(zip_member(archive))
+        except (OSError, ValueError, zipfile.BadZipFile):
+            return os.path.splitext(file_path)[0]
+    elif compression:
+        return os.path.splitext(file_path)[0]
+    return file_path
+
+
+def detect_source_type(file_path):
+    """
+    Guess the source type from the file extension, or None if it isn't
+    supported. Compressed files go by the name of the data inside them.
+    """
+    _, file_extension = os.path.splitext(inner_filename(file_path))
+    return SOURCE_TYPES_BY_EXTENSION.get(file_extension.lower())
+
+
+def open_source(file_path, encoding=None):
+    """
+    Open a data file for reading, decompressing gzip, zstd and zip files as
+    they're read so nothing is unpacked to disk. Binary unless an encoding is given.
+    """
+    compression = detect_compression(file_path)
+    if compression == 'gzip':
+        f = gzip.open(file_path, 'rb')
+    elif compression == 'zstd':
+        f = open_zstd(open(file_path, 'rb'))
+    elif compression == 'zip':
+        # The member keeps the archive's file open after the archive is closed
+        with zipfile.ZipFile(file_path) as archive:
+            f = archive.open(zip_member(archive))
+    else:
+        f = open(file_path, 'rb')
+
+    return io.TextIOWrapper(f, encoding=encoding) if encoding else f
+
+
+def uncompressed_size(file_path):
+    """
+    Size of the data in a possibly compressed file. Zip archives and seekable
+    zstd files record it; for gzip and plain zstd files, which only record it
+    modulo 4 GB if at all, it's estimated from the compression ratio of the
+    first SIZE_SAMPLE bytes.
+    """
+    compressed_size = os.path.getsize(file_path)
+    compression = detect_compression(file_path)
+    if compression is None:
+        return compressed_size
+    if compression == 'zip':
+        with zipfile.ZipFile(file_path) as archive:
+            return archive.getinfo(zip_member(archive)).file_size
+
+    with open(file_path, 'rb') as raw:
+        if compression == 'zstd':
+            seek_table = read_seek_table(raw)
+            if seek_table:
+                return sum(size for _, size in seek_table)
+            raw.seek(0)
+            f = import_zstandard().ZstdDecompressor().stream_reader(raw, read_across_frames=True)
+        else:
+            f = gzip.GzipFile(fileobj=raw)
+        sample = 0
+        while sample < SIZE_SAMPLE and (data := f.read(SIZE_SAMPLE - sample)):
+            sample += len(data)
+        consumed = raw.tell()
+
+    if sample < SIZE_SAMPLE or not consumed:
+        # Read to the end
+        return sample
+    return round(sample * compressed_size / consumed)
+
+
+def seekable_stream(f):
+    """f itself if it can seek, else its contents in memory (for readers such as Excel's that need to seek)"""
+    return f if f.seekable() else io.BytesIO(f.read())
+
+
+def read_seek_table(f):
+    """[(compressed size, decompressed size)] of each frame of a seekable zstd file, or None"""
+    f.seek(0, os.SEEK_END)
+    size = f.tell()
+    if size < SEEK_TABLE_FOOTER_SIZE:
+        return None
+
+    f.seek(size - SEEK_TABLE_FOOTER_SIZE)
+    frames, descriptor, magic = struct.unpack('<IBI', f.read(SEEK_TABLE_FOOTER_SIZE))
+    if magic != SEEKABLE_MAGIC:
+        return None
+
+    entry_size = SEEK_TABLE_ENTRY_SIZE + (4 if descriptor & 0x80 else 0)
+    table_size = frames * entry_size
+    f.seek(size - SEEK_TABLE_FOOTER_SIZE - table_size)
+    table = f.read(table_size)
+    return [struct.unpack_from('<II', table, n * entry_size) for n in range(frames)]
+
+
+class SeekableZstdReader(io.RawIOBase):
+    """Random access to a zstd seekable format file, decompressing one frame at a time"""
+
+    def __init__(self, f, seek_table):
+        zstandard = import_zstandard()
+
+        self.f = f
+        self.decompressor = zstandard.ZstdDecompressor()
+        self.compressed_offsets = [0]
+        self.offsets = [0]
+        for compressed_size, size in seek_table:
+            self.compressed_offsets.append(self.compressed_offsets[-1] + compressed_size)
+            self.offsets.append(self.offsets[-1] + size)
+        self.position = 0
+        self.frame = None
+        self.frame_data = b''
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.position
+        elif whence == os.SEEK_END:
+            offset += self.offsets[-1]
+        if offset < 0:
+            raise ValueError("Negative seek position")
+        self.position = offset
+        return offset
+
+    def readinto(self, buffer):
+        frame = bisect_right(self.offsets, self.position) - 1
+        if frame >= len(self.offsets) - 1:
+            return 0
+        if frame != self.frame:
+            self.f.seek(self.compressed_offsets[frame])
+            compressed = self.f.read(self.compressed_offsets[frame + 1] - self.compressed_offsets[frame])
+            self.frame_data = self.decompressor.decompressobj().decompress(compressed)
+            self.frame = frame
+
+        start = self.position - self.offsets[frame]
+        data = self.frame_data[start:start + len(buffer)]
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+    def close(self):
+        self.f.close()
+        super().close()
+
+
+def open_zstd(f):
+    """
+    Binary reader of a zstd file: seekable if it's in the seekable format,
+    otherwise a forward-only stream. Needs the optional zstandard package.
+    """
+    zstandard = import_zstandard()
+
+    seek_table = read_seek_table(f)
+    if seek_table:
+        return io.BufferedReader(SeekableZstdReader(f, seek_table))
+    f.seek(0)
+    # Buffered for readline() and iteration, which the stream reader lacks
+    return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True, closefd=True))
+
+
+def write_seekable_zstd(source, destination, level=ZSTD_LEVEL, frame_size=None):
+    """Compress a binary stream into the zstd seekable format, in frames of SEEKABLE_FRAME_SIZE by default"""
+    zstandard = import_zstandard()
+
+    frame_size = frame_size or SEEKABLE_FRAME_SIZE
+    compressor = zstandard.ZstdCompressor(level=level)
+    entries = []
+    while True:
+        data = source.read(frame_size)
+        if not data and entries:
+            break
+        frame = compressor.compress(data)
+        destination.write(frame)
+        entries.append((len(frame), len(data)))
+        if not data:
+            break
+
+    table = b''.join(struct.pack('<II', *entry) for entry in entries)
+    footer = struct.pack('<IBI', len(entries), 0, SEEKABLE_MAGIC)
+    destination.write(struct.pack('<II', SKIPPABLE_MAGIC, len(table) + len(footer)) + table + footer)
+
+
+def store_file(name, source):
+    """
+    Save a binary stream to media storage, as a seekable zstd file (name.zst)
+    when UPLOAD_COMPRESSION is 'zstd'. Returns the stored name.
+    """
+    if settings.UPLOAD_COMPRESSION != 'zstd' or detect_compression(name):
+        return default_storage.save(name, File(source))
+
+    with tempfile.TemporaryFile() as compressed:
+        write_seekable_zstd(source, compressed)
+        compressed.seek(0)
+        return default_storage.save(name + '.zst', File(compressed))
+
+
+def compress_at_rest(datasource):
+    """Replace a data source's stored file with a compressed copy if uploads are compressed at rest"""
+    if settings.UPLOAD_COMPRESSION != 'zstd' or not datasource.file or detect_compression(datasource.file.name):
+        return
+
+    original = datasource.file.name
+    with default_storage.open(original, 'rb') as source:
+        datasource.file.name = store_file(original, source)
+    # Only the file name changes, nothing the post_save receivers care about
+    type(datasource).objects.filter(pk=datasource.pk).update(file=datasource.file.name)
+    invalidate('catalog', f"source:{datasource.pk}")
+    default_storage.delete(original)
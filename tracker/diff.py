@@ -0,0 +1,257 @@
+import math
+import os
+import pickle
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from .compression import open_source, seekable_stream, uncompressed_size
+from .flatten import Flattener, iter_json_records
+from .models import PrimaryKeyCandidate
+
+# Roughly how many bytes of source file end up in each spill partition. Rows are
+# reduced to 8-byte hashes per cell before spilling, so a partition loaded back
+# into memory is much smaller than this.
+PARTITION_TARGET_BYTES = 128 * 1024 * 1024
+MAX_PARTITIONS = 512
+
+
+def get_confirmed_key(datasource):
+    """
+    The confirmed primary key of a data source as a list of its one column, or
+    [] if none is confirmed. Each candidate is a key on its own, so several
+    confirmed columns are alternative keys, not one composite key: that is
+    ambiguous and raises ValueError.
+    """
+    columns = list(
+        PrimaryKeyCandidate.objects.filter(schema__data_source=datasource, is_confirmed=True)
+        .order_by('pk')
+        .values_list('column_name', flat=True)
+    )
+    if len(columns) > 1:
+        raise ValueError(f"Several primary keys are confirmed ({', '.join(columns)}), pass the key columns explicitly")
+    return columns
+
+
+def read_columns(datasource, delimiter=',', encoding='utf-8', sheet_name=None):
+    """
+    Read just the header of a data source. A JSON file's records can each
+    have different paths, so it's read through for all of them.
+    """
+    file_path = datasource.file.path
+    if datasource.source_type == 'csv':
+        with open_source(file_path) as f:
+            return pd.read_csv(f, delimiter=delimiter, encoding=encoding, nrows=0).columns.tolist()
+    if datasource.source_type == 'json':
+        columns = {}
+        for chunk in iter_chunks(datasource, encoding=encoding):
+            columns.update(dict.fromkeys(chunk.columns))
+        return list(columns)
+    return next(iter_chunks(datasource, encoding=encoding, sheet_name=sheet_name)).columns.tolist()
+
+
+def json_chunk(rows):
+    """Flattened JSON rows as a DataFrame of strings, with '' for nulls"""
+    df = pd.DataFrame(rows, dtype=object)
+    return df.astype(str).mask(df.isna(), '')
+
+
+def iter_chunks(datasource, delimiter=',', encoding='utf-8', sheet_name=None, chunksize=100_000):
+    """
+    Yield the rows of a data source as DataFrames of strings.
+
+    CSV files are streamed in chunks of chunksize rows, and so are JSON files,
+    flattened into the same columns as at ingest. An Excel file has no
+    streaming reader, so it's loaded whole and yielded as one chunk; by default
+    it's read from the data source's own sheet, or its first. A JSON chunk only
+    has the paths found in its own rows.
+    Everything is read as text so that the same value hashes the same in both
+    versions even if type inference differs between them. Compressed files
+    are decompressed as they're read.
+    """
+    file_path = datasource.file.path
+    if sheet_name is None:
+        sheet_name = datasource.sheet_name or 0
+    if datasource.source_type not in ('csv', 'excel', 'json'):
+        raise ValueError(f"Row diff is not supported for source type '{datasource.source_type}'")
+
+    if datasource.source_type == 'json':
+        flattener = Flattener()
+        rows = []
+        with open_source(file_path, encoding=encoding) as f:
+            for record in iter_json_records(f):
+                rows.extend(flattener.add(record))
+                if len(rows) >= chunksize:
+                    yield json_chunk(rows)
+                    rows = []
+        if rows:
+            yield json_chunk(rows)
+        return
+
+    with open_source(file_path) as f:
+        if datasource.source_type == 'csv':
+            yield from pd.read_csv(f, delimiter=delimiter, encoding=encoding, dtype=str,
+                                   keep_default_na=False, chunksize=chunksize)
+        else:
+            yield pd.read_excel(seekable_stream(f), sheet_name=sheet_name, dtype=str).fillna('')
+
+
+def hash_chunk(df, key_columns, compare_columns):
+    """Reduce a chunk to (key labels, key hashes, per-column value hashes)"""
+    missing = [column for column in key_columns + compare_columns if column not in df.columns]
+    if missing:
+        # Paths a JSON chunk's records don't have
+        df = df.reindex(columns=[*df.columns, *missing], fill_value='')
+    key_hashes = pd.util.hash_pandas_object(df[key_columns], index=False).to_numpy()
+
+    if compare_columns:
+        column_hashes = np.column_stack([
+            pd.util.hash_array(df[column].to_numpy(dtype=object)) for column in compare_columns
+        ])
+    else:
+        column_hashes = np.zeros((len(df), 0), dtype=np.uint64)
+
+    if len(key_columns) == 1:
+        keys = df[key_columns[0]].to_numpy(dtype=object)
+    else:
+        keys = df[key_columns].agg(' | '.join, axis=1).to_numpy(dtype=object)
+
+    return keys, key_hashes, column_hashes
+
+
+def spill_partitions(datasource, key_columns, compare_columns, directory, prefix, partitions, chunksize,
+                     **read_options):
+    """Stream a data source and append its hashed rows to one spill file per partition"""
+    paths = [os.path.join(directory, f"{prefix}-{index}.pkl") for index in range(partitions)]
+    files = [open(path, 'wb') for path in paths]
+    try:
+        for chunk in iter_chunks(datasource, chunksize=chunksize, **read_options):
+            keys, key_hashes, column_hashes = hash_chunk(chunk, key_columns, compare_columns)
+            assignments = key_hashes % partitions
+            for index in np.unique(assignments):
+                mask = assignments == index
+                pickle.dump((keys[mask], key_hashes[mask], column_hashes[mask]), files[index],
+                            protocol=pickle.HIGHEST_PROTOCOL)
+    finally:
+        for f in files:
+            f.close()
+    return paths
+
+
+def load_partition(path, width):
+    """Load a spilled partition, dropping duplicate keys (last row wins)"""
+    keys, key_hashes, column_hashes = [], [], []
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                part_keys, part_key_hashes, part_column_hashes = pickle.load(f)
+            except EOFError:
+                break
+            keys.append(part_keys)
+            key_hashes.append(part_key_hashes)
+            column_hashes.append(part_column_hashes)
+
+    if not keys:
+        return np.empty(0, dtype=object), np.empty(0, dtype=np.uint64), np.empty((0, width), dtype=np.uint64), 0
+
+    keys = np.concatenate(keys)
+    key_hashes = np.concatenate(key_hashes)
+    column_hashes = np.concatenate(column_hashes)
+
+    duplicated = pd.Index(key_hashes).duplicated(keep='last')
+    duplicates = int(duplicated.sum())
+    if duplicates:
+        keep = ~duplicated
+        keys, key_hashes, column_hashes = keys[keep], key_hashes[keep], column_hashes[keep]
+
+    return keys, key_hashes, column_hashes, duplicates
+
+
+def diff_datasources(old, new, key_columns=None, partitions=None, sample_size=10, chunksize=100_000,
+                     **read_options):
+    """
+    Compare the rows of two versions of a data source, matched by primary key.
+
+    Both files are streamed and each row is reduced to a hash of its key plus a
+    hash per column. Rows are hash-partitioned by key into spill files on disk,
+    then each partition pair is compared on its own, so memory use depends on
+    the partition size rather than the file size.
+
+    Rows are matched on key_columns, by default the confirmed primary key of
+    the old version or else the new one. Unless a sheet_name is given, each
+    version is read from its own sheet. Returns counts of inserted, deleted,
+    changed and unchanged rows, the number of changed values per column and a
+    few sample keys of each kind.
+    """
+    if key_columns is None:
+        key_columns = get_confirmed_key(old) or get_confirmed_key(new)
+    if not key_columns:
+        raise ValueError("No confirmed primary key for either version")
+
+    old_columns = read_columns(old, **read_options)
+    new_columns = read_columns(new, **read_options)
+
+    missing = [column for column in key_columns if column not in old_columns or column not in new_columns]
+    if missing:
+        raise ValueError(f"Key columns missing from one of the versions: {', '.join(missing)}")
+
+    # Only columns present in both versions can be compared value by value
+    compare_columns = [column for column in new_columns if column in old_columns and column not in key_columns]
+
+    if partitions is None:
+        # Of the data, not of the files, which may be compressed
+        total_size = uncompressed_size(old.file.path) + uncompressed_size(new.file.path)
+        partitions = min(MAX_PARTITIONS, max(1, math.ceil(total_size / PARTITION_TARGET_BYTES)))
+
+    result = {
+        'key_columns': key_columns,
+        'compared_columns': compare_columns,
+        'inserted': 0,
+        'deleted': 0,
+        'changed': 0,
+        'unchanged': 0,
+        'column_changes': dict.fromkeys(compare_columns, 0),
+        'duplicate_keys': {'old': 0, 'new': 0},
+        'samples': {'inserted': [], 'deleted': [], 'changed': []},
+        'partitions': partitions,
+    }
+    column_changes = np.zeros(len(compare_columns), dtype=np.int64)
+
+    with tempfile.TemporaryDirectory(prefix='schemanavigator-diff-') as directory:
+        old_paths = spill_partitions(old, key_columns, compare_columns, directory, 'old', partitions, chunksize,
+                                     **read_options)
+        new_paths = spill_partitions(new, key_columns, compare_columns, directory, 'new', partitions, chunksize,
+                                     **read_options)
+
+        for old_path, new_path in zip(old_paths, new_paths):
+            old_keys, old_key_hashes, old_column_hashes, old_duplicates = load_partition(old_path, len(compare_columns))
+            new_keys, new_key_hashes, new_column_hashes, new_duplicates = load_partition(new_path, len(compare_columns))
+            result['duplicate_keys']['old'] += old_duplicates
+            result['duplicate_keys']['new'] += new_duplicates
+
+            # Position of each new row's key among the old rows (-1 if it's new)
+            positions = pd.Index(old_key_hashes).get_indexer(new_key_hashes)
+            inserted = positions == -1
+            deleted = ~np.isin(old_key_hashes, new_key_hashes)
+
+            matched = ~inserted
+            differences = old_column_hashes[positions[matched]] != new_column_hashes[matched]
+            changed = differences.any(axis=1)
+            column_changes += differences.sum(axis=0)
+
+            result['inserted'] += int(inserted.sum())
+            result['deleted'] += int(deleted.sum())
+            result['changed'] += int(changed.sum())
+            result['unchanged'] += int((~changed).sum())
+
+            samples = result['samples']
+            for kind, keys in (('inserted', new_keys[inserted]),
+                               ('deleted', old_keys[deleted]),
+                               ('changed', new_keys[matched][changed])):
+                room = sample_size - len(samples[kind])
+                if room > 0:
+                    samples[kind].extend(str(key) for key in keys[:room])
+
+    result['column_changes'] = dict(zip(compare_columns, column_changes.tolist()))
+    return result
@@ -0,0 +1,125 @@
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import django
+from django.conf import settings
+
+from . import metrics
+
+
+class ParserBusy(Exception):
+    """Raised when no parse slot frees up within PARSE_QUEUE_TIMEOUT"""
+
+
+_executor = None
+_executor_lock = threading.Lock()
+# (limit, semaphore) shared by every event loop in the process: under WSGI each
+# async view runs on a loop of its own, so a per-loop limit would never apply
+_slots = None
+_slots_lock = threading.Lock()
+
+
+def parse_workers():
+    return getattr(settings, 'PARSE_WORKERS', None) or min(4, os.cpu_count() or 1)
+
+
+def init_worker():
+    """Set up a parse worker process, without the metrics its parent had recorded when it forked"""
+    django.setup()
+    metrics.reset_metrics()
+
+
+def get_executor():
+    """
+    The pool that parsing runs on, created on first use. Threads suit pandas,
+    which releases the GIL while parsing; PARSE_EXECUTOR = 'process' sidesteps
+    the GIL entirely at the cost of pickling results back. Functions sent to a
+    process pool must be importable and must not touch the database.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            if getattr(settings, 'PARSE_EXECUTOR', 'thread') == 'process':
+                _executor = ProcessPoolExecutor(max_workers=parse_workers(), initializer=init_worker)
+            else:
+                _executor = ThreadPoolExecutor(max_workers=parse_workers(), thread_name_prefix='parse')
+        return _executor
+
+
+def shutdown_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+def parse_slots():
+    """The process-wide semaphore of PARSE_CONCURRENCY parse slots"""
+    global _slots
+    limit = getattr(settings, 'PARSE_CONCURRENCY', None) or parse_workers()
+    with _slots_lock:
+        if _slots is None or _slots[0] != limit:
+            _slots = (limit, threading.BoundedSemaphore(limit))
+        return _slots[1]
+
+
+async def acquire_slot():
+    """Take a parse slot, waiting up to PARSE_QUEUE_TIMEOUT seconds; returns the semaphore to release"""
+    semaphore = parse_slots()
+    if semaphore.acquire(blocking=False):
+        return semaphore
+
+    # Wait on a thread, so the event loop keeps serving other requests
+    timeout = getattr(settings, 'PARSE_QUEUE_TIMEOUT', 30)
+    waiting = asyncio.get_running_loop().run_in_executor(None, functools.partial(semaphore.acquire, timeout=timeout))
+    try:
+        acquired = await asyncio.shield(waiting)
+    except asyncio.CancelledError:
+        # Give the slot back if the wait gets it after all
+        waiting.add_done_callback(
+            lambda future: not future.cancelled() and future.result() and semaphore.release()
+        )
+        raise
+    if not acquired:
+        raise ParserBusy("Too many files are being parsed, try again shortly")
+    return semaphore
+
+
+def call_in_worker(func, *args, **kwargs):
+    """
+    Run func in a worker process, returning (result, exception, metrics) so
+    that what the worker recorded reaches the parent's /metrics either way
+    """
+    try:
+        return func(*args, **kwargs), None, metrics.collect()
+    except Exception as e:
+        return None, e, metrics.collect()
+
+
+async def run_parse(func, *args, **kwargs):
+    """
+    Run a blocking parse on the executor without holding up the event loop.
+    At most PARSE_CONCURRENCY parses run at once; the rest wait up to
+    PARSE_QUEUE_TIMEOUT seconds for a slot before ParserBusy is raised. The
+    limit holds across the whole process, whichever event loop a view runs on.
+    """
+    semaphore = await acquire_slot()
+    try:
+        loop = asyncio.get_running_loop()
+        executor = get_executor()
+        if not isinstance(executor, ProcessPoolExecutor):
+            return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+        result, error, collected = await loop.run_in_executor(
+            executor, functools.partial(call_in_worker, func, *args, **kwargs)
+        )
+    finally:
+        semaphore.release()
+
+    metrics.merge(collected)
+    if error is not None:
+        raise error
+    return result
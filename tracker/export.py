@@ -0,0 +1,304 @@
+import csv
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+from .models import DataSource, SchemaDefinition, PrimaryKeyCandidate, SchemaChange, SchemaRelationship
+
+EXPORT_CHUNK_SIZE = 2000  # Rows fetched per database round trip
+EXPORT_BUFFER_SIZE = 64 * 1024  # Characters collected before a piece is sent to the client
+EXPORT_FORMATS = {
+    'json': 'application/json',
+    'jsonl': 'application/x-ndjson',
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+# (section, model, fields, lookups matching the rows of one data source)
+CATALOG_SECTIONS = [
+    ('data_sources', DataSource, ['id', 'original_filename', 'upload_date', 'file', 'canonical_name',
+                                  'schema_version', 'source_type'], ['pk']),
+    ('schemas', SchemaDefinition, ['id', 'data_source_id', 'detected_date', 'row_count', 'column_definitions'],
+     ['data_source_id']),
+    ('columns', SchemaDefinition, ['schema_id', 'column_name', 'type', 'sample_values'], ['data_source_id']),
+    ('primary_keys', PrimaryKeyCandidate, ['id', 'schema_id', 'column_name', 'uniqueness_ratio', 'is_confirmed'],
+     ['schema__data_source_id']),
+    ('changes', SchemaChange, ['id', 'source_id', 'previous_version_id', 'change_date', 'change_type', 'details'],
+     ['source_id']),
+    ('relationships', SchemaRelationship, ['id', 'source_schema_id', 'target_schema_id', 'relationship_type',
+                                           'source_columns', 'target_columns', 'similarity_score', 'details'],
+     ['source_schema__data_source_id', 'target_schema__data_source_id']),
+]
+SECTION_NAMES = [section for section, _, _, _ in CATALOG_SECTIONS]
+
+
+def select_sections(sections=None):
+    """The CATALOG_SECTIONS entries to export, in catalog order"""
+    if not sections:
+        # The columns section repeats what's in the schemas' column definitions
+        return [entry for entry in CATALOG_SECTIONS if entry[0] != 'columns']
+    unknown = set(sections) - set(SECTION_NAMES)
+    if unknown:
+        raise ValueError(f"Unknown sections: {', '.join(sorted(unknown))}")
+    return [entry for entry in CATALOG_SECTIONS if entry[0] in sections]
+
+
+def section_queryset(model, lookups, source=None):
+    queryset = model.objects.order_by('pk')
+    if source is not None:
+        condition = Q()
+        for lookup in lookups:
+            condition |= Q(**{lookup: source})
+        queryset = queryset.filter(condition)
+    return queryset
+
+
+def iter_column_rows(source=None, omit=()):
+    """One row per column of every schema, from the stored column definitions"""
+    schemas = section_queryset(SchemaDefinition, ['data_source_id'], source)
+    with_samples = 'sample_values' not in omit
+    values = ['id', 'columns'] + (['samples__sample_values'] if with_samples else [])
+    for schema_id, columns, *samples in schemas.values_list(*values).iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        samples = (samples[0] or []) if with_samples else []
+        for position, (column, column_type) in enumerate(columns):
+            row = {'schema_id': schema_id, 'column_name': column, 'type': column_type}
+            if with_samples:
+                row['sample_values'] = samples[position] if position < len(samples) else []
+            yield row
+
+
+def iter_section_rows(model, fields, omit=(), lookups=(), source=None, section=None):
+    """
+    Yield the rows of one catalog section as dicts, only those of one data
+    source if given.
+
+    Rows come straight from .values().iterator() so no model instances are
+    built and only one chunk of rows is in memory at a time.
+    """
+    if section == 'columns':
+        yield from iter_column_rows(source, omit)
+        return
+
+    fields = [field for field in fields if field not in omit]
+    queryset = section_queryset(model, lookups, source)
+    if 'column_definitions' in fields:
+        yield from iter_schema_rows(queryset, fields, omit)
+        return
+
+    yield from queryset.values(*fields).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def iter_schema_rows(queryset, fields, omit=()):
+    """Schema rows with column_definitions put back together from the columns and their samples"""
+    with_samples = 'sample_values' not in omit
+    values = [field for field in fields if field != 'column_definitions'] + ['columns']
+    if with_samples:
+        values.append('samples__sample_values')
+
+    for row in queryset.values(*values).iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        columns = row.pop('columns')
+        samples = row.pop('samples__sample_values', None)
+        row['column_definitions'] = SchemaDefinition.build_column_definitions(
+            columns, (samples or []) if with_samples else None
+        )
+        yield row
+
+
+def buffered(pieces):
+    """Join small pieces of output into chunks of about EXPORT_BUFFER_SIZE"""
+    buffer = []
+    size = 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= EXPORT_BUFFER_SIZE:
+            yield ''.join(buffer) if isinstance(piece, str) else b''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer) if isinstance(buffer[0], str) else b''.join(buffer)
+
+
+def iter_catalog_json(omit=(), sections=None, source=None):
+    """
+    Stream the catalog as one JSON object with a list per section.
+
+    Output is produced piece by piece so the response starts immediately and
+    memory stays flat however large the catalog is.
+    """
+    encoder = DjangoJSONEncoder()
+    selected = select_sections(sections)
+
+    def pieces():
+        for index, (section, model, fields, lookups) in enumerate(selected):
+            yield ('{' if index == 0 else '],') + json.dumps(section) + ':['
+            for position, row in enumerate(iter_section_rows(model, fields, omit, lookups, source, section)):
+                encoded = encoder.encode(row)
+                yield encoded if position == 0 else ',' + encoded
+        yield ']}'
+
+    return buffered(pieces())
+
+
+def iter_catalog_jsonl(omit=(), sections=None, source=None):
+    """Stream the catalog as JSON Lines, one record per line tagged with its section"""
+    encoder = DjangoJSONEncoder()
+    selected = select_sections(sections)
+
+    def pieces():
+        for section, model, fields, lookups in selected:
+            for row in iter_section_rows(model, fields, omit, lookups, source, section):
+                yield encoder.encode({'section': section, **row}) + '\n'
+
+    return buffered(pieces())
+
+
+class Echo:
+    """File-like object whose write() hands back what it's given, for csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def iter_catalog_csv(section, omit=(), source=None):
+    """Stream one section as CSV; JSON fields are written as JSON text"""
+    _, model, fields, lookups = select_sections([section])[0]
+    fields = [field for field in fields if field not in omit]
+    encoder = DjangoJSONEncoder()
+    writer = csv.writer(Echo())
+
+    def pieces():
+        yield writer.writerow(fields)
+        for row in iter_section_rows(model, fields, omit, lookups, source, section):
+            yield writer.writerow([
+                encoder.encode(row[field]) if isinstance(row[field], (dict, list)) else
+                encoder.default(row[field]) if hasattr(row[field], 'isoformat') else row[field]
+                for field in fields
+            ])
+
+    return buffered(pieces())
+
+
+def arrow_schema(section, model, fields):
+    """pyarrow schema of a section; JSON fields are stored as JSON text"""
+    import pyarrow as pa
+
+    if section == 'columns':
+        return pa.schema([(field, pa.int64() if field == 'schema_id' else pa.string()) for field in fields])
+
+    types = {
+        'AutoField': pa.int64(), 'BigAutoField': pa.int64(), 'IntegerField': pa.int64(),
+        'BigIntegerField': pa.int64(), 'ForeignKey': pa.int64(), 'OneToOneField': pa.int64(),
+        'FloatField': pa.float64(), 'BooleanField': pa.bool_(), 'DateTimeField': pa.timestamp('us', tz='UTC'),
+    }
+    columns = []
+    for field in fields:
+        if field == 'column_definitions':
+            # Not a model field any more, put together from the columns and their samples
+            columns.append((field, pa.string()))
+            continue
+        internal_type = model._meta.get_field(field.removesuffix('_id')).get_internal_type()
+        columns.append((field, types.get(internal_type, pa.string())))
+    return pa.schema(columns)
+
+
+class ParquetSink:
+    """Write-only file for ParquetWriter whose contents are taken away as they're written"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_catalog_parquet(section, omit=(), source=None):
+    """
+    Stream one section as Parquet, a row group per EXPORT_CHUNK_SIZE rows.
+    Needs pyarrow, which is an optional dependency; raises ImportError without it.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    _, model, fields, lookups = select_sections([section])[0]
+    fields = [field for field in fields if field not in omit]
+    schema = arrow_schema(section, model, fields)
+    encoder = DjangoJSONEncoder()
+
+    def pieces():
+        sink = ParquetSink()
+        with pq.ParquetWriter(pa.PythonFile(sink, mode='w'), schema) as writer:
+            rows = []
+            for row in iter_section_rows(model, fields, omit, lookups, source, section):
+                rows.append({
+                    field: encoder.encode(value) if isinstance(value, (dict, list)) else
+                    str(value) if schema.field(field).type == pa.string() and value is not None else value
+                    for field, value in row.items()
+                })
+                if len(rows) == EXPORT_CHUNK_SIZE:
+                    writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+                    rows = []
+                    yield sink.drain()
+            if rows:
+                writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+        yield sink.drain()
+
+    return pieces()
+
+
+async def iterate_in_thread(iterator):
+    """
+    An async iterator over a sync one, fetching each piece with sync_to_async.
+    Under ASGI a StreamingHttpResponse would otherwise read a sync iterator
+    with sync_to_async(list), holding the whole export in memory before
+    sending any of it.
+    """
+    sentinel = object()
+    next_piece = sync_to_async(next)
+    try:
+        while (piece := await next_piece(iterator, sentinel)) is not sentinel:
+            yield piece
+    finally:
+        # Ends the database cursor too if the client goes away mid-export
+        if hasattr(iterator, 'close'):
+            await sync_to_async(iterator.close)()
+
+
+def iter_catalog(export_format, omit=(), sections=None, source=None):
+    """
+    The catalog in the given format, as an iterator for a StreamingHttpResponse.
+    CSV and Parquet hold a single section (columns unless another is given).
+    """
+    if export_format == 'json':
+        return iter_catalog_json(omit, sections, source)
+    elif export_format == 'jsonl':
+        return iter_catalog_jsonl(omit, sections, source)
+
+    section = sections[0] if sections else 'columns'
+    if sections and len(sections) > 1:
+        raise ValueError(f"{export_format} exports hold one section at a time")
+    if export_format == 'csv':
+        return iter_catalog_csv(section, omit, source)
+    elif export_format == 'parquet':
+        return iter_catalog_parquet(section, omit, source)
+    raise ValueError(f"Unknown export format: {export_format}")
@@ -0,0 +1,257 @@
+import json
+
+from django.conf import settings
+
+READ_SIZE = 64 * 1024
+WHITESPACE = ' \t\r\n'
+
+
+JSON_TYPES = {
+    type(None): 'null',
+    bool: 'boolean',
+    int: 'integer',
+    float: 'number',
+    str: 'string',
+    dict: 'object',
+    list: 'array',
+}
+
+
+def json_type(value):
+    """JSON type name of a decoded value"""
+    return JSON_TYPES.get(type(value), 'string')
+
+
+class JSONStream:
+    """Decodes JSON values one at a time from a text stream, holding only the value being read"""
+
+    def __init__(self, f, read_size=READ_SIZE):
+        self.f = f
+        self.read_size = read_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.position = 0
+        self.eof = False
+
+    def more(self):
+        """Read more of the stream into the buffer; False at the end"""
+        if self.eof:
+            return False
+        # Doubling the read keeps re-decoding a large value linear overall
+        data = self.f.read(max(self.read_size, len(self.buffer) - self.position))
+        self.buffer = self.buffer[self.position:] + data
+        self.position = 0
+        self.eof = not data
+        return not self.eof
+
+    def peek(self):
+        """The next character that isn't whitespace, or '' at the end"""
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in WHITESPACE:
+                self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self.more():
+                return ''
+
+    def skip(self):
+        self.position += 1
+
+    def value(self):
+        """Decode the next value"""
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError:
+                if self.more():
+                    continue
+                raise
+            # A number ending the buffer may go on in the next read
+            if end == len(self.buffer) and self.more():
+                continue
+            self.position = end
+            return value
+
+
+def iter_json_records(f):
+    """
+    Records of a JSON document, read incrementally: the elements of a top-level
+    array, the rows of an object of equal-length column lists, any other object
+    as one record, and each value of a JSON Lines file
+    """
+    stream = JSONStream(f)
+    while (char := stream.peek()):
+        if char == '[':
+            stream.skip()
+            while stream.peek() not in (']', ''):
+                yield stream.value()
+                if stream.peek() == ',':
+                    stream.skip()
+            stream.skip()
+            continue
+
+        value = stream.value()
+        columns = list(value.values()) if isinstance(value, dict) else []
+        if columns and all(isinstance(column, list) for column in columns) and len(set(map(len, columns))) == 1:
+            # Columns of values, {"id": [1, 2], "name": ["a", "b"]}
+            yield from (dict(zip(value, row)) for row in zip(*columns))
+        else:
+            yield value
+
+
+class Flattener:
+    """
+    Flattens nested JSON records into rows with a column per dotted path
+    (customer.address.city), collecting per-path stats in the same pass.
+
+    Objects nested deeper than max_depth path segments are kept as JSON text.
+    Arrays of scalars are kept as JSON text. The first array of objects found
+    is exploded into a row per element, with its parent's fields repeated;
+    other arrays of objects are kept as JSON text. Once there are max_paths
+    paths, values at new paths are dropped, so memory for the stats grows with
+    the number of distinct paths and not with the size of the document.
+    """
+
+    def __init__(self, max_depth=None, max_paths=None):
+        self.max_depth = max_depth or settings.JSON_MAX_DEPTH
+        self.max_paths = max_paths or settings.JSON_MAX_PATHS
+        self.paths = {}  # path -> {'types': {json type: count}, 'array': {...}}
+        self.child_paths = {}  # (path, key) -> dotted path of admitted paths, so each is only built once
+        self.exploded_path = None
+        self.records = 0
+        self.rows = 0
+        self.dropped_values = 0
+
+    def add(self, record):
+        """Flatten one record into its rows"""
+        if not isinstance(record, dict):
+            record = {'value': record}
+        self.records += 1
+
+        row = {}
+        arrays = []
+        self.walk(record, '', 0, row, arrays)
+
+        exploded = None
+        for path, depth, items in arrays:
+            if self.exploded_path is None:
+                self.exploded_path = path
+            if path == self.exploded_path:
+                exploded = (depth, items)
+            else:
+                self.set(row, path, json.dumps(items, default=str), count=False)
+
+        if exploded is None:
+            rows = [row]
+        else:
+            depth, items = exploded
+            rows = []
+            for item in items:
+                item_row = dict(row)
+                nested = []
+                self.walk(item, self.exploded_path, depth, item_row, nested)
+                # Only one level of arrays is exploded
+                for path, _, nested_items in nested:
+                    self.set(item_row, path, json.dumps(nested_items, default=str), count=False)
+                rows.append(item_row)
+
+        self.rows += len(rows)
+        return rows
+
+    def walk(self, value, path, depth, row, arrays):
+        """
+        Put the scalars under a path into row and collect the arrays of objects
+        under it. Returns whether any path under it was admitted.
+        """
+        if isinstance(value, dict):
+            if depth >= self.max_depth:
+                return self.set(row, path, json.dumps(value, default=str))
+            admitted = False
+            child_paths = self.child_paths
+            for key, child in value.items():
+                child_path = child_paths.get((path, key))
+                cached = child_path is not None
+                if not cached:
+                    child_path = f"{path}.{key}" if path else str(key)
+                if isinstance(child, (dict, list)):
+                    child_admitted = self.walk(child, child_path, depth + 1, row, arrays)
+                else:
+                    child_admitted = self.set(row, child_path, child)
+                # Only paths that were admitted (or lead to one) are cached, so the
+                # cache is bounded by max_paths however many keys get dropped
+                if child_admitted and not cached:
+                    child_paths[(path, key)] = child_path
+                admitted = admitted or child_admitted
+            return admitted
+        elif isinstance(value, list):
+            stats = self.stats(path)
+            if stats is None:
+                return False
+            self.count_array(stats, len(value))
+            if value and depth < self.max_depth and all(isinstance(item, dict) for item in value):
+                arrays.append((path, depth, value))
+            else:
+                row[path] = json.dumps(value, default=str)
+            return True
+        else:
+            return self.set(row, path, value)
+
+    def stats(self, path):
+        """The stats of a path, or None once there are too many paths to take a new one"""
+        stats = self.paths.get(path)
+        if stats is None:
+            if len(self.paths) >= self.max_paths:
+                self.dropped_values += 1
+                return None
+            stats = self.paths[path] = {'types': {}}
+        return stats
+
+    def set(self, row, path, value, count=True):
+        """Put a value into row; False if its path was dropped"""
+        stats = self.paths.get(path) or self.stats(path)
+        if stats is None:
+            return False
+        if count:
+            types = stats['types']
+            name = JSON_TYPES.get(type(value), 'string')
+            types[name] = types.get(name, 0) + 1
+        row[path] = value
+        return True
+
+    def count_array(self, stats, length):
+        stats['types']['array'] = stats['types'].get('array', 0) + 1
+        array = stats.get('array')
+        if array is None:
+            stats['array'] = {'count': 1, 'min_length': length, 'max_length': length, 'total_length': length}
+        else:
+            array['count'] += 1
+            array['min_length'] = min(array['min_length'], length)
+            array['max_length'] = max(array['max_length'], length)
+            array['total_length'] += length
+
+    def summary(self):
+        """
+        Per-path stats: how often each JSON type was seen, nulls, and for arrays
+        how many were seen and their lengths
+        """
+        paths = {}
+        for path, stats in self.paths.items():
+            types = stats['types']
+            summary = {'types': types, 'present': sum(types.values()), 'nulls': types.get('null', 0)}
+            array = stats.get('array')
+            if array:
+                summary['array'] = {
+                    'count': array['count'],
+                    'min_length': array['min_length'],
+                    'max_length': array['max_length'],
+                    'mean_length': array['total_length'] / array['count'],
+                }
+            paths[path] = summary
+
+        return {
+            'records': self.records,
+            'rows': self.rows,
+            'exploded_path': self.exploded_path,
+            'dropped_values': self.dropped_values,
+            'paths': paths,
+        }
@@ -14,4 +14,14 @@ class DataSourceUploadForm(forms.ModelForm):
         fields = ['file', 'canonical_name', 'source_type']
         widgets = {
             'source_type': forms.Select(attrs={'class': 'form-select'})
-        }
\ No newline at end of file
+        }
+
+class ChunkedUploadForm(forms.Form):
+    """Starts a resumable upload; the file itself follows in chunks"""
+    filename = forms.CharField(max_length=255)
+    size = forms.IntegerField(min_value=0)
+    canonical_name = forms.CharField(max_length=255)
+    source_type = forms.ChoiceField(choices=DataSource._meta.get_field('source_type').choices, initial='csv')
+    delimiter = forms.CharField(max_length=5, required=False, strip=False)
+    encoding = forms.CharField(max_length=50, required=False)
+    sheet_name = forms.CharField(max_length=255, required=False)
@@ -0,0 +1,260 @@
+import math
+from bisect import bisect_left
+from collections import defaultdict
+from itertools import islice
+
+import numpy as np
+import pandas as pd
+
+from .caching import invalidate_schemas
+from .models import ColumnProfile, SchemaRelationship
+
+SKETCH_SIZE = 128
+BLOOM_FALSE_POSITIVE_RATE = 0.01
+BLOOM_MAX_BYTES = 1024 * 1024  # Past ~870k distinct values the false positive rate starts to climb
+
+# A column counts as referenceable (a key) when nearly all its values are distinct
+UNIQUE_RATIO = 0.99
+# Share of the dependent column's values that must appear in the referenced column
+MIN_CONTAINMENT = 0.95
+# Low-cardinality columns (flags, small counts) fit inside almost any integer key
+MIN_DISTINCT_VALUES = 10
+# Catalog profiles held in memory at once when comparing several schemas
+PROFILE_BATCH_SIZE = 1000
+
+
+def mix(values):
+    """splitmix64 finalizer, a bijective mixer used to derive further hashes from a 64-bit hash"""
+    values = values ^ (values >> np.uint64(30))
+    values = values * np.uint64(0xbf58476d1ce4e5b9)
+    values = values ^ (values >> np.uint64(27))
+    values = values * np.uint64(0x94d049bb133111eb)
+    return values ^ (values >> np.uint64(31))
+
+
+def distinct_value_hashes(series):
+    """
+    Hash the distinct non-null values of a column, or return None if the column
+    can't take part in a foreign key (floats with fractions, booleans, dates).
+    """
+    values = series.dropna()
+
+    if pd.api.types.is_bool_dtype(values) or pd.api.types.is_datetime64_any_dtype(values):
+        return None
+    if pd.api.types.is_float_dtype(values):
+        # Integer columns with nulls are read as floats; compare them as integers
+        if not (values % 1 == 0).all():
+            return None
+        values = values.astype('int64')
+
+    values = values.astype(str).str.strip().unique()
+    return pd.util.hash_array(np.asarray(values, dtype=object))
+
+
+def minhash_sketch(hashes):
+    """
+    Bottom-k MinHash signature: the value hashes whose mixed hash is smallest.
+
+    Because the mixer is a fixed permutation, this is a uniform random sample
+    of the column's distinct values that is consistent across columns, so it
+    can be probed against another column's Bloom filter to estimate containment.
+    """
+    if len(hashes) > SKETCH_SIZE:
+        hashes = hashes[np.argpartition(mix(hashes), SKETCH_SIZE)[:SKETCH_SIZE]]
+    return np.sort(hashes)
+
+
+def bloom_positions(hashes, size_bits, hash_count):
+    """Bit positions for each hash using double hashing, shape (len(hashes), hash_count)"""
+    step = mix(hashes) | np.uint64(1)
+    rounds = np.arange(hash_count, dtype=np.uint64)
+    return (hashes[:, None] + rounds[None, :] * step[:, None]) % np.uint64(size_bits)
+
+
+def build_bloom_filter(hashes):
+    """Returns (packed bits, hash count) for a Bloom filter holding the given hashes"""
+    count = max(len(hashes), 1)
+    size_bits = math.ceil(-count * math.log(BLOOM_FALSE_POSITIVE_RATE) / math.log(2) ** 2)
+    size_bits = min(max(64, math.ceil(size_bits / 8) * 8), BLOOM_MAX_BYTES * 8)
+    hash_count = max(1, round(size_bits / count * math.log(2)))
+
+    bits = np.zeros(size_bits, dtype=bool)
+    bits[bloom_positions(hashes, size_bits, hash_count).ravel()] = True
+    return np.packbits(bits).tobytes(), hash_count
+
+
+def bloom_contains(bloom_filter, hash_count, hashes):
+    """Boolean array telling which hashes are (probably) in the Bloom filter"""
+    packed = np.frombuffer(bloom_filter, dtype=np.uint8)
+    positions = bloom_positions(hashes, len(packed) * 8, hash_count)
+    shifts = np.uint8(7) - (positions & np.uint64(7)).astype(np.uint8)
+    bits = (packed[positions >> np.uint64(3)] >> shifts) & 1
+    return bits.all(axis=1)
+
+
+def profile_columns(df):
+    """
+    Summarize every usable column of a DataFrame as ColumnProfile field values.
+
+    Also returns the distinct value hashes per column so that candidate
+    dependencies can be checked against all values while they're in memory.
+    """
+    profiles = []
+    value_hashes = {}
+
+    for column in df.columns:
+        hashes = distinct_value_hashes(df[column])
+        if hashes is None or len(hashes) < MIN_DISTINCT_VALUES:
+            continue
+
+        non_null = int(df[column].notna().sum())
+        uniqueness = len(hashes) / non_null if non_null else 0.0
+
+        bloom_filter, bloom_hash_count = None, 0
+        if uniqueness >= UNIQUE_RATIO:
+            bloom_filter, bloom_hash_count = build_bloom_filter(hashes)
+
+        profiles.append({
+            'column_name': str(column),
+            'distinct_count': len(hashes),
+            'uniqueness_ratio': uniqueness,
+            'minhash': minhash_sketch(hashes).tobytes(),
+            'bloom_filter': bloom_filter,
+            'bloom_hash_count': bloom_hash_count,
+        })
+        value_hashes[str(column)] = hashes
+
+    return profiles, value_hashes
+
+
+def containment(dependent, referenced, value_hashes=None):
+    """
+    Share of the dependent column's distinct values found in the referenced
+    column's Bloom filter. Uses every value when they're available, otherwise
+    the dependent column's MinHash sample.
+    """
+    if referenced.bloom_filter is None:
+        return None
+
+    hashes = value_hashes
+    if hashes is None:
+        hashes = np.frombuffer(bytes(dependent.minhash), dtype=np.uint64)
+    if not len(hashes):
+        return 0.0
+    return float(bloom_contains(bytes(referenced.bloom_filter), referenced.bloom_hash_count, hashes).mean())
+
+
+def find_inclusion_dependencies(schema, value_hashes=None, own_profiles=None, other_profiles=None, save=True):
+    """
+    Find columns whose values are (almost) all contained in a key column of
+    another schema, in both directions, and record them as relationships.
+
+    Only the stored column profiles are used, no files are read. When
+    value_hashes are given (at ingest time) the schema's own columns are
+    checked with all their values instead of their MinHash sample. With
+    save=False the relationships are returned for the caller to save.
+    """
+    value_hashes = value_hashes or {}
+    if own_profiles is None:
+        own_profiles = ColumnProfile.objects.filter(schema=schema)
+    if other_profiles is None:
+        other_profiles = ColumnProfile.objects.exclude(schema=schema)
+    own_profiles = list(own_profiles)
+    other_profiles = list(other_profiles)
+    if not own_profiles or not other_profiles:
+        return []
+
+    other_counts = np.array([profile.distinct_count for profile in other_profiles])
+    other_is_key = np.array([profile.bloom_filter is not None for profile in other_profiles])
+
+    # A column can only be contained in one with at least as many distinct values
+    candidates = []
+    for own in own_profiles:
+        for index in np.nonzero(other_is_key & (own.distinct_count * MIN_CONTAINMENT <= other_counts))[0]:
+            candidates.append((own, other_profiles[index]))
+        if own.bloom_filter is not None:
+            for index in np.nonzero(other_counts * MIN_CONTAINMENT <= own.distinct_count)[0]:
+                candidates.append((other_profiles[index], own))
+
+    relationships = []
+    recorded = set()
+    for dependent, referenced in candidates:
+        pair = frozenset([dependent.pk, referenced.pk])
+        if pair in recorded:
+            continue
+
+        # Check the sample first so most non-matches cost a single small probe
+        score = containment(dependent, referenced)
+        if score < MIN_CONTAINMENT:
+            continue
+        verified = dependent.column_name in value_hashes and dependent.schema_id == schema.pk
+        if verified:
+            score = containment(dependent, referenced, value_hashes[dependent.column_name])
+            if score < MIN_CONTAINMENT:
+                continue
+
+        # Both columns hold the same set of key values
+        reverse_score = containment(referenced, dependent)
+        derived = reverse_score is not None and reverse_score >= MIN_CONTAINMENT
+        recorded.add(pair)
+
+        relationships.append(SchemaRelationship(
+            source_schema_id=dependent.schema_id,
+            target_schema_id=referenced.schema_id,
+            relationship_type='derived' if derived else 'related',
+            source_columns=[dependent.column_name],
+            target_columns=[referenced.column_name],
+            similarity_score=score,
+            details={
+                'method': 'inclusion',
+                'containment': score,
+                'reverse_containment': reverse_score,
+                # Checked with every value rather than the MinHash sample
+                'verified': verified,
+            }
+        ))
+
+    if save:
+        save_relationships(relationships)
+    return relationships
+
+
+def find_inclusion_dependencies_bulk(schemas, batch_size=None):
+    """
+    find_inclusion_dependencies for several schemas, each against the schemas
+    created before it, returning the relationships for the caller to save.
+
+    The earlier profiles, Bloom filters and all, are streamed in batches, so
+    only the given schemas' own profiles and one batch are in memory at once,
+    however big the catalog is.
+    """
+    batch_size = batch_size or PROFILE_BATCH_SIZE
+    schemas = sorted(schemas, key=lambda schema: schema.pk)
+    if not schemas:
+        return []
+
+    own_profiles = defaultdict(list)
+    for profile in ColumnProfile.objects.filter(schema__in=schemas).order_by('pk'):
+        own_profiles[profile.schema_id].append(profile)
+    schemas = [schema for schema in schemas if own_profiles[schema.pk]]
+    if not schemas:
+        return []
+
+    relationships = []
+    profiles = ColumnProfile.objects.filter(schema_id__lt=schemas[-1].pk).order_by('schema_id', 'pk')
+    profiles = profiles.iterator(chunk_size=batch_size)
+    while batch := list(islice(profiles, batch_size)):
+        batch_schema_ids = [profile.schema_id for profile in batch]
+        for schema in schemas:
+            earlier = bisect_left(batch_schema_ids, schema.pk)
+            if earlier:
+                relationships.extend(find_inclusion_dependencies(
+                    schema, own_profiles=own_profiles[schema.pk], other_profiles=batch[:earlier], save=False
+                ))
+    return relationships
+
+
+def save_relationships(relationships):
+    SchemaRelationship.objects.bulk_create(relationships)
+    invalidate_schemas([schema_id for relationship in relationships
+                        for schema_id in (relationship.source_schema_id, relationship.target_schema_id)])
@@ -0,0 +1,573 @@
+import json
+import logging
+import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Max
+
+from . import metrics
+from .caching import invalidate, invalidate_sources, invalidate_schemas
+from .compression import detect_source_type, open_source, seekable_stream
+from .flatten import Flattener, iter_json_records
+from .models import (
+    DataSource, SchemaDefinition, SchemaSamples, PrimaryKeyCandidate, SchemaChange, SchemaRelationship, ColumnProfile
+)
+from .search import index_schemas
+from .similarity import normalize_filename, score_filenames
+from .inclusion import (
+    profile_columns, find_inclusion_dependencies, find_inclusion_dependencies_bulk, save_relationships
+)
+
+logger = logging.getLogger(__name__)
+
+# Weights and threshold for combining filename and column overlap in find_related_sources
+NAME_WEIGHT = 0.4
+SCHEMA_WEIGHT = 0.6
+RELATIONSHIP_THRESHOLD = 0.5
+
+# Types from a previous version that a guided CSV read passes to read_csv()
+GUIDED_DTYPES = {'int64', 'float64', 'bool', 'category'}
+CATEGORY_RATIO = 0.5  # analyze_dataframe() calls text columns with fewer distinct values than this share categories
+
+
+class CustomJSONEncoder(DjangoJSONEncoder):
+    def default(self, obj):
+        from decimal import Decimal
+        import datetime
+
+        if isinstance(obj, Decimal):
+            return float(obj)
+        elif isinstance(obj, datetime.datetime):
+            return obj.strftime('%Y-%m-%d %H:%M:%S')
+        elif isinstance(obj, datetime.date):
+            return obj.strftime('%Y-%m-%d')
+        return super().default(obj)
+
+
+def count_file_read(file_path, source_type):
+    metrics.increment('tracker_ingest_files_read_total', source_type=source_type)
+    metrics.increment('tracker_ingest_bytes_read_total', os.path.getsize(file_path), source_type=source_type)
+
+
+@metrics.stage('parse')
+def read_csv_file(file_path, delimiter=',', encoding='utf-8', column_hints=None):
+    """
+    Read a CSV file, falling back to the C engine if the python engine fails.
+    With column_hints, the [[name, type], ...] of a previous version, it's a
+    guided read instead, see read_csv_guided().
+    """
+    logger.info("Reading CSV file %s with delimiter %r and encoding %s", file_path, delimiter, encoding)
+    count_file_read(file_path, 'csv')
+
+    if column_hints:
+        try:
+            df = read_csv_guided(file_path, column_hints, delimiter=delimiter, encoding=encoding)
+            logger.info("Guided CSV read of %s: columns %s", file_path, df.columns.tolist())
+            return df
+        except Exception as e:
+            logger.warning("Guided read of %s failed, inferring every column: %s", file_path, e)
+
+    try:
+        # Try to read with pandas
+        with open_source(file_path) as f:
+            df = pd.read_csv(f, delimiter=delimiter, encoding=encoding, engine='python')
+        logger.info("Read %s rows of %s: columns %s", len(df), file_path, df.columns.tolist())
+        return df
+    except Exception as e:
+        # Try with different engine as fallback
+        logger.warning("Python engine failed to read %s, trying the C engine: %s", file_path, e)
+        with open_source(file_path) as f:
+            return pd.read_csv(f, delimiter=delimiter, encoding=encoding, engine='c')
+
+
+def read_csv_guided(file_path, column_hints, delimiter=',', encoding='utf-8'):
+    """
+    Read a CSV file with the C engine, using the column types of a previous
+    version as hints: categories are parsed straight into categoricals, numbers
+    and booleans skip inference and dates are parsed. Columns whose data no
+    longer matches their hint are read again with inference. Integer columns are
+    downcast; their stored type stays the hinted one (df.attrs['column_types']).
+    """
+    with open_source(file_path) as f:
+        header = pd.read_csv(f, delimiter=delimiter, encoding=encoding, nrows=0).columns
+    hints = {name: column_type for name, column_type in column_hints if name in header}
+    dtype = {name: column_type for name, column_type in hints.items() if column_type in GUIDED_DTYPES}
+    parse_dates = [name for name, column_type in hints.items() if column_type.startswith('datetime64')]
+
+    def read(dtype, **options):
+        with open_source(file_path) as f:
+            return pd.read_csv(f, delimiter=delimiter, encoding=encoding, engine='c', dtype=dtype, **options)
+
+    try:
+        df = read(dtype, parse_dates=parse_dates)
+    except (ValueError, TypeError, OverflowError) as e:
+        # A number or boolean column has values of another type now; we can't tell which
+        logger.info("Typed read of %s failed (%s), inferring number and boolean columns", file_path, e)
+        dtype = {name: column_type for name, column_type in dtype.items() if column_type == 'category'}
+        df = read(dtype, parse_dates=parse_dates)
+
+    mismatched = [name for name, column_type in dtype.items() if column_type == 'category'
+                  and not fits_category(df[name], len(df))]
+    if mismatched:
+        logger.info("Inferring columns of %s that don't match the previous version: %s", file_path, mismatched)
+        inferred = read(None, usecols=mismatched)
+        for name in mismatched:
+            df[name] = inferred[name]
+
+    column_types = {}
+    for name, column_type in dtype.items():
+        if column_type == 'int64' and df[name].dtype == 'int64':
+            df[name] = pd.to_numeric(df[name], downcast='integer')
+            column_types[name] = column_type
+    df.attrs['column_types'] = column_types
+    return df
+
+
+def fits_category(series, rows):
+    """Whether a column read as a categorical is what analyze_dataframe() would have called a category"""
+    categories = series.cat.categories
+    if not len(categories) or series.nunique() >= rows * CATEGORY_RATIO:
+        return False
+    # Numbers would have been inferred as a numeric column
+    return pd.to_numeric(pd.Series(categories), errors='coerce').isna().any()
+
+
+def previous_column_hints(datasource):
+    """[[name, type], ...] of the latest other version of a data source, or None"""
+    if not settings.GUIDED_INGEST or not datasource.canonical_name:
+        return None
+    return SchemaDefinition.objects.filter(
+        data_source__canonical_name=datasource.canonical_name
+    ).exclude(data_source=datasource).order_by('-data_source__schema_version', '-pk').values_list(
+        'columns', flat=True
+    ).first()
+
+
+@metrics.stage('parse')
+def read_excel_file(file_path, sheet_name=0):
+    """Read one sheet of an Excel file"""
+    count_file_read(file_path, 'excel')
+    with open_source(file_path) as f:
+        return pd.read_excel(seekable_stream(f), sheet_name=sheet_name)
+
+
+@metrics.stage('parse')
+def read_workbook(file_path):
+    """Every sheet of an Excel workbook as {sheet name: DataFrame}, parsing the file once"""
+    count_file_read(file_path, 'excel')
+    with open_source(file_path) as f:
+        return pd.read_excel(seekable_stream(f), sheet_name=None)
+
+
+def analyze_workbook(file_path):
+    """
+    analyze_dataframe() of every sheet of a workbook that has columns, as
+    {sheet name: analysis}. Sheets are analyzed in parallel threads. Never
+    touches the database.
+    """
+    sheets = {str(name): df for name, df in read_workbook(file_path).items() if len(df.columns)}
+    if not sheets:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(len(sheets), settings.PARSE_WORKERS)) as pool:
+        return dict(zip(sheets, pool.map(analyze_dataframe, sheets.values())))
+
+
+@metrics.stage('parse')
+def read_json_file(file_path, encoding='utf-8', max_depth=None, max_paths=None):
+    """
+    Read a JSON or JSON Lines file into a DataFrame with a column per dotted
+    path, streaming the records through a Flattener. Its per-path stats are
+    in df.attrs['path_stats']. Returns None for unsupported structures.
+    """
+    count_file_read(file_path, 'json')
+    flattener = Flattener(max_depth, max_paths)
+    rows = []
+    with open_source(file_path, encoding=encoding) as f:
+        for record in iter_json_records(f):
+            rows.extend(flattener.add(record))
+
+    if not rows:
+        # Unsupported JSON structure
+        return None
+    df = pd.DataFrame(rows)
+    df.attrs['path_stats'] = flattener.summary()
+    return df
+
+
+def read_file(file_path, source_type=None, delimiter=',', encoding='utf-8', sheet_name=0, column_hints=None):
+    """Read any supported file into a DataFrame; column_hints guide CSV reads"""
+    source_type = source_type or detect_source_type(file_path)
+
+    if source_type == 'csv':
+        return read_csv_file(file_path, delimiter=delimiter, encoding=encoding, column_hints=column_hints)
+    elif source_type == 'excel':
+        return read_excel_file(file_path, sheet_name=sheet_name)
+    elif source_type == 'json':
+        return read_json_file(file_path, encoding=encoding)
+    return None
+
+
+def analyze_file(file_path, source_type=None, **options):
+    """read_file() then analyze_dataframe(), or None for an unsupported file. Never touches the database"""
+    df = read_file(file_path, source_type, **options)
+    return None if df is None else analyze_dataframe(df)
+
+
+def analyze_dataframe(df):
+    """
+    Work out everything we store about a DataFrame without touching the database:
+    column definitions, row count, primary key candidates and column profiles.
+
+    value_hashes holds every distinct value hash per column; it's only needed to
+    verify inclusion dependencies straight away and is never stored.
+    """
+    metrics.increment('tracker_ingest_rows_total', len(df))
+    metrics.increment('tracker_ingest_columns_total', len(df.columns))
+
+    # Taken off the frame, as pandas deep-copies attrs onto every column we look at
+    path_stats = df.attrs.pop('path_stats', {})
+    # Types a guided read downcast, stored as they were hinted
+    known_types = df.attrs.pop('column_types', {})
+
+    # Detect schema
+    with metrics.stage('infer_types'):
+        column_definitions = {}
+        for column in df.columns:
+            column_type = known_types.get(column) or str(df[column].dtype)
+
+            # Check for categorical data
+            if column_type == 'object' and df[column].nunique() < len(df) * CATEGORY_RATIO:
+                column_type = 'category'
+
+            column_definitions[column] = {
+                'type': column_type,
+                'sample_values': df[column].dropna().head(5).tolist()
+            }
+        column_definitions = json.loads(json.dumps(column_definitions, cls=CustomJSONEncoder))
+
+    # Identify potential primary keys
+    with metrics.stage('primary_keys'):
+        primary_keys = []
+        for column in df.columns:
+            # Skip columns with NaN values
+            if df[column].isna().any():
+                continue
+
+            # Calculate uniqueness ratio
+            uniqueness = df[column].nunique() / len(df)
+
+            # Only consider columns with high uniqueness (>80%)
+            if uniqueness > 0.8:
+                primary_keys.append((column, uniqueness))
+
+    with metrics.stage('profile_columns'):
+        column_profiles, value_hashes = profile_columns(df)
+
+    return {
+        'column_definitions': column_definitions,
+        'row_count': len(df),
+        'primary_keys': primary_keys,
+        'column_profiles': column_profiles,
+        'value_hashes': value_hashes,
+        'path_stats': path_stats,
+    }
+
+
+def save_analysis(datasource, analysis, detect_relationships=True):
+    """Store the result of analyze_dataframe() as the schema of a data source"""
+    # One transaction, so cached pages are invalidated once everything is written
+    with metrics.stage('db_write'), transaction.atomic():
+        # Remove any existing schema (in case this is a retry)
+        try:
+            old_schema = SchemaDefinition.objects.get(data_source=datasource)
+
+            # Remove related primary key candidates
+            PrimaryKeyCandidate.objects.filter(schema=old_schema).delete()
+
+            # Remove the schema itself
+            old_schema.delete()
+        except SchemaDefinition.DoesNotExist:
+            pass
+
+        # Create schema definition
+        schema = SchemaDefinition.objects.create(
+            data_source=datasource,
+            column_definitions=analysis['column_definitions'],
+            path_stats=analysis.get('path_stats') or {},
+            row_count=analysis['row_count']
+        )
+
+        PrimaryKeyCandidate.objects.bulk_create([
+            PrimaryKeyCandidate(
+                schema=schema,
+                column_name=column,
+                uniqueness_ratio=uniqueness,
+                is_confirmed=False  # Needs user confirmation
+            )
+            for column, uniqueness in analysis['primary_keys']
+        ])
+
+        ColumnProfile.objects.bulk_create([
+            ColumnProfile(schema=schema, **profile) for profile in analysis['column_profiles']
+        ])
+
+        # Record this as the initial version
+        SchemaChange.objects.create(
+            source=datasource,
+            change_type='initial',
+            details={'columns': list(analysis['column_definitions'].keys())}
+        )
+
+    if detect_relationships:
+        # Look for foreign keys to and from other sources
+        with metrics.stage('inclusion'):
+            find_inclusion_dependencies(schema, analysis.get('value_hashes'))
+
+        # Check for relationships with existing sources
+        find_related_sources(datasource)
+
+    return schema
+
+
+def save_analyses(sources, analyses):
+    """
+    Bulk counterpart of save_analysis() for new, unsaved data sources, in the
+    same number of queries however many there are. Relationships are left to
+    find_related_sources_bulk(). Returns the schemas.
+    """
+    for source in sources:
+        # bulk_create skips save(), which normally fills this in
+        source.normalized_filename = normalize_filename(source.original_filename)
+    DataSource.objects.bulk_create(sources)
+
+    schemas = SchemaDefinition.objects.bulk_create([
+        SchemaDefinition(
+            data_source=source,
+            column_definitions=analysis['column_definitions'],
+            path_stats=analysis.get('path_stats') or {},
+            row_count=analysis['row_count']
+        )
+        for source, analysis in zip(sources, analyses)
+    ])
+    SchemaSamples.create_for(schemas)
+
+    PrimaryKeyCandidate.objects.bulk_create([
+        PrimaryKeyCandidate(schema=schema, column_name=column, uniqueness_ratio=uniqueness)
+        for schema, analysis in zip(schemas, analyses)
+        for column, uniqueness in analysis['primary_keys']
+    ])
+    ColumnProfile.objects.bulk_create([
+        ColumnProfile(schema=schema, **profile)
+        for schema, analysis in zip(schemas, analyses)
+        for profile in analysis['column_profiles']
+    ])
+    SchemaChange.objects.bulk_create([
+        SchemaChange(
+            source=source,
+            change_type='initial',
+            details={'columns': list(analysis['column_definitions'].keys())}
+        )
+        for source, analysis in zip(sources, analyses)
+    ])
+
+    # bulk_create() sends no signals
+    invalidate('catalog', *(f"canonical:{source.canonical_name}" for source in sources))
+    index_schemas(schemas)
+    return schemas
+
+
+def sheet_canonical_name(canonical_name, sheet_name):
+    return f"{canonical_name}:{sheet_name}"
+
+
+def save_workbook(workbook, analyses, detect_relationships=True):
+    """
+    Store the analyzed sheets of a workbook, each as a data source and schema
+    under it, versioned per sheet. Returns the data sources.
+    """
+    names = [sheet_canonical_name(workbook.canonical_name, sheet_name) for sheet_name in analyses]
+    versions = dict(
+        DataSource.objects.filter(canonical_name__in=names).values('canonical_name').annotate(
+            latest=Max('schema_version')
+        ).values_list('canonical_name', 'latest')
+    )
+    sources = [
+        DataSource(
+            original_filename=workbook.original_filename,
+            file=workbook.file.name,
+            canonical_name=name,
+            schema_version=versions.get(name, 0) + 1,
+            source_type='excel',
+            workbook=workbook,
+            sheet_name=sheet_name
+        )
+        for name, sheet_name in zip(names, analyses)
+    ]
+    with metrics.stage('db_write'), transaction.atomic():
+        save_analyses(sources, list(analyses.values()))
+
+    if detect_relationships:
+        find_related_sources_bulk([source.pk for source in sources])
+    return sources
+
+
+def relate_to_existing(datasource, new_schema, existing_schemas, new_columns=None, existing_columns=None,
+                       save=True):
+    """
+    Score a schema against existing schemas and record version changes and
+    relationships for the similar ones. With save=False the (changes,
+    relationships) are returned for the caller to save.
+    """
+    if new_columns is None:
+        new_columns = set(new_schema.get_columns())
+    if existing_columns is None:
+        existing_columns = [set(schema.get_columns()) for schema in existing_schemas]
+
+    # Score the filename against the whole catalog in one batched call. Names
+    # scoring below the cutoff can't reach the threshold even with identical columns.
+    name_cutoff = max(0.0, (RELATIONSHIP_THRESHOLD - SCHEMA_WEIGHT) / NAME_WEIGHT) * 100
+    name_similarities = score_filenames(
+        datasource.normalized_filename,
+        [schema.data_source.normalized_filename for schema in existing_schemas],
+        score_cutoff=name_cutoff
+    )
+
+    changes = []
+    relationships = []
+    for existing_schema, columns, name_similarity in zip(existing_schemas, existing_columns, name_similarities):
+        existing = existing_schema.data_source
+
+        # Calculate schema similarity
+        common_columns = new_columns.intersection(columns)
+        schema_similarity = len(common_columns) / max(len(new_columns), len(columns))
+
+        # Overall similarity is a weighted combination
+        similarity = (name_similarity * NAME_WEIGHT) + (schema_similarity * SCHEMA_WEIGHT)
+
+        # If similarity is above threshold, create a relationship
+        if similarity > RELATIONSHIP_THRESHOLD:
+            relationship_type = 'version' if similarity > 0.8 else 'related'
+
+            # Check if this might be a newer version
+            if name_similarity > 0.7 and datasource.upload_date > existing.upload_date:
+                # Record changes between versions
+                added_columns = new_columns - columns
+                removed_columns = columns - new_columns
+
+                if added_columns:
+                    changes.append(SchemaChange(
+                        source=datasource,
+                        previous_version=existing,
+                        change_type='add_column',
+                        details={'columns': list(added_columns)}
+                    ))
+
+                if removed_columns:
+                    changes.append(SchemaChange(
+                        source=datasource,
+                        previous_version=existing,
+                        change_type='remove_column',
+                        details={'columns': list(removed_columns)}
+                    ))
+
+            # Create relationship record
+            relationships.append(SchemaRelationship(
+                source_schema=existing_schema,
+                target_schema=new_schema,
+                relationship_type=relationship_type,
+                source_columns=list(common_columns),
+                target_columns=list(common_columns),
+                similarity_score=similarity
+            ))
+
+    if not save:
+        return changes, relationships
+    SchemaChange.objects.bulk_create(changes)
+    SchemaRelationship.objects.bulk_create(relationships)
+    invalidate_sources([datasource.pk] + [change.previous_version_id for change in changes])
+    invalidate_schemas([new_schema.pk] + [relationship.source_schema_id for relationship in relationships])
+    return changes, relationships
+
+
+@metrics.stage('relationships')
+def find_related_sources(datasource):
+    """
+    Find potentially related sources based on filename similarity and schema
+    """
+    # Get the new source's schema
+    new_schema = SchemaDefinition.objects.get(data_source=datasource)
+
+    # Load every other schema with its source in a single query
+    existing_schemas = list(
+        SchemaDefinition.objects.exclude(data_source=datasource).select_related('data_source')
+    )
+
+    # Skip if this is the first source
+    if not existing_schemas:
+        return
+
+    relate_to_existing(datasource, new_schema, existing_schemas)
+
+
+@metrics.stage('relationships_bulk')
+def find_related_sources_bulk(datasource_ids):
+    """
+    Relationship detection for many new sources at once, e.g. after a bulk ingest.
+
+    Gives the same result as calling find_related_sources after each upload in
+    turn: every new source is compared with the sources uploaded before it. The
+    catalog is loaded once, and only schemas sharing at least one column are
+    compared, since with the default weights the filename alone can't pass the
+    threshold.
+    """
+    datasource_ids = set(datasource_ids)
+    schemas = list(SchemaDefinition.objects.select_related('data_source').order_by('data_source_id'))
+    columns = [set(schema.get_columns()) for schema in schemas]
+    name_alone_can_match = NAME_WEIGHT > RELATIONSHIP_THRESHOLD
+
+    # Inverted index: column name -> positions of the schemas that have it
+    index = defaultdict(list)
+    for position, schema_columns in enumerate(columns):
+        for column in schema_columns:
+            index[column].append(position)
+
+    # Saved together at the end, so the writes don't grow with the number of new sources
+    changes = []
+    relationships = []
+    for position, schema in enumerate(schemas):
+        if schema.data_source_id not in datasource_ids:
+            continue
+
+        if name_alone_can_match:
+            candidates = list(range(position))
+        else:
+            candidates = sorted({
+                other for column in columns[position] for other in index[column] if other < position
+            })
+        if not candidates:
+            continue
+
+        schema_changes, schema_relationships = relate_to_existing(
+            schema.data_source, schema,
+            [schemas[other] for other in candidates],
+            new_columns=columns[position],
+            existing_columns=[columns[other] for other in candidates],
+            save=False
+        )
+        changes.extend(schema_changes)
+        relationships.extend(schema_relationships)
+
+    # Inclusion dependencies, each new schema against the ones before it
+    dependencies = find_inclusion_dependencies_bulk(
+        [schema for schema in schemas if schema.data_source_id in datasource_ids]
+    )
+
+    SchemaChange.objects.bulk_create(changes)
+    save_relationships(relationships + dependencies)
+    invalidate_sources(list(datasource_ids) + [change.previous_version_id for change in changes])
+    invalidate_schemas([schema.pk for schema in schemas if schema.data_source_id in datasource_ids])
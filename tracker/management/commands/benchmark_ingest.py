@@ -0,0 +1,266 @@
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from tracker.inclusion import find_inclusion_dependencies
+from tracker.ingest import read_file, analyze_dataframe, save_analysis, find_related_sources
+from tracker.models import DataSource, SchemaDefinition, SchemaSamples, ColumnProfile
+from tracker.synthetic import COLUMN_TYPES, synthetic_dataframe, write_synthetic_file
+
+EXTENSIONS = {'csv': '.csv', 'excel': '.xlsx', 'json': '.json'}
+CATALOG_TEMPLATES = 50  # Distinct synthetic schemas the seeded catalog cycles through
+REGRESSION_RATIO = 1.2  # Slowdown reported as a regression by --compare
+
+
+class Command(BaseCommand):
+    help = """
+    Time each stage of the ingest pipeline (parse, analyze, write, inclusion
+    dependencies, related sources) on synthetic files against catalogs of
+    growing size. Peak memory is measured in a separate pass with tracemalloc.
+
+    Everything runs in a transaction that is rolled back, so the database is
+    left as it was. Results are saved as JSON; pass an earlier result file
+    with --compare to spot regressions between commits.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000], help='Rows per file')
+        parser.add_argument('--columns', type=int, default=20)
+        parser.add_argument('--types', nargs='+', choices=COLUMN_TYPES, default=COLUMN_TYPES,
+                            help='Column types to cycle through')
+        parser.add_argument('--cardinality', type=float, default=0.5, help='Share of distinct values per column')
+        parser.add_argument('--null-rate', type=float, default=0.05)
+        parser.add_argument('--formats', nargs='+', choices=list(EXTENSIONS), default=['csv'])
+        parser.add_argument('--catalog-sizes', type=int, nargs='+', default=[0, 100, 1000],
+                            help='Number of existing sources to benchmark against')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per case (best time is reported)')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Where to save the results (default: ingest-benchmark-<commit>.json)')
+        parser.add_argument('--compare', help='Earlier result file to compare against')
+
+    def handle(self, *args, **options):
+        baseline = self.load_results(options['compare']) if options['compare'] else None
+        commit = self.git_commit()
+        results = []
+
+        with tempfile.TemporaryDirectory() as directory:
+            files = {}
+            for source_type in options['formats']:
+                for rows in options['rows']:
+                    df = synthetic_dataframe(rows, options['columns'], types=options['types'],
+                                             cardinality=options['cardinality'], null_rate=options['null_rate'],
+                                             seed=options['seed'])
+                    path = os.path.join(directory, f"synthetic_{rows}{EXTENSIONS[source_type]}")
+                    write_synthetic_file(df, path, source_type)
+                    files[source_type, rows] = path
+
+            self.stdout.write(f"{'format':>7} {'rows':>9} {'catalog':>8} {'parse':>8} {'analyze':>8} "
+                              f"{'write':>8} {'incl.':>8} {'related':>8} {'total':>8} {'peak MB':>8}")
+
+            with transaction.atomic():
+                seeded = 0
+                for catalog_size in sorted(options['catalog_sizes']):
+                    self.seed_catalog(catalog_size - seeded, options)
+                    seeded = catalog_size
+
+                    for (source_type, rows), path in files.items():
+                        result = self.benchmark(path, source_type, options['repeat'])
+                        result.update(format=source_type, rows=rows, columns=options['columns'],
+                                      catalog_size=catalog_size, file_bytes=os.path.getsize(path))
+                        results.append(result)
+                        self.print_result(result)
+
+                # Leave the database exactly as we found it
+                transaction.set_rollback(True)
+
+        output = options['output'] or f"ingest-benchmark-{commit[:10] if commit else 'unknown'}.json"
+        with open(output, 'w') as f:
+            json.dump({
+                'created': datetime.now().isoformat(timespec='seconds'),
+                'commit': commit,
+                'python': platform.python_version(),
+                'pandas': pd.__version__,
+                'numpy': np.__version__,
+                'platform': platform.platform(),
+                'options': {key: options[key] for key in ['rows', 'columns', 'types', 'cardinality', 'null_rate',
+                                                          'formats', 'catalog_sizes', 'repeat', 'seed']},
+                'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                'results': results,
+            }, f, indent=2)
+        self.stdout.write(f"Results saved to {output}")
+
+        if baseline:
+            self.compare(baseline, results)
+
+    def stages(self, path, source_type):
+        """The ingest pipeline as (name, callable) steps sharing state through a dict"""
+        state = {}
+
+        def parse():
+            state['df'] = read_file(path, source_type)
+
+        def analyze():
+            state['analysis'] = analyze_dataframe(state['df'])
+
+        def write():
+            state['datasource'] = DataSource.objects.create(
+                original_filename=os.path.basename(path), canonical_name='benchmark', source_type=source_type
+            )
+            state['schema'] = save_analysis(state['datasource'], state['analysis'], detect_relationships=False)
+
+        def inclusion():
+            find_inclusion_dependencies(state['schema'], state['analysis']['value_hashes'])
+
+        def related():
+            find_related_sources(state['datasource'])
+
+        return [('parse', parse), ('analyze', analyze), ('write', write),
+                ('inclusion', inclusion), ('related', related)]
+
+    def run_pipeline(self, path, source_type, trace_memory=False):
+        timings = {}
+        peaks = {}
+        savepoint = transaction.savepoint()
+        try:
+            # The readers report progress with print(), which would drown the table
+            with redirect_stdout(io.StringIO()):
+                for name, stage in self.stages(path, source_type):
+                    if trace_memory:
+                        tracemalloc.start()
+                    start = time.perf_counter()
+                    stage()
+                    timings[name] = time.perf_counter() - start
+                    if trace_memory:
+                        peaks[name] = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+                        tracemalloc.stop()
+        finally:
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+            transaction.savepoint_rollback(savepoint)
+        return timings, peaks
+
+    def benchmark(self, path, source_type, repeat):
+        best = {}
+        for _ in range(repeat):
+            timings, _ = self.run_pipeline(path, source_type)
+            for name, seconds in timings.items():
+                best[name] = min(best.get(name, seconds), seconds)
+
+        # tracemalloc slows things down, so memory gets a pass of its own
+        _, peaks = self.run_pipeline(path, source_type, trace_memory=True)
+
+        return {
+            'stages': {name: {'seconds': best[name], 'peak_mb': peaks[name]} for name in best},
+            'total_seconds': sum(best.values()),
+            'peak_mb': max(peaks.values()),
+        }
+
+    def seed_catalog(self, count, options):
+        """
+        Add synthetic sources to the catalog. Schemas are analyzed once per
+        template and then bulk created, so large catalogs are quick to build.
+        """
+        if count <= 0:
+            return
+
+        rng = np.random.default_rng(options['seed'] + 1)
+        templates = []
+        for template in range(min(count, CATALOG_TEMPLATES)):
+            df = synthetic_dataframe(
+                200, int(rng.integers(3, options['columns'] + 1)),
+                types=list(rng.permutation(options['types'])),
+                cardinality=float(rng.uniform(0.05, 1.0)), null_rate=options['null_rate'],
+                seed=options['seed'] + template + 1
+            )
+            analysis = analyze_dataframe(df)
+            templates.append((f"catalog_{template}", analysis))
+
+        start = DataSource.objects.count()
+        sources = DataSource.objects.bulk_create([
+            DataSource(
+                original_filename=f"{templates[n % len(templates)][0]}_{start + n}.csv",
+                normalized_filename=f"{templates[n % len(templates)][0]} {start + n}",
+                canonical_name=templates[n % len(templates)][0],
+                source_type='csv'
+            )
+            for n in range(count)
+        ])
+        schemas = SchemaDefinition.objects.bulk_create([
+            SchemaDefinition(
+                data_source=source,
+                column_definitions=templates[n % len(templates)][1]['column_definitions'],
+                row_count=templates[n % len(templates)][1]['row_count']
+            )
+            for n, source in enumerate(sources)
+        ])
+        SchemaSamples.create_for(schemas)
+        ColumnProfile.objects.bulk_create([
+            ColumnProfile(schema=schema, **profile)
+            for n, schema in enumerate(schemas)
+            for profile in templates[n % len(templates)][1]['column_profiles']
+        ])
+
+    def print_result(self, result):
+        stages = result['stages']
+        self.stdout.write(
+            f"{result['format']:>7} {result['rows']:>9} {result['catalog_size']:>8} "
+            + ' '.join(f"{stages[name]['seconds']:>8.3f}" for name in ['parse', 'analyze', 'write', 'inclusion',
+                                                                     'related'])
+            + f" {result['total_seconds']:>8.3f} {result['peak_mb']:>8.1f}"
+        )
+
+    def compare(self, baseline, results):
+        """Print stage timings relative to an earlier run and flag slowdowns"""
+        previous = {
+            (result['format'], result['rows'], result['columns'], result['catalog_size']): result
+            for result in baseline['results']
+        }
+        self.stdout.write(f"\nCompared with {baseline.get('commit') or 'baseline'} ({baseline.get('created')}):")
+
+        regressions = 0
+        for result in results:
+            before = previous.get((result['format'], result['rows'], result['columns'], result['catalog_size']))
+            if before is None:
+                continue
+            for name, stage in result['stages'].items():
+                if name not in before['stages'] or not before['stages'][name]['seconds']:
+                    continue
+                ratio = stage['seconds'] / before['stages'][name]['seconds']
+                if ratio > REGRESSION_RATIO:
+                    regressions += 1
+                    self.stdout.write(self.style.WARNING(
+                        f"  {result['format']} {result['rows']} rows, catalog {result['catalog_size']}: "
+                        f"{name} {ratio:.2f}x slower"
+                    ))
+
+        if not regressions:
+            self.stdout.write(self.style.SUCCESS(f"  No stage more than {REGRESSION_RATIO:.1f}x slower"))
+
+    def load_results(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Could not read benchmark results from {path}: {e}")
+
+    @staticmethod
+    def git_commit():
+        try:
+            return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                  cwd=settings.BASE_DIR, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
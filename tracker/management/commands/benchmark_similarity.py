@@ -0,0 +1,58 @@
+import random
+import string
+import time
+
+from django.core.management.base import BaseCommand
+
+from tracker.similarity import normalize_filename, score_filenames
+
+
+class Command(BaseCommand):
+    help = 'Compare the per-pair filename scoring loop with the batched similarity engine'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+                            help='Catalog sizes to benchmark')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per size (best time is reported)')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        from fuzzywuzzy import fuzz
+
+        rng = random.Random(options['seed'])
+        query = 'customer_orders_2025-03-11_v2.csv'
+        normalized_query = normalize_filename(query)
+
+        self.stdout.write(f"{'sources':>10} {'loop (s)':>10} {'batched (s)':>12} {'speedup':>9}")
+        for size in options['sizes']:
+            filenames = [self.random_filename(rng) for _ in range(size)]
+            # Normalization happens once at save time, so it isn't part of the timing
+            normalized = [normalize_filename(name) for name in filenames]
+
+            loop_time = self.best_of(options['repeat'], lambda: [
+                fuzz.ratio(query, name) / 100 for name in filenames
+            ])
+            batched_time = self.best_of(options['repeat'], lambda: score_filenames(normalized_query, normalized))
+
+            self.stdout.write(
+                f"{size:>10} {loop_time:>10.4f} {batched_time:>12.4f} {loop_time / batched_time:>8.1f}x"
+            )
+
+    @staticmethod
+    def best_of(repeat, func):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    @staticmethod
+    def random_filename(rng):
+        words = ['customer', 'orders', 'address', 'country', 'film', 'actor', 'payment', 'inventory', 'store']
+        stem = '_'.join(rng.sample(words, rng.randint(1, 3)))
+        suffix = ''.join(rng.choices(string.ascii_lowercase, k=rng.randint(0, 6)))
+        date = f"_2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}" if rng.random() < 0.5 else ''
+        version = f"_v{rng.randint(1, 9)}" if rng.random() < 0.3 else ''
+        extension = rng.choice(['.csv', '.xlsx', '.json'])
+        return f"{stem}{suffix}{date}{version}{extension}"
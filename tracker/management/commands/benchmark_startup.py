@@ -0,0 +1,89 @@
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Run in a fresh interpreter: what a web worker does before serving its first request
+WORKER_STARTUP = """
+import json, sys, time
+start = time.perf_counter()
+import django
+django.setup()
+from django.core.handlers.wsgi import WSGIHandler
+from django.urls import get_resolver
+WSGIHandler()
+get_resolver().url_patterns  # Imports every app's views
+seconds = time.perf_counter() - start
+from tracker.metrics import peak_rss_bytes
+print(json.dumps({'seconds': seconds, 'rss_bytes': peak_rss_bytes(), 'modules': sorted(sys.modules)}))
+"""
+
+# Only needed to analyze files; a worker shouldn't load them until it does
+HEAVY_MODULES = ['pandas', 'numpy', 'rapidfuzz', 'fuzzywuzzy', 'openpyxl', 'xlrd', 'pyarrow', 'zstandard']
+
+
+class Command(BaseCommand):
+    help = """
+    Measure the cold start of a web worker: each run is a new Python process
+    that sets up Django, builds the WSGI handler and loads the URLconf, as a
+    gunicorn worker does. Reports the time taken, peak RSS and any heavy
+    analysis modules that got imported along the way.
+
+    Fails when --max-ms or --max-mb is exceeded or, with --no-heavy-modules,
+    when an analysis module was imported, so it can guard against regressions.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5, help='Processes to start (best time is reported)')
+        parser.add_argument('--max-ms', type=float, help='Fail if startup takes longer')
+        parser.add_argument('--max-mb', type=float, help='Fail if peak RSS is higher')
+        parser.add_argument('--no-heavy-modules', action='store_true',
+                            help='Fail if pandas, numpy or another analysis module is imported at startup')
+        parser.add_argument('--output', help='Where to save the results as JSON')
+
+    def handle(self, *args, **options):
+        runs = [self.start_worker() for _ in range(options['repeat'])]
+        milliseconds = min(run['seconds'] for run in runs) * 1000
+        rss_mb = max(run['rss_bytes'] for run in runs) / 1024 / 1024
+        heavy_modules = [module for module in HEAVY_MODULES if module in runs[0]['modules']]
+
+        self.stdout.write(f"Startup: {milliseconds:.0f} ms (best of {len(runs)}), peak RSS {rss_mb:.1f} MB, "
+                          f"{len(runs[0]['modules'])} modules")
+        self.stdout.write(f"Analysis modules loaded: {', '.join(heavy_modules) or 'none'}")
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({
+                    'created': datetime.now().isoformat(timespec='seconds'),
+                    'python': platform.python_version(),
+                    'platform': platform.platform(),
+                    'milliseconds': milliseconds,
+                    'rss_mb': rss_mb,
+                    'modules': len(runs[0]['modules']),
+                    'heavy_modules': heavy_modules,
+                }, f, indent=2)
+            self.stdout.write(f"Results saved to {options['output']}")
+
+        problems = []
+        if options['max_ms'] is not None and milliseconds > options['max_ms']:
+            problems.append(f"startup took {milliseconds:.0f} ms, limit is {options['max_ms']:.0f} ms")
+        if options['max_mb'] is not None and rss_mb > options['max_mb']:
+            problems.append(f"peak RSS is {rss_mb:.1f} MB, limit is {options['max_mb']:.1f} MB")
+        if options['no_heavy_modules'] and heavy_modules:
+            problems.append(f"imported {', '.join(heavy_modules)}")
+        if problems:
+            raise CommandError("Startup budget exceeded: " + "; ".join(problems))
+
+    def start_worker(self):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'schemanavigator.settings'))
+        try:
+            result = subprocess.run([sys.executable, '-c', WORKER_STARTUP], capture_output=True, text=True,
+                                    cwd=settings.BASE_DIR, env=env, check=True)
+        except subprocess.CalledProcessError as e:
+            raise CommandError(f"Worker failed to start:\n{e.stderr}")
+        return json.loads(result.stdout.strip().splitlines()[-1])
@@ -0,0 +1,40 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tracker.diff import diff_datasources
+from tracker.models import DataSource
+
+
+class Command(BaseCommand):
+    help = 'Compare the rows of two data source versions using the confirmed primary key'
+
+    def add_arguments(self, parser):
+        parser.add_argument('old', type=int, help='Primary key of the older DataSource')
+        parser.add_argument('new', type=int, help='Primary key of the newer DataSource')
+        parser.add_argument('--key', nargs='+', help='Key columns (defaults to the confirmed primary key)')
+        parser.add_argument('--delimiter', default=',')
+        parser.add_argument('--encoding', default='utf-8')
+        parser.add_argument('--partitions', type=int, help='Number of spill partitions (defaults to one per 128 MB)')
+        parser.add_argument('--chunksize', type=int, default=100_000, help='Rows read per CSV chunk')
+
+    def handle(self, *args, **options):
+        try:
+            old = DataSource.objects.get(pk=options['old'])
+            new = DataSource.objects.get(pk=options['new'])
+        except DataSource.DoesNotExist as e:
+            raise CommandError(str(e))
+
+        try:
+            result = diff_datasources(
+                old, new,
+                key_columns=options['key'],
+                partitions=options['partitions'],
+                delimiter=options['delimiter'],
+                encoding=options['encoding'],
+                chunksize=options['chunksize'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(json.dumps(result, indent=2))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from tracker.inclusion import find_inclusion_dependencies_bulk, save_relationships
+from tracker.models import SchemaDefinition, SchemaRelationship
+
+
+class Command(BaseCommand):
+    help = 'Rebuild value-overlap (foreign key) relationships across the catalog from stored column profiles'
+
+    def handle(self, *args, **options):
+        deleted, _ = SchemaRelationship.objects.filter(details__method='inclusion').delete()
+        self.stdout.write(f"Removed {deleted} existing inclusion relationships")
+
+        # Each pair of schemas is compared once, from the later one, in a
+        # single pass over the stored profiles
+        schemas = SchemaDefinition.objects.filter(column_profiles__isnull=False).distinct().only('pk')
+        relationships = find_inclusion_dependencies_bulk(schemas)
+        save_relationships(relationships)
+
+        self.stdout.write(self.style.SUCCESS(f"Found {len(relationships)} inclusion dependencies"))
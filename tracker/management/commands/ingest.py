@@ -0,0 +1,340 @@
+import fnmatch
+import glob
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.db.models import Max, OuterRef, Subquery
+
+from tracker import metrics
+from tracker.compression import inner_filename, store_file
+from tracker.executor import init_worker
+from tracker.ingest import analyze_dataframe, read_file, detect_source_type, find_related_sources_bulk, save_analyses
+from tracker.models import DataSource, SchemaDefinition, IngestedFile
+from tracker.rowindex import index_name, save_row_index
+from tracker.similarity import normalize_filename
+
+logger = logging.getLogger(__name__)
+
+
+def analyze_file(task):
+    """
+    Runs in a worker process: read and analyze one file and copy it into media
+    storage. Workers never touch the database; results are written in batches
+    by the parent process.
+    """
+    try:
+        df = read_file(task['path'], task['source_type'], **task['options'])
+        if df is None:
+            raise ValueError("Unsupported file structure")
+
+        analysis = analyze_dataframe(df)
+        # Only used to verify relationships at upload time, too big to send back
+        del analysis['value_hashes']
+
+        with open(task['path'], 'rb') as f:
+            stored_name = store_file(task['upload_name'], f)
+        if task['source_type'] == 'csv':
+            try:
+                save_row_index(stored_name)
+            except Exception:
+                # browse_rows() builds it when first needed
+                logger.warning("Could not build the row index of %s", stored_name, exc_info=True)
+
+        return dict(task, analysis=analysis, stored_name=stored_name, error='')
+    except Exception as e:
+        return dict(task, analysis=None, stored_name=None, error=f"{type(e).__name__}: {e}")
+
+
+def analyze_file_in_worker(task):
+    """analyze_file in a worker process, sending back the metrics it recorded for the parent to merge"""
+    return dict(analyze_file(task), metrics=metrics.collect())
+
+
+def sheet_name(value):
+    """--sheet-name: a sheet's position when it's all digits, otherwise its name"""
+    return int(value) if value.isdigit() else value
+
+
+class Command(BaseCommand):
+    help = """
+    Ingest every supported file in the given directories or glob patterns.
+
+    Files are parsed and profiled in a process pool, written to the database in
+    batches and remembered by path, size and mtime so that an interrupted run
+    can simply be started again. Relationship detection runs once at the end.
+
+    Mapping rules are a JSON list of objects, checked in order, e.g.
+      [{"pattern": "crm/customers_*.csv", "canonical_name": "customers", "delimiter": ";"},
+       {"pattern": "*.xlsx", "canonical_name": "{parent}_{name}", "sheet_name": 0}]
+    "pattern" is matched against the path relative to the directory argument
+    (or the current directory for globs) and against the bare filename.
+    canonical_name may use {name} (normalized filename), {stem} and {parent}.
+    Rules may also set source_type, delimiter, encoding and sheet_name.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='Directories (searched recursively) or glob patterns')
+        parser.add_argument('--rules', help='JSON file mapping path patterns to canonical names and options')
+        parser.add_argument('--canonical-name', help='Canonical name for every file (overrides rules)')
+        parser.add_argument('--source-type', choices=['csv', 'excel', 'json'],
+                            help='Source type for every file (default: from rules or extension)')
+        parser.add_argument('--delimiter', default=',')
+        parser.add_argument('--encoding', default='utf-8')
+        parser.add_argument('--sheet-name', type=sheet_name, default=0,
+                            help='Sheet of Excel files to read, by position (from 0) or name')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Worker processes')
+        parser.add_argument('--batch-size', type=int, default=200, help='Files written per transaction')
+        parser.add_argument('--retry-failed', action='store_true', help='Retry files that failed before')
+        parser.add_argument('--skip-relationships', action='store_true',
+                            help='Leave relationship detection for a later run')
+
+    def handle(self, *args, **options):
+        rules = self.load_rules(options['rules']) if options['rules'] else []
+        tasks = self.plan(options, rules)
+
+        if not tasks:
+            self.stdout.write("Nothing new to ingest")
+        else:
+            self.stdout.write(f"Ingesting {len(tasks)} files with {options['workers']} workers")
+            self.run(tasks, options)
+
+        if not options['skip_relationships']:
+            self.detect_relationships()
+
+    def detect_relationships(self):
+        """Relationship detection for every ingested source still waiting for it"""
+        pending = IngestedFile.objects.filter(relationships_pending=True, data_source__isnull=False)
+        datasource_ids = list(pending.values_list('data_source_id', flat=True))
+        if datasource_ids:
+            self.stdout.write(f"Detecting relationships for {len(datasource_ids)} new sources")
+            start = time.perf_counter()
+            find_related_sources_bulk(datasource_ids)
+            pending.update(relationships_pending=False)
+            self.stdout.write(f"Relationship detection took {time.perf_counter() - start:.1f}s")
+
+    def load_rules(self, path):
+        try:
+            with open(path) as f:
+                rules = json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Could not read rules from {path}: {e}")
+
+        if not isinstance(rules, list) or not all(isinstance(rule, dict) and 'pattern' in rule for rule in rules):
+            raise CommandError("Rules must be a JSON list of objects with a 'pattern'")
+        return rules
+
+    def discover(self, targets):
+        """Yield (path relative to its root, absolute path) for every file under the targets"""
+        for target in targets:
+            if os.path.isdir(target):
+                for dirpath, dirnames, filenames in os.walk(target):
+                    dirnames.sort()
+                    for filename in sorted(filenames):
+                        path = os.path.join(dirpath, filename)
+                        yield os.path.relpath(path, target), os.path.abspath(path)
+            else:
+                for path in sorted(glob.glob(target, recursive=True)):
+                    if os.path.isfile(path):
+                        yield os.path.relpath(path), os.path.abspath(path)
+
+    def plan(self, options, rules):
+        """Work out which files need ingesting and how"""
+        candidates = {}
+        for relative_path, path in self.discover(options['paths']):
+            if path not in candidates:
+                task = self.make_task(relative_path, path, options, rules)
+                if task:
+                    candidates[path] = task
+
+        self.add_column_hints(candidates.values())
+
+        # Skip anything already ingested (or failed) that hasn't changed since
+        known = {}
+        paths = list(candidates)
+        for start in range(0, len(paths), 500):
+            for record in IngestedFile.objects.filter(path__in=paths[start:start + 500]):
+                known[record.path] = record
+
+        tasks = []
+        for path, task in candidates.items():
+            stat = os.stat(path)
+            task.update(size=stat.st_size, mtime=stat.st_mtime, inode=stat.st_ino)
+
+            record = known.get(path)
+            if record and record.size == stat.st_size and record.mtime == stat.st_mtime:
+                if record.status == 'ingested' or not options['retry_failed']:
+                    continue
+            tasks.append(task)
+
+        # Oldest first, so schema versions follow file history
+        tasks.sort(key=lambda task: task['mtime'])
+        return tasks
+
+    def make_task(self, relative_path, path, options, rules):
+        """How to ingest a file, from the first matching rule and the options; None if it isn't a data file"""
+        rule = next((rule for rule in rules
+                     if fnmatch.fnmatch(relative_path, rule['pattern'])
+                     or fnmatch.fnmatch(os.path.basename(path), rule['pattern'])), {})
+
+        source_type = options['source_type'] or rule.get('source_type') or detect_source_type(path)
+        if source_type is None:
+            return None
+
+        filename = os.path.basename(path)
+        data_filename = os.path.basename(inner_filename(path))  # orders.csv for orders.csv.gz
+        canonical_name = options['canonical_name'] or rule.get('canonical_name', '{name}').format(
+            name=normalize_filename(filename),
+            stem=os.path.splitext(data_filename)[0],
+            parent=os.path.basename(os.path.dirname(path))
+        )
+
+        delimiter = rule.get('delimiter', options['delimiter'])
+        if data_filename.lower().endswith('.tsv') and 'delimiter' not in rule:
+            delimiter = '\t'
+
+        return {
+            'path': path,
+            'canonical_name': canonical_name,
+            'source_type': source_type,
+            'options': {
+                'delimiter': delimiter,
+                'encoding': rule.get('encoding', options['encoding']),
+                'sheet_name': rule.get('sheet_name', options['sheet_name']),
+            },
+            'upload_name': DataSource._meta.get_field('file').generate_filename(None, filename),
+        }
+
+    def add_column_hints(self, tasks):
+        """Give CSV files of known canonical names their latest version's column types to guide the read"""
+        if not settings.GUIDED_INGEST:
+            return
+        tasks = [task for task in tasks if task['source_type'] == 'csv']
+        names = sorted({task['canonical_name'] for task in tasks})
+        latest_version = DataSource.objects.filter(
+            canonical_name=OuterRef('data_source__canonical_name'), schema__isnull=False
+        ).order_by('-schema_version', '-pk').values('pk')[:1]
+        hints = {}
+        for start in range(0, len(names), 500):
+            hints.update(SchemaDefinition.objects.filter(
+                data_source__canonical_name__in=names[start:start + 500], data_source=Subquery(latest_version)
+            ).values_list('data_source__canonical_name', 'columns'))
+        for task in tasks:
+            if task['canonical_name'] in hints:
+                task['options']['column_hints'] = hints[task['canonical_name']]
+
+    def run(self, tasks, options):
+        start = time.perf_counter()
+        done = failed = 0
+        total_bytes = 0
+        versions = {}
+        batch = []
+
+        def flush():
+            nonlocal failed
+            if batch:
+                failed += self.write_batch(batch, versions)
+                batch.clear()
+
+        # Worker processes must not inherit open database connections
+        connections.close_all()
+        executor = None
+        if options['workers'] > 1:
+            executor = ProcessPoolExecutor(max_workers=options['workers'], initializer=init_worker)
+            results = executor.map(analyze_file_in_worker, tasks, chunksize=4)
+        else:
+            results = map(analyze_file, tasks)
+
+        try:
+            for result in results:
+                if 'metrics' in result:
+                    metrics.merge(result.pop('metrics'))
+                batch.append(result)
+                done += 1
+                total_bytes += result['size']
+
+                if len(batch) >= options['batch_size'] and done < len(tasks):
+                    flush()
+                    self.report(done, len(tasks), failed, total_bytes, start)
+            flush()
+        except KeyboardInterrupt:
+            # Keep what was already analyzed; the next run picks up the rest
+            flush()
+            self.stdout.write(self.style.WARNING("Interrupted - run the same command again to resume"))
+            raise
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+        self.report(done, len(tasks), failed, total_bytes, start)
+
+    def report(self, done, total, failed, total_bytes, start):
+        elapsed = max(time.perf_counter() - start, 1e-9)
+        self.stdout.write(
+            f"[{done}/{total}] {done / elapsed:.1f} files/s, "
+            f"{total_bytes / elapsed / 1024 / 1024:.1f} MB/s, {failed} failed"
+        )
+
+    def write_batch(self, results, versions):
+        """Write a batch of analyzed files in one transaction; returns the number that failed"""
+        ingested = [result for result in results if not result['error']]
+
+        try:
+            with transaction.atomic():
+                sources = []
+                for result in ingested:
+                    canonical_name = result['canonical_name']
+                    if canonical_name not in versions:
+                        versions[canonical_name] = DataSource.objects.filter(
+                            canonical_name=canonical_name
+                        ).aggregate(Max('schema_version'))['schema_version__max'] or 0
+                    versions[canonical_name] += 1
+
+                    sources.append(DataSource(
+                        original_filename=os.path.basename(result['path']),
+                        file=result['stored_name'],
+                        canonical_name=canonical_name,
+                        schema_version=versions[canonical_name],
+                        source_type=result['source_type']
+                    ))
+                save_analyses(sources, [result['analysis'] for result in ingested])
+
+                sources_by_path = {result['path']: source for source, result in zip(sources, ingested)}
+                IngestedFile.objects.bulk_create(
+                    [
+                        IngestedFile(
+                            path=result['path'],
+                            size=result['size'],
+                            mtime=result['mtime'],
+                            inode=result['inode'],
+                            data_source=sources_by_path.get(result['path']),
+                            status='failed' if result['error'] else 'ingested',
+                            error=result['error'],
+                            relationships_pending=not result['error']
+                        )
+                        for result in results
+                    ],
+                    update_conflicts=True,
+                    unique_fields=['path'],
+                    update_fields=['size', 'mtime', 'inode', 'data_source', 'status', 'error',
+                                   'relationships_pending', 'ingested_at']
+                )
+        except Exception:
+            # Nothing in this batch was recorded, so drop the copies and cached versions
+            for result in ingested:
+                default_storage.delete(result['stored_name'])
+                default_storage.delete(index_name(result['stored_name']))
+            versions.clear()
+            raise
+
+        for result in results:
+            if result['error']:
+                self.stderr.write(f"Failed: {result['path']}: {result['error']}")
+
+        return len(results) - len(ingested)
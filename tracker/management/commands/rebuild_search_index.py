@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from tracker.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the column search index from every schema in the catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        indexed = rebuild_index(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} schemas"))
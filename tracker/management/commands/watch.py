@@ -0,0 +1,133 @@
+import os
+import time
+
+from django.db import close_old_connections
+
+from tracker.models import IngestedFile
+from .ingest import Command as IngestCommand
+
+
+class Command(IngestCommand):
+    help = """
+    Watch directories and ingest new or changed files as new versions of their
+    canonical name, with the same options and mapping rules as ingest.
+
+    Each scan only stats files: one whose (size, mtime, inode) matches what was
+    last ingested from its path is never opened. The stat cache is loaded from
+    the ingest records once, at startup. A changed file waits until it has
+    gone unchanged for --debounce seconds, so files still being written aren't
+    read half way, and at most --max-files are ingested per scan; the rest wait
+    for the next one.
+    """
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--interval', type=float, default=10, help='Seconds between scans')
+        parser.add_argument('--debounce', type=float, default=30,
+                            help='Seconds a file must go unchanged before it is ingested')
+        parser.add_argument('--max-files', type=int, default=100, help='Most files ingested per scan')
+        parser.add_argument('--once', action='store_true', help='Scan once and exit')
+
+    def handle(self, *args, **options):
+        rules = self.load_rules(options['rules']) if options['rules'] else []
+
+        # path -> (size, mtime, inode) of what was last ingested (or failed) from it
+        self.stat_cache = {
+            path: (size, mtime, inode)
+            for path, size, mtime, inode, status in IngestedFile.objects.values_list(
+                'path', 'size', 'mtime', 'inode', 'status'
+            ).iterator()
+            if status == 'ingested' or not options['retry_failed']
+        }
+        # path -> ((size, mtime, inode), when it was last seen changing) for changed files not yet ingested
+        self.changing = {}
+
+        self.stdout.write(f"Watching {', '.join(options['paths'])} ({len(self.stat_cache)} files known)")
+        try:
+            while True:
+                close_old_connections()
+                try:
+                    self.scan(options, rules)
+                except KeyboardInterrupt:
+                    raise
+                except Exception as e:
+                    # Nothing from the failed batch was recorded, so its files are retried next scan
+                    self.stderr.write(f"Scan failed: {type(e).__name__}: {e}")
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write("Stopped watching")
+
+    def scan(self, options, rules):
+        """Ingest the files that changed and have settled since the last scan"""
+        now = time.time()
+        ready = []
+        seen = set()
+        for relative_path, path in self.discover(options['paths']):
+            if path in seen:
+                continue
+            seen.add(path)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            signature = (stat.st_size, stat.st_mtime, stat.st_ino)
+            if self.stat_cache.get(path) == signature:
+                continue
+
+            previous = self.changing.get(path)
+            if previous is None or previous[0] != signature:
+                # Quiet since its mtime when first seen, since now if it changed between scans
+                self.changing[path] = previous = (signature, now if previous else stat.st_mtime)
+            if now - previous[1] >= options['debounce']:
+                ready.append((relative_path, path, signature))
+
+        # Forget files deleted before they settled
+        for path in self.changing.keys() - seen:
+            del self.changing[path]
+
+        if not ready:
+            return
+
+        # Another process (say a manual ingest run) may have taken some already
+        ingested = {}
+        paths = [path for _, path, _ in ready]
+        for start in range(0, len(paths), 500):
+            ingested.update(
+                (path, (size, mtime, inode)) for path, size, mtime, inode in IngestedFile.objects.filter(
+                    path__in=paths[start:start + 500]
+                ).values_list('path', 'size', 'mtime', 'inode')
+            )
+
+        tasks = []
+        for relative_path, path, (size, mtime, inode) in ready:
+            if ingested.get(path) == (size, mtime, inode):
+                self.settle(path, ingested[path])
+                continue
+            task = self.make_task(relative_path, path, options, rules)
+            if task is None:
+                self.settle(path, (size, mtime, inode))
+                continue
+            task.update(size=size, mtime=mtime, inode=inode)
+            tasks.append(task)
+
+        # Oldest first, so schema versions follow file history
+        tasks.sort(key=lambda task: task['mtime'])
+        waiting = len(tasks) - options['max_files']
+        tasks = tasks[:options['max_files']]
+        if not tasks:
+            return
+
+        self.add_column_hints(tasks)
+        self.stdout.write(f"Ingesting {len(tasks)} changed files" + (f", {waiting} waiting" if waiting > 0 else ""))
+        self.run(tasks, options)
+        for task in tasks:
+            self.settle(task['path'], (task['size'], task['mtime'], task['inode']))
+
+        if not options['skip_relationships']:
+            self.detect_relationships()
+
+    def settle(self, path, signature):
+        self.stat_cache[path] = signature
+        self.changing.pop(path, None)
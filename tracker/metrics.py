@@ -0,0 +1,171 @@
+import resource
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+
+from django.db import connections
+
+# Upper bounds of the stage duration histogram buckets, in seconds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+# name -> (type, help text) for everything we expose
+METRICS = {
+    'tracker_ingest_stage_duration_seconds': ('histogram', 'Time spent in each ingest stage'),
+    'tracker_ingest_stage_queries_total': ('counter', 'Database queries run by each ingest stage'),
+    'tracker_ingest_stage_errors_total': ('counter', 'Ingest stages that raised an exception'),
+    'tracker_ingest_process_max_rss_bytes': (
+        'gauge', 'High-water mark of resident memory of the processes that ran each stage, since they started '
+                 '(not the memory the stage used)'
+    ),
+    'tracker_ingest_files_read_total': ('counter', 'Files parsed by the ingest pipeline'),
+    'tracker_ingest_bytes_read_total': ('counter', 'Bytes of files parsed by the ingest pipeline'),
+    'tracker_ingest_rows_total': ('counter', 'Rows analyzed by the ingest pipeline'),
+    'tracker_ingest_columns_total': ('counter', 'Columns analyzed by the ingest pipeline'),
+}
+
+_lock = threading.Lock()
+_values = defaultdict(float)  # (name, labels) -> counter or gauge value
+_histograms = {}  # (name, labels) -> [count per bucket..., count in +Inf, sum]
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+def peak_rss_bytes():
+    # ru_maxrss is in kilobytes on Linux but bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def increment(name, value=1, **labels):
+    with _lock:
+        _values[name, _labels(labels)] += value
+
+
+def set_gauge(name, value, **labels):
+    with _lock:
+        _values[name, _labels(labels)] = value
+
+
+def observe(name, value, **labels):
+    with _lock:
+        buckets = _histograms.setdefault((name, _labels(labels)), [0] * (len(DURATION_BUCKETS) + 2))
+        for position, bound in enumerate(DURATION_BUCKETS):
+            if value <= bound:
+                buckets[position] += 1
+                break
+        else:
+            buckets[len(DURATION_BUCKETS)] += 1
+        buckets[-1] += value
+
+
+@contextmanager
+def stage(name):
+    """
+    Time an ingest stage and count the database queries it runs, on the
+    primary and the read replicas alike. Works as a context manager or as a
+    decorator.
+    """
+    queries = 0
+
+    def count_queries(execute, sql, params, many, context):
+        nonlocal queries
+        queries += 1
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(count_queries))
+            yield
+    except Exception:
+        increment('tracker_ingest_stage_errors_total', stage=name)
+        raise
+    finally:
+        observe('tracker_ingest_stage_duration_seconds', time.perf_counter() - start, stage=name)
+        increment('tracker_ingest_stage_queries_total', queries, stage=name)
+        set_gauge('tracker_ingest_process_max_rss_bytes', peak_rss_bytes(), stage=name)
+
+
+def collect():
+    """
+    Take the metrics recorded in this process so far, leaving none. A worker
+    process sends them back with its result for the parent to merge().
+    """
+    with _lock:
+        collected = (dict(_values), dict(_histograms))
+        _values.clear()
+        _histograms.clear()
+    return collected
+
+
+def merge(collected):
+    """Add metrics collected in a worker: counters and histograms add up, gauges keep the highest"""
+    values, histograms = collected
+    with _lock:
+        for (name, labels), value in values.items():
+            if METRICS[name][0] == 'gauge':
+                _values[name, labels] = max(_values.get((name, labels), value), value)
+            else:
+                _values[name, labels] += value
+        for key, buckets in histograms.items():
+            merged = _histograms.setdefault(key, [0] * len(buckets))
+            for position, count in enumerate(buckets):
+                merged[position] += count
+
+
+def _format_value(value):
+    # Large counters (bytes) would lose digits in exponent notation
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+
+def render_metrics():
+    """All metrics in the Prometheus text exposition format"""
+    with _lock:
+        values = dict(_values)
+        histograms = {key: list(buckets) for key, buckets in _histograms.items()}
+
+    lines = []
+    for name, (metric_type, help_text) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+
+        if metric_type == 'histogram':
+            for (metric, labels), buckets in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(DURATION_BUCKETS, buckets):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+                cumulative += buckets[len(DURATION_BUCKETS)]
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(buckets[-1])}")
+                lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+        else:
+            for (metric, labels), value in sorted(values.items()):
+                if metric == name:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+    lines.append("# HELP process_max_resident_memory_bytes Peak resident memory of the process")
+    lines.append("# TYPE process_max_resident_memory_bytes gauge")
+    lines.append(f"process_max_resident_memory_bytes {peak_rss_bytes()}")
+    return '\n'.join(lines) + '\n'
+
+
+def reset_metrics():
+    with _lock:
+        _values.clear()
+        _histograms.clear()
@@ -0,0 +1,58 @@
+# Generated by Django 5.1.7 on 2026-10-19 01:05
+
+import os
+import re
+
+from django.db import migrations, models
+
+# A frozen copy of tracker.similarity.normalize_filename, so this migration
+# gives the same results however that function changes later
+DATE_PATTERN = re.compile(r'(?<!\d)(\d{4}[-_.]?\d{2}[-_.]?\d{2}|\d{2}[-_.]\d{2}[-_.]\d{4})(?!\d)')
+VERSION_PATTERN = re.compile(
+    r'((?:^|[\s_\-.]+)(v|ver|version)[\s_\-.]?\d+(\.\d+)*|\s*\(\d+\)|(?:^|[\s_\-.]+)(final|latest|copy))$'
+)
+SEPARATOR_PATTERN = re.compile(r'[\s_\-.]+')
+
+
+def normalize_filename(filename):
+    if not filename:
+        return ''
+
+    name = os.path.basename(filename).lower()
+    while True:
+        name, extension = os.path.splitext(name)
+        if not extension:
+            break
+    stem = name
+
+    name = DATE_PATTERN.sub(' ', name)
+    previous = None
+    while previous != name:
+        previous = name
+        name = VERSION_PATTERN.sub('', name.strip(' _-.'))
+
+    return SEPARATOR_PATTERN.sub(' ', name).strip() or SEPARATOR_PATTERN.sub(' ', stem).strip()
+
+
+def populate_normalized_filename(apps, schema_editor):
+    DataSource = apps.get_model('tracker', 'DataSource')
+    sources = list(DataSource.objects.only('pk', 'original_filename'))
+    for source in sources:
+        source.normalized_filename = normalize_filename(source.original_filename)
+    DataSource.objects.bulk_update(sources, ['normalized_filename'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='datasource',
+            name='normalized_filename',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.RunPython(populate_normalized_filename, migrations.RunPython.noop),
+    ]
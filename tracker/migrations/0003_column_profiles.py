@@ -0,0 +1,32 @@
+# Generated by Django 5.1.7 on 2026-10-19 01:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0002_datasource_normalized_filename'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='schemarelationship',
+            name='details',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='ColumnProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('column_name', models.CharField(max_length=255)),
+                ('distinct_count', models.IntegerField(default=0)),
+                ('uniqueness_ratio', models.FloatField(default=0.0)),
+                ('minhash', models.BinaryField()),
+                ('bloom_filter', models.BinaryField(blank=True, null=True)),
+                ('bloom_hash_count', models.IntegerField(default=0)),
+                ('schema', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='column_profiles', to='tracker.schemadefinition')),
+            ],
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.7 on 2026-10-19 01:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0003_column_profiles'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestedFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=1024, unique=True)),
+                ('size', models.BigIntegerField()),
+                ('mtime', models.FloatField()),
+                ('inode', models.BigIntegerField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('ingested', 'Ingested'), ('failed', 'Failed')], max_length=20)),
+                ('error', models.TextField(blank=True, default='')),
+                ('relationships_pending', models.BooleanField(default=False)),
+                ('ingested_at', models.DateTimeField(auto_now=True)),
+                ('data_source', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ingested_files', to='tracker.datasource')),
+            ],
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.7 on 2026-10-19 01:18
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0004_ingestedfile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('original_filename', models.CharField(max_length=255)),
+                ('canonical_name', models.CharField(max_length=255)),
+                ('source_type', models.CharField(choices=[('csv', 'CSV'), ('excel', 'Excel'), ('json', 'JSON'), ('other', 'Other')], default='csv', max_length=20)),
+                ('options', models.JSONField(blank=True, default=dict)),
+                ('file_name', models.CharField(max_length=1024)),
+                ('size', models.BigIntegerField()),
+                ('received', models.BigIntegerField(default=0)),
+                ('chunk_digests', models.JSONField(blank=True, default=list)),
+                ('checksum', models.CharField(blank=True, default='', max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('data_source', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='upload_sessions', to='tracker.datasource')),
+            ],
+        ),
+    ]
@@ -0,0 +1,130 @@
+# Generated by Django 5.1.7 on 2026-10-19 01:36
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Frozen copies of tracker.search as it was when this migration was written
+FTS_TABLE = 'tracker_schemasearchdocument_fts'
+SAMPLE_VALUES_PER_COLUMN = 3
+SAMPLE_VALUE_LENGTH = 100
+
+WORD_RE = re.compile(r'[^\W_]+')
+
+
+def identifier_words(name):
+    name = re.sub(r'([a-z0-9])([A-Z])', r'\1 \2', str(name))
+    name = re.sub(r'([A-Z]+)([A-Z][a-z])', r'\1 \2', name)
+    return WORD_RE.findall(name.lower())
+
+
+def document_fields(column_definitions, datasource):
+    column_names = []
+    sample_values = []
+    for column, details in (column_definitions or {}).items():
+        column_names.append(str(column))
+        words = identifier_words(column)
+        if words != [str(column).lower()]:
+            column_names.extend(words)
+        for value in (details.get('sample_values') or [])[:SAMPLE_VALUES_PER_COLUMN]:
+            sample_values.append(str(value)[:SAMPLE_VALUE_LENGTH])
+
+    return {
+        'column_names': ' '.join(column_names),
+        'canonical_name': ' '.join([datasource.canonical_name] + identifier_words(datasource.canonical_name)),
+        'filename': ' '.join([datasource.original_filename] + identifier_words(datasource.original_filename)),
+        'sample_values': ' '.join(sample_values),
+    }
+
+SQLITE_INDEX = [
+    f"""CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        column_names, canonical_name, filename, sample_values,
+        content='tracker_schemasearchdocument', content_rowid='schema_id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    # Keep the external content index in step with the documents table
+    f"""CREATE TRIGGER tracker_schemasearch_insert AFTER INSERT ON tracker_schemasearchdocument BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, column_names, canonical_name, filename, sample_values)
+        VALUES (new.schema_id, new.column_names, new.canonical_name, new.filename, new.sample_values);
+    END""",
+    f"""CREATE TRIGGER tracker_schemasearch_delete AFTER DELETE ON tracker_schemasearchdocument BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, column_names, canonical_name, filename, sample_values)
+        VALUES ('delete', old.schema_id, old.column_names, old.canonical_name, old.filename, old.sample_values);
+    END""",
+    f"""CREATE TRIGGER tracker_schemasearch_update AFTER UPDATE ON tracker_schemasearchdocument BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, column_names, canonical_name, filename, sample_values)
+        VALUES ('delete', old.schema_id, old.column_names, old.canonical_name, old.filename, old.sample_values);
+        INSERT INTO {FTS_TABLE}(rowid, column_names, canonical_name, filename, sample_values)
+        VALUES (new.schema_id, new.column_names, new.canonical_name, new.filename, new.sample_values);
+    END""",
+]
+
+POSTGRESQL_INDEX = [
+    """ALTER TABLE tracker_schemasearchdocument ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', column_names), 'A') ||
+        setweight(to_tsvector('simple', canonical_name), 'B') ||
+        setweight(to_tsvector('simple', filename), 'C') ||
+        setweight(to_tsvector('simple', sample_values), 'D')
+    ) STORED""",
+    "CREATE INDEX tracker_schemasearch_vector ON tracker_schemasearchdocument USING GIN (search_vector)",
+]
+
+
+def create_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            if not cursor.fetchone()[0]:
+                # Search falls back to scanning the documents table
+                return
+        statements = SQLITE_INDEX
+    elif connection.vendor == 'postgresql':
+        statements = POSTGRESQL_INDEX
+    else:
+        return
+
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for trigger in ['insert', 'delete', 'update']:
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS tracker_schemasearch_{trigger}")
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+def index_existing_schemas(apps, schema_editor):
+    SchemaDefinition = apps.get_model('tracker', 'SchemaDefinition')
+    SchemaSearchDocument = apps.get_model('tracker', 'SchemaSearchDocument')
+    SchemaSearchDocument.objects.bulk_create(
+        (
+            SchemaSearchDocument(schema=schema, **document_fields(schema.column_definitions, schema.data_source))
+            for schema in SchemaDefinition.objects.select_related('data_source').iterator()
+        ),
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0005_uploadsession'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SchemaSearchDocument',
+            fields=[
+                ('schema', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='tracker.schemadefinition')),
+                ('column_names', models.TextField()),
+                ('canonical_name', models.CharField(max_length=255)),
+                ('filename', models.CharField(max_length=255)),
+                ('sample_values', models.TextField(blank=True, default='')),
+            ],
+        ),
+        migrations.RunPython(create_index, drop_index),
+        migrations.RunPython(index_existing_schemas, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 5.1.7 on 2026-10-19 01:51
+
+import django.db.models.deletion
+import tracker.models
+from django.db import migrations, models
+
+BATCH_SIZE = 500
+
+
+def split_column_definitions(apps, schema_editor):
+    SchemaDefinition = apps.get_model('tracker', 'SchemaDefinition')
+    SchemaSamples = apps.get_model('tracker', 'SchemaSamples')
+
+    schemas = []
+    for schema in SchemaDefinition.objects.order_by('pk').iterator(chunk_size=BATCH_SIZE):
+        definitions = schema.column_definitions or {}
+        schema.columns = [[name, details.get('type')] for name, details in definitions.items()]
+        schema.sample_values = [details.get('sample_values', []) for details in definitions.values()]
+        schemas.append(schema)
+        if len(schemas) == BATCH_SIZE:
+            save_split(SchemaDefinition, SchemaSamples, schemas)
+            schemas = []
+    save_split(SchemaDefinition, SchemaSamples, schemas)
+
+
+def save_split(SchemaDefinition, SchemaSamples, schemas):
+    SchemaDefinition.objects.bulk_update(schemas, ['columns'])
+    SchemaSamples.objects.bulk_create(
+        [SchemaSamples(schema_id=schema.pk, sample_values=schema.sample_values) for schema in schemas]
+    )
+
+
+def join_column_definitions(apps, schema_editor):
+    SchemaDefinition = apps.get_model('tracker', 'SchemaDefinition')
+    SchemaSamples = apps.get_model('tracker', 'SchemaSamples')
+
+    schemas = []
+    for schema in SchemaDefinition.objects.order_by('pk').iterator(chunk_size=BATCH_SIZE):
+        samples = SchemaSamples.objects.filter(schema_id=schema.pk).values_list('sample_values', flat=True).first()
+        samples = samples or []
+        schema.column_definitions = {
+            name: {'type': column_type, 'sample_values': samples[position] if position < len(samples) else []}
+            for position, (name, column_type) in enumerate(schema.columns)
+        }
+        schemas.append(schema)
+        if len(schemas) == BATCH_SIZE:
+            SchemaDefinition.objects.bulk_update(schemas, ['column_definitions'])
+            schemas = []
+    SchemaDefinition.objects.bulk_update(schemas, ['column_definitions'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0006_search'),
+    ]
+
+    operations = [
+        # Nullable while it's dropped, so that unapplying can add it back before refilling it
+        migrations.AlterField(
+            model_name='schemadefinition',
+            name='column_definitions',
+            field=models.JSONField(null=True),
+        ),
+        migrations.AddField(
+            model_name='schemadefinition',
+            name='columns',
+            field=models.JSONField(default=list, encoder=tracker.models.CompactJSONEncoder),
+        ),
+        migrations.CreateModel(
+            name='SchemaSamples',
+            fields=[
+                ('schema', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='samples', serialize=False, to='tracker.schemadefinition')),
+                ('sample_values', models.JSONField(default=list, encoder=tracker.models.CompactJSONEncoder)),
+            ],
+        ),
+        migrations.RunPython(split_column_definitions, join_column_definitions),
+        migrations.RemoveField(
+            model_name='schemadefinition',
+            name='column_definitions',
+        ),
+    ]
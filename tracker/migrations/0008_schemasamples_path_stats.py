@@ -0,0 +1,19 @@
+# Generated by Django 5.1.7 on 2026-10-19 02:04
+
+import tracker.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0007_split_column_definitions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='schemasamples',
+            name='path_stats',
+            field=models.JSONField(default=dict, encoder=tracker.models.CompactJSONEncoder),
+        ),
+    ]
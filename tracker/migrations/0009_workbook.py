@@ -0,0 +1,34 @@
+# Generated by Django 5.1.7 on 2026-10-19 02:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0008_schemasamples_path_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Workbook',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('original_filename', models.CharField(max_length=255)),
+                ('upload_date', models.DateTimeField(auto_now_add=True)),
+                ('file', models.FileField(upload_to='uploads/%Y/%m/%d/')),
+                ('canonical_name', models.CharField(max_length=255)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='datasource',
+            name='sheet_name',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='datasource',
+            name='workbook',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='sheets', to='tracker.workbook'),
+        ),
+    ]
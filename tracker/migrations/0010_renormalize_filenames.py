@@ -0,0 +1,28 @@
+from importlib import import_module
+
+from django.db import migrations
+
+# The frozen normalize_filename, which no longer cuts version words out of names like ipv4
+normalize_filename = import_module('tracker.migrations.0002_datasource_normalized_filename').normalize_filename
+
+
+def renormalize_filenames(apps, schema_editor):
+    DataSource = apps.get_model('tracker', 'DataSource')
+    changed = []
+    for source in DataSource.objects.only('pk', 'original_filename', 'normalized_filename').iterator():
+        normalized = normalize_filename(source.original_filename)
+        if normalized != source.normalized_filename:
+            source.normalized_filename = normalized
+            changed.append(source)
+    DataSource.objects.bulk_update(changed, ['normalized_filename'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0009_workbook'),
+    ]
+
+    operations = [
+        migrations.RunPython(renormalize_filenames, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,67 @@
+from importlib import import_module
+
+from django.db import migrations
+
+# The frozen identifier_words of the search index
+identifier_words = import_module('tracker.migrations.0006_search').identifier_words
+
+BATCH_SIZE = 1000
+COLUMN_SEPARATOR = ' \ue000 '
+
+
+def search_vector(column_names):
+    return f"""ALTER TABLE tracker_schemasearchdocument ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', {column_names}), 'A') ||
+        setweight(to_tsvector('simple', canonical_name), 'B') ||
+        setweight(to_tsvector('simple', filename), 'C') ||
+        setweight(to_tsvector('simple', sample_values), 'D')
+    ) STORED"""
+
+
+def column_names(columns, separator):
+    names = []
+    for name, _ in columns:
+        words = identifier_words(name)
+        names.append(' '.join([str(name)] + (words if words != [str(name).lower()] else [])))
+    return separator.join(names)
+
+
+def reindex_column_names(apps, schema_editor, separator, column_expression):
+    SchemaSearchDocument = apps.get_model('tracker', 'SchemaSearchDocument')
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute("ALTER TABLE tracker_schemasearchdocument DROP COLUMN search_vector")
+        schema_editor.execute(search_vector(column_expression))
+        schema_editor.execute(
+            "CREATE INDEX tracker_schemasearch_vector ON tracker_schemasearchdocument USING GIN (search_vector)"
+        )
+
+    # The SQLite triggers bring the full-text index along
+    documents = []
+    for document in SchemaSearchDocument.objects.select_related('schema').only(
+            'schema_id', 'column_names', 'schema__columns').iterator(chunk_size=BATCH_SIZE):
+        document.column_names = column_names(document.schema.columns, separator)
+        documents.append(document)
+        if len(documents) == BATCH_SIZE:
+            SchemaSearchDocument.objects.bulk_update(documents, ['column_names'])
+            documents = []
+    SchemaSearchDocument.objects.bulk_update(documents, ['column_names'])
+
+
+def separate_columns(apps, schema_editor):
+    # PostgreSQL's parser drops the private use character, so it indexes a signed number in its place
+    reindex_column_names(apps, schema_editor, COLUMN_SEPARATOR, "replace(column_names, U&'\\E000', '-1')")
+
+
+def join_columns(apps, schema_editor):
+    reindex_column_names(apps, schema_editor, ' ', 'column_names')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0010_renormalize_filenames'),
+    ]
+
+    operations = [
+        migrations.RunPython(separate_columns, join_columns),
+    ]
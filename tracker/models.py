@@ -1,6 +1,29 @@
 from django.db import models
 from django.contrib.auth.models import User
 import json
+import uuid
+from django.utils.functional import cached_property
+from .similarity import normalize_filename
+
+class CompactJSONEncoder(json.JSONEncoder):
+    """Encodes without the spaces after separators, which add up over thousands of list items"""
+
+    def __init__(self, *args, **kwargs):
+        kwargs['separators'] = (',', ':')
+        super().__init__(*args, **kwargs)
+
+class Workbook(models.Model):
+    """
+    An Excel workbook ingested sheet by sheet: each sheet is a DataSource
+    pointing at the workbook's file.
+    """
+    original_filename = models.CharField(max_length=255)
+    upload_date = models.DateTimeField(auto_now_add=True)
+    file = models.FileField(upload_to='uploads/%Y/%m/%d/')
+    canonical_name = models.CharField(max_length=255)
+
+    def __str__(self):
+        return f"{self.canonical_name} ({self.original_filename})"
 
 class DataSource(models.Model):
     """
@@ -17,29 +40,141 @@ class DataSource(models.Model):
         ('json', 'JSON'),
         ('other', 'Other')
     ], default='csv')
+    # Precomputed by normalize_filename() for batched filename similarity
+    normalized_filename = models.CharField(max_length=255, blank=True, default='')
+    # Set for the sheets of a workbook ingested as a whole
+    workbook = models.ForeignKey(Workbook, on_delete=models.CASCADE, null=True, blank=True, related_name='sheets')
+    sheet_name = models.CharField(max_length=255, blank=True, default='')
 
     def __str__(self):
         return f"{self.canonical_name} v{self.schema_version} ({self.original_filename})"
 
+    def save(self, *args, **kwargs):
+        self.normalized_filename = normalize_filename(self.original_filename)
+        super().save(*args, **kwargs)
+
 class SchemaDefinition(models.Model):
     """
     Stores the schema details of a data source.
+
+    Column names and types are kept in a compact list that is cheap to decode;
+    sample values, which make up most of the bulk, are kept apart in
+    SchemaSamples and only loaded when asked for.
     """
     data_source = models.OneToOneField(DataSource, on_delete=models.CASCADE, related_name='schema')
     detected_date = models.DateTimeField(auto_now_add=True)
-    column_definitions = models.JSONField()  # Stores column names, types, etc.
+    columns = models.JSONField(default=list, encoder=CompactJSONEncoder)  # [[name, type], ...] in file order
     row_count = models.IntegerField(default=0)
 
+    # Sample values set through column_definitions, or loaded by get_sample_values(); path stats likewise
+    _sample_values = None
+    _path_stats = None
+    _samples_changed = False
+
     def __str__(self):
         return f"Schema for {self.data_source}"
 
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        if self._samples_changed:
+            if adding:
+                SchemaSamples.objects.create(schema=self, sample_values=self._sample_values or [],
+                                             path_stats=self._path_stats or {})
+            else:
+                defaults = {'sample_values': self._sample_values, 'path_stats': self._path_stats}
+                SchemaSamples.objects.update_or_create(
+                    schema=self, defaults={name: value for name, value in defaults.items() if value is not None}
+                )
+            self._samples_changed = False
+
     def get_columns(self):
         """Returns a list of column names"""
-        return list(self.column_definitions.keys())
+        return [name for name, _ in self.columns]
+
+    @cached_property
+    def column_types(self):
+        """Column name -> type"""
+        return dict(self.columns)
 
     def get_column_type(self, column_name):
         """Returns the type of a specific column"""
-        return self.column_definitions.get(column_name, {}).get('type')
+        return self.column_types.get(column_name)
+
+    def get_sample_values(self):
+        """Sample values of each column, in column order. A query unless samples were select_related"""
+        if self._sample_values is None:
+            try:
+                self._sample_values = self.samples.sample_values
+            except SchemaSamples.DoesNotExist:
+                self._sample_values = []
+        return self._sample_values
+
+    @staticmethod
+    def build_column_definitions(columns, sample_values=None):
+        """{name: {'type': ..., 'sample_values': [...]}} from the split storage; no samples if sample_values is None"""
+        if sample_values is None:
+            return {name: {'type': column_type} for name, column_type in columns}
+        return {
+            name: {'type': column_type,
+                   'sample_values': sample_values[position] if position < len(sample_values) else []}
+            for position, (name, column_type) in enumerate(columns)
+        }
+
+    def get_column_definitions(self, sample_values=True):
+        """The column definitions, without loading the samples if sample_values is False"""
+        return self.build_column_definitions(self.columns, self.get_sample_values() if sample_values else None)
+
+    @property
+    def path_stats(self):
+        """Per-path stats of a JSON source's flattened columns (see Flattener.summary()), {} for other sources"""
+        if self._path_stats is None:
+            try:
+                self._path_stats = self.samples.path_stats
+            except SchemaSamples.DoesNotExist:
+                self._path_stats = {}
+        return self._path_stats
+
+    @path_stats.setter
+    def path_stats(self, path_stats):
+        self._path_stats = path_stats
+        self._samples_changed = True
+
+    @property
+    def column_definitions(self):
+        return self.get_column_definitions()
+
+    @column_definitions.setter
+    def column_definitions(self, column_definitions):
+        # Also works as a keyword argument, SchemaDefinition(column_definitions=...)
+        self.columns = [[name, details.get('type')] for name, details in column_definitions.items()]
+        self._sample_values = [details.get('sample_values', []) for details in column_definitions.values()]
+        self._samples_changed = True
+        self.__dict__.pop('column_types', None)
+
+class SchemaSamples(models.Model):
+    """
+    Sample values of a schema's columns, and the path stats of a JSON source,
+    kept out of SchemaDefinition so that code needing only column names and
+    types doesn't load them.
+    """
+    schema = models.OneToOneField(SchemaDefinition, on_delete=models.CASCADE, primary_key=True,
+                                  related_name='samples')
+    sample_values = models.JSONField(default=list, encoder=CompactJSONEncoder)  # One list per column, in SchemaDefinition.columns order
+    path_stats = models.JSONField(default=dict, encoder=CompactJSONEncoder)
+
+    def __str__(self):
+        return f"Sample values for {self.schema_id}"
+
+    @classmethod
+    def create_for(cls, schemas):
+        """Store the sample values of schemas made with bulk_create(), which skips save()"""
+        cls.objects.bulk_create([
+            cls(schema=schema, sample_values=schema.get_sample_values(), path_stats=schema._path_stats or {})
+            for schema in schemas
+        ])
+        for schema in schemas:
+            schema._samples_changed = False
 
 class PrimaryKeyCandidate(models.Model):
     """
@@ -90,6 +225,89 @@ class SchemaRelationship(models.Model):
     source_columns = models.JSONField(null=True, blank=True)  # Columns in source involved in relationship
     target_columns = models.JSONField(null=True, blank=True)  # Columns in target involved in relationship
     similarity_score = models.FloatField(default=0.0)  # How similar are the schemas (0.0-1.0)
+    details = models.JSONField(null=True, blank=True)  # How the relationship was found, e.g. value containment
+
+    def __str__(self):
+        return f"{self.source_schema} -> {self.target_schema} ({self.relationship_type})"
+
+class ColumnProfile(models.Model):
+    """
+    Compact summary of the distinct values in a column, used to discover
+    inclusion dependencies (foreign keys) without re-reading files.
+    """
+    schema = models.ForeignKey(SchemaDefinition, on_delete=models.CASCADE, related_name='column_profiles')
+    column_name = models.CharField(max_length=255)
+    distinct_count = models.IntegerField(default=0)
+    uniqueness_ratio = models.FloatField(default=0.0)  # Distinct values / non-null values
+    minhash = models.BinaryField()  # MinHash signature of the distinct values
+    bloom_filter = models.BinaryField(null=True, blank=True)  # Only kept for columns unique enough to be referenced
+    bloom_hash_count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.column_name} ({self.distinct_count} distinct values)"
+
+class IngestedFile(models.Model):
+    """
+    Remembers files picked up from disk by the ingest command, so interrupted
+    or repeated runs skip files that haven't changed since.
+    """
+    path = models.CharField(max_length=1024, unique=True)
+    size = models.BigIntegerField()
+    mtime = models.FloatField()
+    inode = models.BigIntegerField(null=True, blank=True)
+    data_source = models.ForeignKey(DataSource, on_delete=models.SET_NULL, null=True, blank=True,
+                                    related_name='ingested_files')
+    status = models.CharField(max_length=20, choices=[
+        ('ingested', 'Ingested'),
+        ('failed', 'Failed')
+    ])
+    error = models.TextField(blank=True, default='')
+    relationships_pending = models.BooleanField(default=False)  # Relationship detection still to run
+    ingested_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.path} ({self.status})"
+
+class UploadSession(models.Model):
+    """
+    A resumable chunked upload. Chunks are hashed as they arrive, then written
+    into the file's final place in media storage, in order.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    original_filename = models.CharField(max_length=255)
+    canonical_name = models.CharField(max_length=255)
+    source_type = models.CharField(max_length=20, choices=DataSource._meta.get_field('source_type').choices,
+                                   default='csv')
+    options = models.JSONField(default=dict, blank=True)  # Read options (delimiter, encoding, sheet_name)
+    file_name = models.CharField(max_length=1024)  # Name of the file in media storage
+    size = models.BigIntegerField()  # Total bytes expected
+    received = models.BigIntegerField(default=0)  # Bytes stored so far
+    chunk_digests = models.JSONField(default=list, blank=True)  # SHA-256 of each stored chunk, in order
+    checksum = models.CharField(max_length=64, blank=True, default='')  # SHA-256 of the chunk digests, in order
+    data_source = models.ForeignKey(DataSource, on_delete=models.SET_NULL, null=True, blank=True,
+                                    related_name='upload_sessions')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.original_filename} ({self.received}/{self.size} bytes)"
+
+    @property
+    def is_complete(self):
+        return self.received >= self.size
+
+class SchemaSearchDocument(models.Model):
+    """
+    The searchable text of a schema, kept up to date by tracker/search.py.
+    On SQLite it's indexed by an FTS5 table and on PostgreSQL by a tsvector
+    column with a GIN index, both created by migration 0006.
+    """
+    schema = models.OneToOneField(SchemaDefinition, on_delete=models.CASCADE, primary_key=True,
+                                  related_name='search_document')
+    column_names = models.TextField()  # Column names, each followed by its words if it's camelCase or snake_case
+    canonical_name = models.CharField(max_length=255)
+    filename = models.CharField(max_length=255)
+    sample_values = models.TextField(blank=True, default='')
 
     def __str__(self):
-        return f"{self.source_schema} -> {self.target_schema} ({self.relationship_type})"
\ No newline at end of file
+        return f"Search document for {self.filename}"
@@ -0,0 +1,164 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import time
+import uuid
+from contextlib import ExitStack
+from datetime import datetime
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.urls import Resolver404, resolve
+
+PROFILE_QUERY_PARAM = 'profile'
+PROFILE_HEADER = 'HTTP_X_PROFILE'  # X-Profile, as it appears in request.META
+PROFILE_STATS_LINES = 60  # Functions shown in the saved stats summary
+
+
+def profile_dir():
+    return getattr(settings, 'PROFILING_DIR', os.path.join(settings.BASE_DIR, 'profiles'))
+
+
+def profile_path(profile_id, extension):
+    # Profile ids are generated by us, but they come back in URLs
+    if not profile_id.replace('-', '').isalnum():
+        raise ValueError(f"Invalid profile id: {profile_id}")
+    return os.path.join(profile_dir(), f"{profile_id}.{extension}")
+
+
+def list_profiles():
+    """Metadata of the saved profiles, most recent first"""
+    directory = profile_dir()
+    if not os.path.isdir(directory):
+        return []
+
+    profiles = []
+    for filename in os.listdir(directory):
+        if not filename.endswith('.json') or filename.endswith('.detail.json'):
+            continue
+        try:
+            with open(os.path.join(directory, filename)) as f:
+                profiles.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return sorted(profiles, key=lambda profile: profile['started'], reverse=True)
+
+
+def load_profile(profile_id):
+    """Metadata of one saved profile along with its query log and stats summary"""
+    with open(profile_path(profile_id, 'json')) as f:
+        profile = json.load(f)
+    with open(profile_path(profile_id, 'detail.json')) as f:
+        profile.update(json.load(f))
+    return profile
+
+
+def is_async_view(request):
+    try:
+        return iscoroutinefunction(resolve(request.path_info).func)
+    except Resolver404:
+        return False
+
+
+def prune_profiles(keep):
+    """Delete all but the most recent profiles"""
+    for profile in list_profiles()[keep:]:
+        for extension in ('json', 'detail.json', 'prof'):
+            try:
+                os.remove(profile_path(profile['id'], extension))
+            except OSError:
+                pass
+
+
+class ProfilingMiddleware:
+    """
+    Profiles single requests on demand: a staff user adds ?profile=1 to the URL
+    (or sends an X-Profile header) and the request is run under cProfile with
+    every SQL query recorded. The results are saved to PROFILING_DIR and can be
+    browsed at /profiles/.
+
+    Only installed when PROFILING_ENABLED is set; other requests only pay for
+    checking the query string and header.
+
+    Async views aren't profiled: cProfile only sees the thread it runs on, and
+    an async view runs on an event loop in another one, so its profile would
+    be close to empty. They're answered as usual with an X-Profile-Skipped
+    header.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if PROFILE_QUERY_PARAM not in request.GET and PROFILE_HEADER not in request.META:
+            return self.get_response(request)
+        if not (request.user.is_authenticated and request.user.is_staff):
+            return self.get_response(request)
+        if is_async_view(request):
+            response = self.get_response(request)
+            response['X-Profile-Skipped'] = 'Async views are not profiled'
+            return response
+        return self.profile(request)
+
+    def profile(self, request):
+        queries = []
+
+        def record_query(execute, sql, params, many, context):
+            start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                queries.append({
+                    'alias': context['connection'].alias,
+                    'sql': sql,
+                    'params': repr(params)[:500],
+                    'many': many,
+                    'duration': time.perf_counter() - start,
+                })
+
+        profiler = cProfile.Profile()
+        started = datetime.now()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(record_query))
+            response = profiler.runcall(self.get_response, request)
+        duration = time.perf_counter() - start
+
+        profile_id = f"{started:%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}"
+        self.save(profile_id, profiler, queries, {
+            'id': profile_id,
+            'started': started.isoformat(),
+            'method': request.method,
+            'path': request.get_full_path(),
+            'user': request.user.get_username(),
+            'status': response.status_code,
+            'duration': duration,
+            'query_count': len(queries),
+            'query_duration': sum(query['duration'] for query in queries),
+        })
+
+        response['X-Profile-Id'] = profile_id
+        return response
+
+    def save(self, profile_id, profiler, queries, metadata):
+        os.makedirs(profile_dir(), exist_ok=True)
+        profiler.dump_stats(profile_path(profile_id, 'prof'))
+
+        # A readable summary, so viewing a profile doesn't need pstats tooling
+        summary = io.StringIO()
+        pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(PROFILE_STATS_LINES)
+
+        # The index only reads the small metadata file
+        with open(profile_path(profile_id, 'detail.json'), 'w') as f:
+            json.dump({'queries': queries, 'stats': summary.getvalue()}, f)
+        with open(profile_path(profile_id, 'json'), 'w') as f:
+            json.dump(metadata, f)
+
+        prune_profiles(getattr(settings, 'PROFILING_KEEP', 200))
@@ -0,0 +1,116 @@
+import csv
+import io
+import json
+import os
+from itertools import islice
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from .compression import open_source
+
+ROW_INDEX_INTERVAL = 1000  # Rows between index entries; a page read skips at most this many rows
+ROW_INDEX_SUFFIX = '.rowindex.json'
+MAX_PAGE_ROWS = 1000
+
+
+def iter_records(f, offset=0):
+    """
+    Yield (offset, raw bytes) of each CSV record in a binary stream, from its
+    current position at the given offset. A record ends at a newline outside
+    double quotes, so quoted fields spanning several lines stay in one record.
+    """
+    record = []
+    quoted = False
+    for line in f:
+        record.append(line)
+        # Escaped quotes ("") toggle twice, so only the count's parity matters
+        if line.count(b'"') % 2:
+            quoted = not quoted
+        if not quoted:
+            data = b''.join(record)
+            yield offset, data
+            offset += len(data)
+            record = []
+    if record:
+        yield offset, b''.join(record)
+
+
+def build_row_index(file_path, interval=None):
+    """
+    Sparse index of a CSV file: the byte offset of every interval-th data row
+    (after the header), in the decompressed data for compressed files
+    """
+    interval = interval or ROW_INDEX_INTERVAL
+    offsets = []
+    rows = 0
+    with open_source(file_path) as f:
+        records = iter_records(f)
+        next(records, None)  # Header
+        for offset, _ in records:
+            if rows % interval == 0:
+                offsets.append(offset)
+            rows += 1
+
+    return {
+        'interval': interval,
+        'rows': rows,
+        'file_size': os.path.getsize(file_path),
+        'offsets': offsets,
+    }
+
+
+def index_name(file_name):
+    return file_name + ROW_INDEX_SUFFIX
+
+
+def save_row_index(file_name):
+    """Build the row index of a stored file and save it next to the file"""
+    index = build_row_index(default_storage.path(file_name))
+    name = index_name(file_name)
+    if default_storage.exists(name):
+        default_storage.delete(name)
+    default_storage.save(name, ContentFile(json.dumps(index).encode()))
+    return index
+
+
+def load_row_index(file_name):
+    """The row index of a stored file, built now if it's missing or out of date"""
+    name = index_name(file_name)
+    if default_storage.exists(name):
+        with default_storage.open(name, 'rb') as f:
+            index = json.load(f)
+        if index.get('file_size') == default_storage.size(file_name):
+            return index
+    return save_row_index(file_name)
+
+
+def read_rows(file_name, start=0, count=100, delimiter=',', encoding='utf-8'):
+    """
+    Header and rows start to start + count of a stored CSV file. Seeks to the
+    nearest indexed row, so only up to ROW_INDEX_INTERVAL rows are skipped and
+    just the page is parsed.
+    """
+    index = load_row_index(file_name)
+    count = max(0, min(count, MAX_PAGE_ROWS, index['rows'] - start))
+    page = {'start': start, 'total_rows': index['rows'], 'headers': [], 'rows': []}
+
+    with open_source(default_storage.path(file_name)) as f:
+        records = iter_records(f)
+        header = next(records, (0, b''))[1]
+        page['headers'] = next(csv.reader(io.StringIO(header.decode(encoding), newline=''), delimiter=delimiter), [])
+        if count <= 0:
+            return page
+
+        skip = start
+        if f.seekable():
+            offset = index['offsets'][start // index['interval']]
+            f.seek(offset)
+            records = iter_records(f, offset)
+            skip = start % index['interval']
+        for _ in range(skip):
+            next(records)
+        raw = b''.join(record for _, record in islice(records, count))
+
+    page['rows'] = list(csv.reader(io.StringIO(raw.decode(encoding), newline=''), delimiter=delimiter))
+    return page
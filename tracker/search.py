@@ -0,0 +1,161 @@
+import re
+
+from django.db import connection, OperationalError
+from django.db.models import Q
+
+from .models import SchemaDefinition, SchemaSearchDocument
+
+FTS_TABLE = 'tracker_schemasearchdocument_fts'
+# Relative weight of a match in column names, canonical name, filename and sample values
+FIELD_WEIGHTS = (10.0, 4.0, 2.0, 1.0)
+SAMPLE_VALUES_PER_COLUMN = 3
+SAMPLE_VALUE_LENGTH = 100
+
+WORD_RE = re.compile(r'[^\W_]+')
+# A token of its own between column names so that a phrase can't match the end
+# of one column and the start of the next. It's a private use character: a
+# token character to the FTS5 tokenizer but never a word of a query. PostgreSQL
+# would skip it, so its index has -1 in its place (see migration 0011).
+COLUMN_SEPARATOR = ' \ue000 '
+
+
+def identifier_words(name):
+    """Lowercase words of a camelCase, PascalCase or snake_case name: CustomerID -> customer, id"""
+    name = re.sub(r'([a-z0-9])([A-Z])', r'\1 \2', str(name))
+    name = re.sub(r'([A-Z]+)([A-Z][a-z])', r'\1 \2', name)
+    return WORD_RE.findall(name.lower())
+
+
+def document_fields(column_definitions, datasource):
+    """Text of the search document for a schema"""
+    column_names = []
+    sample_values = []
+    for column, details in (column_definitions or {}).items():
+        names = [str(column)]
+        words = identifier_words(column)
+        if words != [str(column).lower()]:
+            names.extend(words)
+        column_names.append(' '.join(names))
+        for value in (details.get('sample_values') or [])[:SAMPLE_VALUES_PER_COLUMN]:
+            sample_values.append(str(value)[:SAMPLE_VALUE_LENGTH])
+
+    return {
+        'column_names': COLUMN_SEPARATOR.join(column_names),
+        'canonical_name': ' '.join([datasource.canonical_name] + identifier_words(datasource.canonical_name)),
+        'filename': ' '.join([datasource.original_filename] + identifier_words(datasource.original_filename)),
+        'sample_values': ' '.join(sample_values),
+    }
+
+
+def index_schemas(schemas):
+    """Create or refresh the search documents of schemas (with their data sources loaded)"""
+    SchemaSearchDocument.objects.bulk_create(
+        [
+            SchemaSearchDocument(schema=schema, **document_fields(schema.column_definitions, schema.data_source))
+            for schema in schemas
+        ],
+        update_conflicts=True,
+        unique_fields=['schema'],
+        update_fields=['column_names', 'canonical_name', 'filename', 'sample_values']
+    )
+
+
+def rebuild_index(batch_size=1000):
+    """Index every schema from scratch; returns the number indexed"""
+    SchemaSearchDocument.objects.all().delete()
+    indexed = 0
+    schemas = SchemaDefinition.objects.select_related('data_source', 'samples').order_by('pk')
+    batch = []
+    for schema in schemas.iterator(chunk_size=batch_size):
+        batch.append(schema)
+        if len(batch) == batch_size:
+            index_schemas(batch)
+            indexed += len(batch)
+            batch = []
+    index_schemas(batch)
+    return indexed + len(batch)
+
+
+def query_phrases(query):
+    """
+    Each word of the query as a phrase of identifier words that match as
+    prefixes of consecutive words, so cust*id finds customer_id and CustomerID
+    """
+    return [words for words in map(identifier_words, query.split()) if words]
+
+
+def ranked_ids_sqlite(phrases, limit, offset):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+            f"ORDER BY bm25({FTS_TABLE}, {', '.join(map(str, FIELD_WEIGHTS))}) LIMIT %s OFFSET %s",
+            # Words are plain letters and digits; quoting keeps FTS5 from reading AND/OR/NOT as operators
+            [' AND '.join(' + '.join(f'"{word}"*' for word in phrase) for phrase in phrases), limit, offset]
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def ranked_ids_postgresql(phrases, limit, offset):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT schema_id FROM tracker_schemasearchdocument, to_tsquery('simple', %s) query "
+            "WHERE search_vector @@ query ORDER BY ts_rank(search_vector, query) DESC, schema_id DESC "
+            "LIMIT %s OFFSET %s",
+            [' & '.join('(' + ' <-> '.join(f"{word}:*" for word in phrase) + ')' for phrase in phrases), limit, offset]
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def ranked_ids_fallback(phrases, limit, offset):
+    """Unindexed scan for databases without full-text search, newest first. Ignores word order"""
+    documents = SchemaSearchDocument.objects.all()
+    for word in [word for phrase in phrases for word in phrase]:
+        documents = documents.filter(
+            Q(column_names__icontains=word) | Q(canonical_name__icontains=word) |
+            Q(filename__icontains=word) | Q(sample_values__icontains=word)
+        )
+    return list(documents.order_by('-schema_id').values_list('schema_id', flat=True)[offset:offset + limit])
+
+
+def phrase_matches(words, phrase):
+    return any(
+        all(word.startswith(prefix) for word, prefix in zip(words[start:], phrase))
+        for start in range(len(words) - len(phrase) + 1)
+    )
+
+
+def matched_columns(columns, phrases):
+    """Columns matching every phrase, or failing that any of them"""
+    words = {column: identifier_words(column) for column in columns}
+    matched = [column for column in columns if all(phrase_matches(words[column], phrase) for phrase in phrases)]
+    if matched:
+        return matched
+    return [column for column in columns if any(phrase_matches(words[column], phrase) for phrase in phrases)]
+
+
+def search_schemas(query, limit=50, offset=0):
+    """
+    Schemas matching every word of the query in their column names, canonical
+    name, filename or sample values, best match first. Each result has the
+    columns that matched in matched_columns.
+    """
+    phrases = query_phrases(query)
+    if not phrases:
+        return []
+
+    if connection.vendor == 'sqlite':
+        try:
+            ids = ranked_ids_sqlite(phrases, limit, offset)
+        except OperationalError:
+            # SQLite built without FTS5, so migrate couldn't create the index
+            ids = ranked_ids_fallback(phrases, limit, offset)
+    elif connection.vendor == 'postgresql':
+        ids = ranked_ids_postgresql(phrases, limit, offset)
+    else:
+        ids = ranked_ids_fallback(phrases, limit, offset)
+
+    schemas = SchemaDefinition.objects.select_related('data_source').in_bulk(ids)
+    results = [schemas[pk] for pk in ids if pk in schemas]
+    for schema in results:
+        schema.matched_columns = matched_columns(schema.get_columns(), phrases)
+    return results
@@ -0,0 +1,78 @@
+from django.core.cache import cache
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+
+from .caching import invalidate, invalidate_sources, invalidate_schemas
+from .search import document_fields, index_schemas
+from .models import (
+    DataSource, SchemaDefinition, PrimaryKeyCandidate, SchemaChange, SchemaRelationship, ColumnProfile,
+    SchemaSearchDocument
+)
+
+# Bulk writes don't send signals, so code using bulk_create() or update() on
+# these models calls the invalidate functions itself.
+
+
+def related_pages(datasource):
+    """Sources and schemas whose pages show this data source's name"""
+    schema_ids = set(SchemaDefinition.objects.filter(data_source=datasource).values_list('pk', flat=True))
+    for source_schema, target_schema in SchemaRelationship.objects.filter(
+        Q(source_schema__data_source=datasource) | Q(target_schema__data_source=datasource)
+    ).values_list('source_schema_id', 'target_schema_id'):
+        schema_ids.update([source_schema, target_schema])
+    source_ids = set(SchemaChange.objects.filter(previous_version=datasource).values_list('source_id', flat=True))
+    return source_ids, schema_ids
+
+
+@receiver(post_save, sender=DataSource)
+def datasource_saved(sender, instance, created, **kwargs):
+    invalidate('catalog', f"source:{instance.pk}", f"canonical:{instance.canonical_name}")
+    if not created:
+        # The names are part of the search document
+        fields = document_fields({}, instance)
+        SchemaSearchDocument.objects.filter(schema__data_source=instance).update(
+            canonical_name=fields['canonical_name'], filename=fields['filename']
+        )
+        source_ids, schema_ids = related_pages(instance)
+        invalidate_sources(source_ids)
+        invalidate_schemas(schema_ids)
+
+
+@receiver(pre_delete, sender=DataSource)
+def datasource_deleted(sender, instance, **kwargs):
+    # Before the delete, while version history still points at this source
+    source_ids, schema_ids = related_pages(instance)
+    invalidate('catalog', f"source:{instance.pk}", f"canonical:{instance.canonical_name}")
+    invalidate_sources(source_ids)
+    invalidate_schemas(schema_ids)
+
+
+@receiver([post_save, post_delete], sender=SchemaDefinition)
+def schema_changed(sender, instance, **kwargs):
+    invalidate('catalog', f"source:{instance.data_source_id}", f"schema:{instance.pk}")
+
+
+@receiver(post_save, sender=SchemaDefinition)
+def schema_saved(sender, instance, **kwargs):
+    index_schemas([instance])
+
+
+@receiver([post_save, post_delete], sender=PrimaryKeyCandidate)
+@receiver([post_save, post_delete], sender=ColumnProfile)
+def schema_detail_changed(sender, instance, **kwargs):
+    invalidate_schemas([instance.schema_id])
+
+
+@receiver([post_save, post_delete], sender=SchemaChange)
+def change_changed(sender, instance, **kwargs):
+    invalidate_sources([instance.source_id, instance.previous_version_id])
+
+
+@receiver([post_save, post_delete], sender=SchemaRelationship)
+def relationship_changed(sender, instance, **kwargs):
+    invalidate_schemas([instance.source_schema_id, instance.target_schema_id])
+
+
+def clear_cache(**kwargs):
+    cache.clear()
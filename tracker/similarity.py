@@ -0,0 +1,70 @@
+import os
+import re
+
+# Dates like 2025-03-11, 2025_03_11, 20250311 or 03-11-2025
+DATE_PATTERN = re.compile(r'(?<!\d)(\d{4}[-_.]?\d{2}[-_.]?\d{2}|\d{2}[-_.]\d{2}[-_.]\d{4})(?!\d)')
+
+# Version suffixes like _v2, -v1.3, " version 4", " (1)" or _final. The words
+# must start after a separator, so ipv4, dev1 or photocopy are left alone.
+VERSION_PATTERN = re.compile(
+    r'((?:^|[\s_\-.]+)(v|ver|version)[\s_\-.]?\d+(\.\d+)*|\s*\(\d+\)|(?:^|[\s_\-.]+)(final|latest|copy))$'
+)
+
+SEPARATOR_PATTERN = re.compile(r'[\s_\-.]+')
+
+
+def normalize_filename(filename):
+    """
+    Reduce a filename to the part that identifies the dataset, dropping
+    extensions, dates and version suffixes so that e.g. "Customer_2025-03-11_v2.csv"
+    and "customer.csv" normalize to the same string.
+    """
+    if not filename:
+        return ''
+
+    name = os.path.basename(filename).lower()
+
+    # Strip all extensions (handles .csv.gz, .json.zip, ...)
+    while True:
+        name, extension = os.path.splitext(name)
+        if not extension:
+            break
+    stem = name
+
+    name = DATE_PATTERN.sub(' ', name)
+
+    # Version suffixes can be stacked ("report_v2 (1)"), so strip until stable
+    previous = None
+    while previous != name:
+        previous = name
+        name = VERSION_PATTERN.sub('', name.strip(' _-.'))
+
+    # Fall back to the bare stem if the name was nothing but a date/version
+    return SEPARATOR_PATTERN.sub(' ', name).strip() or SEPARATOR_PATTERN.sub(' ', stem).strip()
+
+
+def score_filenames(normalized_name, normalized_choices, score_cutoff=0, workers=-1):
+    """
+    Score one normalized filename against many in a single batched call.
+
+    Returns a list of similarities in the range 0.0-1.0, aligned with
+    normalized_choices. Scores below score_cutoff (0-100) are reported as 0.0.
+    The comparison runs on all CPU cores unless workers says otherwise.
+    """
+    # Imported here as models import this module, and every process loads models
+    import numpy as np
+    from rapidfuzz import fuzz, process
+
+    if not normalized_choices:
+        return []
+
+    scores = process.cdist(
+        [normalized_name],
+        normalized_choices,
+        scorer=fuzz.ratio,
+        score_cutoff=score_cutoff,
+        workers=workers,
+        dtype=np.float64,
+    )
+    return (scores[0] / 100).tolist()
+
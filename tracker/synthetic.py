@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+
+COLUMN_TYPES = ['int', 'float', 'string', 'category', 'date', 'bool']
+CATEGORY_LABELS = 20  # Distinct values in category columns
+
+
+def synthetic_column(rng, column_type, rows, cardinality, null_rate):
+    """
+    One column of random data. cardinality is the share of rows that are
+    distinct values (1.0 gives a unique column); null_rate the share of nulls.
+    """
+    distinct = max(1, int(rows * cardinality))
+    if column_type == 'category':
+        distinct = min(distinct, CATEGORY_LABELS)
+    elif column_type == 'bool':
+        distinct = min(distinct, 2)
+
+    if distinct >= rows:
+        codes = rng.permutation(rows)
+    else:
+        codes = rng.integers(0, distinct, rows)
+
+    if column_type == 'int':
+        values = pd.Series(codes + 1, dtype='int64')
+    elif column_type == 'float':
+        values = pd.Series(np.round(rng.random(distinct) * 1000, 2)[codes])
+    elif column_type == 'string':
+        values = pd.Series(np.array([f"value_{n}" for n in range(distinct)], dtype=object)[codes])
+    elif column_type == 'category':
+        values = pd.Series(np.array([f"label_{n}" for n in range(distinct)], dtype=object)[codes])
+    elif column_type == 'date':
+        values = pd.Series(pd.Timestamp('2020-01-01') + pd.to_timedelta(codes, unit='D'))
+    elif column_type == 'bool':
+        values = pd.Series(codes == 0)
+    else:
+        raise ValueError(f"Unknown column type: {column_type}")
+
+    if null_rate:
+        values = values.mask(rng.random(rows) < null_rate)
+    return values
+
+
+def synthetic_dataframe(rows, columns=10, types=None, cardinality=0.5, null_rate=0.0, key_column=True, seed=0):
+    """
+    A DataFrame of random data for benchmarks. Columns cycle through the
+    given types and are named after them (int_1, string_2, ...), so frames
+    generated with the same types share column names. With key_column the
+    first column is a unique integer id.
+    """
+    rng = np.random.default_rng(seed)
+    types = types or COLUMN_TYPES
+
+    data = {}
+    if key_column:
+        data['id'] = pd.Series(np.arange(1, rows + 1), dtype='int64')
+    for position in range(len(data), columns):
+        column_type = types[position % len(types)]
+        data[f"{column_type}_{position}"] = synthetic_column(rng, column_type, rows, cardinality, null_rate)
+
+    return pd.DataFrame(data)
+
+
+def write_synthetic_file(df, path, source_type):
+    """Write a synthetic DataFrame in one of the formats the tracker reads"""
+    if source_type == 'csv':
+        df.to_csv(path, index=False)
+    elif source_type == 'excel':
+        df.to_excel(path, index=False)
+    elif source_type == 'json':
+        df.to_json(path, orient='records', date_format='iso')
+    else:
+        raise ValueError(f"Unknown source type: {source_type}")
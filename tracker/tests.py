@@ -1,3 +1,1273 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import hashlib
+import importlib.util
+import io
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+import zipfile
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connections, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from schemanavigator import db
+from schemanavigator.test_runner import QueryBudgetTestRunner
+
+from . import metrics
+from .caching import bump, generations
+from .checks import check_upload_compression
+from .compression import open_zstd, uncompressed_size, write_seekable_zstd
+from .diff import diff_datasources
+from .executor import ParserBusy, run_parse, shutdown_executor
+from .flatten import Flattener, JSONStream
+from .inclusion import (
+    bloom_contains, build_bloom_filter, containment, find_inclusion_dependencies, find_inclusion_dependencies_bulk,
+    profile_columns
+)
+from .ingest import analyze_dataframe, detect_source_type, previous_column_hints, read_csv_file, read_json_file
+from .profiling import load_profile
+from .rowindex import build_row_index, index_name
+from .search import search_schemas
+from .similarity import normalize_filename
+from .models import (
+    ColumnProfile, DataSource, IngestedFile, SchemaDefinition, SchemaSamples, PrimaryKeyCandidate, SchemaChange,
+    SchemaRelationship, UploadSession, Workbook
+)
+from .uploads import UploadError, start_upload, write_chunk
+from .views import index_rows, process_excel_file
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+SOURCES = 5  # Enough rows that an N+1 query pattern goes over budget
+
+
+def csv_file(name, rows=20, extra_column=False):
+    lines = ['id,name,amount' + (',note' if extra_column else '')]
+    for n in range(1, rows + 1):
+        lines.append(f"{n},name {n},{n * 1.5}" + (f",note {n}" if extra_column else ''))
+    return SimpleUploadedFile(name, '\n'.join(lines).encode(), content_type='text/csv')
+
+
+class QueryBudgetTestCase(TestCase):
+    """
+    Renders every tracker view over a catalog of several sources. The views
+    are on query budgets, which fail the request under the test runner when
+    exceeded, so these tests catch N+1 query regressions.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_override = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_override.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.media_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.sources = []
+        for n in range(SOURCES):
+            source = DataSource.objects.create(
+                original_filename=f"customers_v{n + 1}.csv",
+                canonical_name='customers',
+                schema_version=n + 1
+            )
+            source.file.save(source.original_filename, csv_file(source.original_filename, extra_column=n % 2 == 1))
+            schema = SchemaDefinition.objects.create(
+                data_source=source,
+                column_definitions={
+                    'id': {'type': 'int64', 'sample_values': [1, 2]},
+                    'name': {'type': 'object', 'sample_values': ['name 1']},
+                    'amount': {'type': 'float64', 'sample_values': [1.5]},
+                },
+                row_count=20
+            )
+            PrimaryKeyCandidate.objects.create(schema=schema, column_name='id', uniqueness_ratio=1.0,
+                                               is_confirmed=True)
+            SchemaChange.objects.create(source=source, change_type='initial', details={'columns': ['id']})
+            if cls.sources:
+                previous = cls.sources[-1]
+                SchemaChange.objects.create(source=source, previous_version=previous, change_type='add_column',
+                                            details={'columns': ['note']})
+                SchemaRelationship.objects.create(source_schema=previous.schema, target_schema=schema,
+                                                  relationship_type='version', similarity_score=0.9)
+            cls.sources.append(source)
+
+        # Relationships both to and from the middle source
+        cls.source = cls.sources[SOURCES // 2]
+        for other in cls.sources:
+            if other != cls.source:
+                SchemaRelationship.objects.create(source_schema=cls.source.schema, target_schema=other.schema,
+                                                  relationship_type='related', similarity_score=0.6)
+
+        cls.staff = User.objects.create_user('staff', password='password', is_staff=True, is_superuser=True)
+
+    def setUp(self):
+        # The database is rolled back after each test, the cache isn't
+        cache.clear()
+
+
+class TrackerViewQueryTests(QueryBudgetTestCase):
+
+    def test_home(self):
+        self.assertEqual(self.client.get(reverse('home')).status_code, 200)
+
+    def test_schema_list(self):
+        response = self.client.get(reverse('schema_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['schemas']), SOURCES)
+
+    def test_datasource_detail(self):
+        response = self.client.get(reverse('datasource_detail', args=[self.source.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['relationships']), SOURCES + 1)
+
+    def test_compare_schemas(self):
+        response = self.client.get(reverse('compare_schemas', args=[self.sources[0].schema.pk,
+                                                                    self.sources[1].schema.pk]))
+        self.assertEqual(response.status_code, 200)
+
+    def test_file_preview(self):
+        response = self.client.get(reverse('file_preview', args=[self.source.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('table_data', response.json())
+
+    def test_reanalyze_file(self):
+        self.assertEqual(self.client.get(reverse('reanalyze_file', args=[self.source.pk])).status_code, 200)
+
+    def test_data_diff(self):
+        response = self.client.get(reverse('data_diff', args=[self.sources[0].pk, self.sources[1].pk]))
+        self.assertEqual(response.status_code, 200)
+
+    def test_toggle_primary_key(self):
+        candidate = self.source.schema.primary_keys.get()
+        self.client.post(reverse('toggle_primary_key', args=[candidate.pk]))
+        candidate.refresh_from_db()
+        self.assertFalse(candidate.is_confirmed)
+
+    def test_upload(self):
+        self.assertEqual(self.client.get(reverse('upload')).status_code, 200)
+
+        response = self.client.post(reverse('upload'), {
+            'file': csv_file('orders.csv'),
+            'canonical_name': 'orders',
+            'source_type': 'csv',
+        })
+        datasource = DataSource.objects.get(canonical_name='orders')
+        self.assertRedirects(response, reverse('datasource_detail', args=[datasource.pk]))
+        self.assertEqual(datasource.schema.row_count, 20)
+
+    def test_retry_detection(self):
+        response = self.client.post(reverse('retry_detection', args=[self.sources[0].pk]), {'file_type': 'csv'})
+        self.assertRedirects(response, reverse('datasource_detail', args=[self.sources[0].pk]))
+
+    def test_reprocess_file(self):
+        source = self.sources[-1]
+        response = self.client.post(reverse('reprocess_file', args=[source.pk]), {'file_type': 'csv'})
+        self.assertRedirects(response, reverse('datasource_detail', args=[source.pk]))
+        self.assertTrue(SchemaDefinition.objects.filter(data_source=source).exists())
+
+    def test_delete_datasource(self):
+        response = self.client.post(reverse('delete_datasource', args=[self.source.pk]))
+        self.assertRedirects(response, reverse('schema_list'))
+        self.assertFalse(DataSource.objects.filter(pk=self.source.pk).exists())
+
+    def test_chunked_upload(self):
+        content = csv_file('big.csv').read()
+        response = self.client.post(reverse('chunked_upload_start'), {
+            'filename': 'big.csv', 'size': len(content), 'canonical_name': 'big', 'source_type': 'csv'
+        })
+        self.assertEqual(response.status_code, 201)
+        url = reverse('chunked_upload', args=[response.json()['id']])
+
+        half = len(content) // 2
+        for start, end in [(0, half), (half, len(content))]:
+            response = self.client.put(url, content[start:end], content_type='application/octet-stream',
+                                       HTTP_CONTENT_RANGE=f"bytes {start}-{end - 1}/{len(content)}")
+            self.assertEqual(response.json()['offset'], end)
+        self.assertTrue(self.client.get(url).json()['complete'])
+
+        response = self.client.post(reverse('chunked_upload_finish', args=[UploadSession.objects.get().pk]))
+        self.assertEqual(response.status_code, 200)
+        chunk_digests = b''.join(hashlib.sha256(content[start:end]).digest()
+                                 for start, end in [(0, half), (half, len(content))])
+        self.assertEqual(response.json()['checksum'], hashlib.sha256(chunk_digests).hexdigest())
+        self.assertEqual(DataSource.objects.get(pk=response.json()['datasource']).schema.row_count, 20)
+
+    def test_failed_chunks_leave_stored_bytes_alone(self):
+        session = start_upload('big.csv', 20, 'big')
+        stale = UploadSession.objects.get(pk=session.pk)
+        write_chunk(session, io.BytesIO(b'a' * 10), 0, 10)
+
+        # Lost its race for the offset, refused a checksum or cut short: none of them write
+        with self.assertRaises(UploadError) as raised:
+            write_chunk(stale, io.BytesIO(b'b' * 10), 0, 10)
+        self.assertEqual(raised.exception.status, 409)
+        with self.assertRaises(UploadError):
+            write_chunk(session, io.BytesIO(b'c' * 10), 10, 20, expected_sha256='0' * 64)
+        with self.assertRaises(UploadError):
+            write_chunk(session, io.BytesIO(b'd' * 5), 10, 20)
+
+        session.refresh_from_db()
+        self.assertEqual(session.received, 10)
+        with default_storage.open(session.file_name, 'rb') as f:
+            self.assertEqual(f.read(), b'a' * 10)
+
+    def scrape(self):
+        """The /metrics samples as {'name{labels}': value}"""
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        samples = {}
+        for line in response.content.decode().splitlines():
+            if line and not line.startswith('#'):
+                name, value = line.rsplit(' ', 1)
+                samples[name] = float(value)
+        return samples
+
+    def test_metrics(self):
+        before = self.scrape()
+        self.client.post(reverse('upload'), {'file': csv_file('orders.csv'), 'canonical_name': 'orders',
+                                             'source_type': 'csv'})
+        after = self.scrape()
+
+        def increase(name):
+            return after.get(name, 0) - before.get(name, 0)
+
+        self.assertEqual(increase('tracker_ingest_files_read_total{source_type="csv"}'), 1)
+        self.assertEqual(increase('tracker_ingest_rows_total'), 20)
+        self.assertEqual(increase('tracker_ingest_columns_total'), 3)
+        for stage in ['parse', 'infer_types', 'primary_keys', 'db_write']:
+            self.assertEqual(increase(f'tracker_ingest_stage_duration_seconds_count{{stage="{stage}"}}'), 1, stage)
+            self.assertEqual(increase(f'tracker_ingest_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}}'),
+                             1, stage)
+        self.assertGreater(increase('tracker_ingest_stage_queries_total{stage="db_write"}'), 0)
+        self.assertGreater(after['tracker_ingest_process_max_rss_bytes{stage="parse"}'], 0)
+
+    def test_profile_list(self):
+        self.client.force_login(self.staff)
+        with override_settings(PROFILING_DIR=self.media_root):
+            self.assertEqual(self.client.get(reverse('profile_list')).status_code, 200)
+
+    @override_settings(PROFILING_ENABLED=True)
+    def test_profiling_is_for_staff_only(self):
+        profiling_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, profiling_dir, ignore_errors=True)
+        url = reverse('schema_list')
+        user = User.objects.create_user('user', password='password')
+
+        with override_settings(PROFILING_DIR=profiling_dir):
+            # Anonymous and non-staff users get the page, unprofiled
+            self.assertNotIn('X-Profile-Id', self.client.get(url, {'profile': '1'}))
+            self.client.force_login(user)
+            self.assertNotIn('X-Profile-Id', self.client.get(url, {'profile': '1'}, HTTP_X_PROFILE='1'))
+            self.assertEqual(os.listdir(profiling_dir), [])
+
+            # Staff only when they ask
+            self.client.force_login(self.staff)
+            self.assertNotIn('X-Profile-Id', self.client.get(url))
+            cache.clear()  # So the page runs its queries again
+            response = self.client.get(url, {'profile': '1'})
+            self.assertEqual(response.status_code, 200)
+            profile_id = response['X-Profile-Id']
+            self.assertEqual(sorted(os.listdir(profiling_dir)),
+                             [f'{profile_id}.detail.json', f'{profile_id}.json', f'{profile_id}.prof'])
+
+            profile = load_profile(profile_id)
+            self.assertEqual((profile['path'], profile['user'], profile['status']),
+                             (f'{url}?profile=1', 'staff', 200))
+            self.assertEqual(profile['query_count'], len(profile['queries']))
+            self.assertGreater(profile['query_count'], 0)
+            self.assertIn('cumulative', profile['stats'])
+            self.assertEqual([p['id'] for p in self.client.get(reverse('profile_list')).context['profiles']],
+                             [profile_id])
+
+            # cProfile can't follow an async view onto its event loop
+            response = self.client.get(reverse('file_preview', args=[self.source.pk]), {'profile': '1'})
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('X-Profile-Id', response)
+            self.assertIn('X-Profile-Skipped', response)
+            self.assertEqual(len(os.listdir(profiling_dir)), 3)
+
+
+class DataDiffTests(QueryBudgetTestCase):
+
+    def version(self, name, lines, keys=('id',)):
+        source = DataSource.objects.create(original_filename=name, canonical_name='orders', source_type='csv')
+        source.file.save(name, SimpleUploadedFile(name, '\n'.join(lines).encode()))
+        schema = SchemaDefinition.objects.create(data_source=source, column_definitions={}, row_count=len(lines) - 1)
+        for key in keys:
+            PrimaryKeyCandidate.objects.create(schema=schema, column_name=key, uniqueness_ratio=1.0, is_confirmed=True)
+        return source
+
+    def setUp(self):
+        super().setUp()
+        self.old = self.version('orders_v1.csv', ['id,email,amount', '1,a@x,10', '2,b@x,20', '3,c@x,30',
+                                                  '4,d@x,40', '5,e@x,50'])
+        # 1 and 5 unchanged, 2 changed, 3 deleted, 4 repeated (last row wins, unchanged), 6 inserted
+        self.new = self.version('orders_v2.csv', ['id,email,amount', '1,a@x,10', '2,b@x,25', '4,old@x,0',
+                                                  '4,d@x,40', '5,e@x,50', '6,f@x,60'])
+
+    def test_row_counts(self):
+        result = diff_datasources(self.old, self.new, partitions=2)
+        self.assertEqual(result['key_columns'], ['id'])
+        self.assertEqual((result['inserted'], result['deleted'], result['changed'], result['unchanged']), (1, 1, 1, 3))
+        self.assertEqual(result['duplicate_keys'], {'old': 0, 'new': 1})
+        self.assertEqual(result['column_changes'], {'email': 0, 'amount': 1})
+        self.assertEqual(result['samples'], {'inserted': ['6'], 'deleted': ['3'], 'changed': ['2']})
+
+    def test_several_confirmed_keys_are_ambiguous(self):
+        ambiguous = self.version('orders_v3.csv', ['id,email,amount', '1,a@x,10'], keys=('id', 'email'))
+        with self.assertRaisesMessage(ValueError, 'Several primary keys are confirmed (id, email)'):
+            diff_datasources(ambiguous, self.new)
+
+        result = diff_datasources(ambiguous, self.new, key_columns=['id', 'email'])
+        self.assertEqual((result['inserted'], result['deleted'], result['unchanged']), (5, 0, 1))
+
+        response = self.client.get(reverse('data_diff', args=[ambiguous.pk, self.new.pk]), {'key': 'id, email'})
+        self.assertEqual(response.context['result']['key_columns'], ['id', 'email'])
+
+        with self.assertLogs('tracker.views', 'WARNING'):
+            response = self.client.get(reverse('data_diff', args=[ambiguous.pk, self.new.pk]))
+        self.assertRedirects(response, reverse('datasource_detail', args=[self.new.pk]), fetch_redirect_response=False)
+
+    def test_json_is_flattened_like_ingest(self):
+        old = self.version('orders_v1.json', [json.dumps([
+            {'id': 1, 'customer': {'city': 'Oslo'}},
+            {'id': 2, 'customer': {'city': 'Rome'}, 'note': 'gift'},
+        ])])
+        new = self.version('orders_v2.json', ['{"id": 1, "customer": {"city": "Oslo"}}',
+                                              '{"id": 2, "customer": {"city": "Bern"}, "note": "gift"}',
+                                              '{"id": 3, "customer": {"city": "Oslo"}}'])
+        DataSource.objects.filter(pk__in=[old.pk, new.pk]).update(source_type='json')
+        old.refresh_from_db()
+        new.refresh_from_db()
+
+        # One record per chunk, so most chunks lack the note path
+        result = diff_datasources(old, new, chunksize=1)
+        self.assertEqual(result['compared_columns'], ['customer.city', 'note'])
+        self.assertEqual((result['inserted'], result['deleted'], result['changed'], result['unchanged']), (1, 0, 1, 1))
+        self.assertEqual(result['column_changes'], {'customer.city': 1, 'note': 0})
+
+
+class CacheInvalidationTests(QueryBudgetTestCase):
+    """Pages are cached until a write changes what they show"""
+
+    def test_pages_are_cached(self):
+        for url in [reverse('home'), reverse('schema_list'),
+                    reverse('compare_schemas', args=[self.sources[0].schema.pk, self.sources[1].schema.pk])]:
+            with self.subTest(url=url):
+                self.client.get(url)
+                with self.assertNumQueries(0):
+                    self.assertEqual(self.client.get(url).status_code, 200)
+
+        url = reverse('datasource_detail', args=[self.source.pk])
+        self.client.get(url)
+        with self.assertNumQueries(1):
+            self.client.get(url)
+
+    def test_schema_list_is_cached_per_page(self):
+        url = reverse('schema_list')
+        with mock.patch('tracker.views.SCHEMA_PAGE_SIZE', 2):
+            first = self.client.get(url)
+            self.assertEqual(len(first.context['schemas']), 2)
+            self.assertEqual(first.context['next_page'], 2)
+            with self.assertNumQueries(1):
+                second = self.client.get(url, {'page': 2})
+            self.assertEqual(second.context['previous_page'], 1)
+            self.assertFalse(set(first.context['schemas']) & set(second.context['schemas']))
+            with self.assertNumQueries(0):
+                self.client.get(url, {'page': 2})
+
+    def test_upload_invalidates_lists(self):
+        self.client.get(reverse('schema_list'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('upload'), {'file': csv_file('orders.csv'), 'canonical_name': 'orders',
+                                                 'source_type': 'csv'})
+        response = self.client.get(reverse('schema_list'))
+        self.assertEqual(len(response.context['schemas']), SOURCES + 1)
+        self.assertContains(self.client.get(reverse('home')), 'orders.csv')
+
+    def test_toggle_primary_key_invalidates_detail(self):
+        url = reverse('datasource_detail', args=[self.source.pk])
+        self.client.get(url)
+        candidate = self.source.schema.primary_keys.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('toggle_primary_key', args=[candidate.pk]))
+        self.assertFalse(self.client.get(url).context['primary_keys'][0].is_confirmed)
+
+    def test_rename_invalidates_related_pages(self):
+        url = reverse('datasource_detail', args=[self.sources[0].pk])
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.source.original_filename = 'renamed.csv'
+            self.source.save()
+        self.assertContains(self.client.get(url), 'renamed.csv')
+
+    def test_delete_invalidates_related_pages(self):
+        url = reverse('datasource_detail', args=[self.sources[0].pk])
+        self.assertEqual(len(self.client.get(url).context['relationships']), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('delete_datasource', args=[self.sources[1].pk]))
+        self.assertEqual(len(self.client.get(url).context['relationships']), 1)
+        self.assertEqual(len(self.client.get(reverse('schema_list')).context['schemas']), SOURCES - 1)
+
+    def test_bump_sets_new_generations(self):
+        seen = set(generations(['catalog', 'source:1']))
+        for _ in range(3):
+            bump('catalog', 'source:1')
+            current = generations(['catalog', 'source:1'])
+            self.assertFalse(seen & set(current))
+            seen.update(current)
+
+
+class SearchTests(QueryBudgetTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.accounts = cls.add_source('crm_accounts.csv', 'accounts', {
+            'CustomerID': {'type': 'int64', 'sample_values': [1, 2]},
+            'region': {'type': 'object', 'sample_values': ['north']},
+        })
+        cls.visits = cls.add_source('web_visits.csv', 'visits', {
+            'visit_id': {'type': 'int64', 'sample_values': [1]},
+            'page': {'type': 'object', 'sample_values': ['/region/north']},
+        })
+
+    @classmethod
+    def add_source(cls, filename, canonical_name, column_definitions):
+        source = DataSource.objects.create(original_filename=filename, canonical_name=canonical_name)
+        SchemaDefinition.objects.create(data_source=source, column_definitions=column_definitions, row_count=2)
+        return source
+
+    def search(self, query):
+        return [schema.data_source for schema in search_schemas(query)]
+
+    def test_wildcards_match_identifier_words(self):
+        results = search_schemas('cust*id')
+        self.assertEqual([schema.data_source for schema in results], [self.accounts])
+        self.assertEqual(results[0].matched_columns, ['CustomerID'])
+        self.assertEqual(self.search('customer_id'), [self.accounts])
+
+    def test_phrases_stay_within_a_column_name(self):
+        # CustomerID is followed by region, but no column is called id_region
+        self.assertEqual(self.search('id_region'), [])
+        self.assertEqual(self.search('customer_id region'), [self.accounts])
+
+    def test_column_names_rank_above_sample_values(self):
+        self.assertEqual(self.search('region'), [self.accounts, self.visits])
+
+    def test_names_are_searched(self):
+        self.assertEqual(self.search('visits'), [self.visits])
+        self.assertEqual(len(self.search('customers')), SOURCES)
+
+    def test_index_follows_renames_and_deletes(self):
+        self.visits.original_filename = 'web_sessions.csv'
+        self.visits.save()
+        self.assertEqual(self.search('sessions'), [self.visits])
+
+        self.accounts.delete()
+        self.assertEqual(self.search('cust*id'), [])
+
+    def test_reanalysis_updates_index(self):
+        self.accounts.schema.column_definitions = {'account_number': {'type': 'int64'}}
+        self.accounts.schema.save()
+        self.assertEqual(self.search('cust*id'), [])
+        self.assertEqual(self.search('account num'), [self.accounts])
+
+    def test_search_view(self):
+        response = self.client.get(reverse('search'), {'q': 'cust*id'})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'crm_accounts.csv')
+        self.assertIsNone(response.context['next_page'])
+
+
+class AsyncViewTests(QueryBudgetTestCase):
+
+    async def test_concurrent_previews(self):
+        url = reverse('file_preview', args=[self.source.pk])
+        responses = await asyncio.gather(*[self.async_client.get(url) for _ in range(10)])
+        self.assertEqual({response.status_code for response in responses}, {200})
+        self.assertEqual(len(responses[0].json()['table_data']['rows']), 10)
+
+    async def test_parse_slots_are_limited(self):
+        with override_settings(PARSE_CONCURRENCY=1, PARSE_QUEUE_TIMEOUT=0.05):
+            slow = asyncio.ensure_future(run_parse(time.sleep, 0.5))
+            await asyncio.sleep(0.01)
+            with self.assertRaises(ParserBusy):
+                await run_parse(time.sleep, 0)
+            await slow
+
+    async def test_process_workers_report_metrics(self):
+        metrics.reset_metrics()
+        metrics.increment('tracker_ingest_rows_total', 5)
+        with override_settings(PARSE_EXECUTOR='process', PARSE_WORKERS=1):
+            shutdown_executor()
+            self.addCleanup(shutdown_executor)
+            df = await run_parse(read_csv_file, self.source.file.path)
+            with self.assertRaises(FileNotFoundError):
+                await run_parse(read_csv_file, os.path.join(self.media_root, 'missing.csv'))
+
+        rendered = metrics.render_metrics()
+        self.assertEqual(len(df), 20)
+        self.assertIn(f'tracker_ingest_bytes_read_total{{source_type="csv"}} {self.source.file.size}', rendered)
+        self.assertIn('tracker_ingest_stage_duration_seconds_count{stage="parse"} 2', rendered)
+        self.assertIn('tracker_ingest_stage_errors_total{stage="parse"} 1', rendered)
+        # What the parent had recorded when the worker forked isn't sent back twice
+        self.assertIn('tracker_ingest_rows_total 5', rendered)
+
+    def test_parse_limit_holds_across_event_loops(self):
+        # Under WSGI every async view runs on its own event loop
+        running = 0
+        peak = 0
+        lock = threading.Lock()
+
+        def parse():
+            nonlocal running, peak
+            with lock:
+                running += 1
+                peak = max(peak, running)
+            time.sleep(0.05)
+            with lock:
+                running -= 1
+
+        with override_settings(PARSE_WORKERS=8, PARSE_CONCURRENCY=3, PARSE_QUEUE_TIMEOUT=5):
+            shutdown_executor()
+            self.addCleanup(shutdown_executor)
+            threads = [threading.Thread(target=asyncio.run, args=(run_parse(parse),)) for _ in range(10)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(peak, 3)
+
+
+class AdminQueryTests(QueryBudgetTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.staff)
+
+    def test_changelists(self):
+        for model in ['datasource', 'schemadefinition', 'primarykeycandidate', 'schemachange',
+                      'schemarelationship', 'columnprofile']:
+            with self.subTest(model=model):
+                response = self.client.get(reverse(f'admin:tracker_{model}_changelist'))
+                self.assertEqual(response.status_code, 200)
+
+    def test_change_pages(self):
+        for model, pk in [('datasource', self.source.pk), ('schemadefinition', self.source.schema.pk)]:
+            with self.subTest(model=model):
+                response = self.client.get(reverse(f'admin:tracker_{model}_change', args=[pk]))
+                self.assertEqual(response.status_code, 200)
+
+
+class CompressedFileTests(QueryBudgetTestCase):
+
+    def compressed_upload(self, name, data, source_type='csv'):
+        response = self.client.post(reverse('upload'), {
+            'file': SimpleUploadedFile(name, data), 'canonical_name': 'orders', 'source_type': source_type,
+        })
+        datasource = DataSource.objects.filter(canonical_name='orders').latest('pk')
+        self.assertRedirects(response, reverse('datasource_detail', args=[datasource.pk]))
+        return datasource
+
+    def test_uncompressed_size(self):
+        data = ''.join(f"{n},{n * 7919 % 10007},name{n % 97}\n" for n in range(200_000)).encode()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = os.path.join(directory, 'orders.csv.gz')
+        with open(path, 'wb') as f:
+            f.write(gzip.compress(data))
+        self.assertEqual(uncompressed_size(path), len(data))
+        # Estimated from the start of a file too big to read through
+        with mock.patch('tracker.compression.SIZE_SAMPLE', len(data) // 8):
+            self.assertAlmostEqual(uncompressed_size(path) / len(data), 1, delta=0.1)
+
+        path = os.path.join(directory, 'orders.zip')
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as z:
+            z.writestr('orders.csv', data)
+        self.assertEqual(uncompressed_size(path), len(data))
+
+    def test_gzip_upload_and_preview(self):
+        datasource = self.compressed_upload('orders.csv.gz', gzip.compress(csv_file('orders.csv').read()))
+        self.assertEqual(datasource.schema.row_count, 20)
+        self.assertEqual(detect_source_type(datasource.file.path), 'csv')
+
+        preview = self.client.get(reverse('file_preview', args=[datasource.pk])).json()
+        self.assertEqual(preview['table_data']['headers'], ['id', 'name', 'amount'])
+
+    def test_zip_upload(self):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as z:
+            z.writestr('export/orders.csv', csv_file('orders.csv').read())
+        datasource = self.compressed_upload('orders.zip', archive.getvalue())
+        self.assertEqual(datasource.schema.get_columns(), ['id', 'name', 'amount'])
+
+    @unittest.skipIf(zstandard is None, "zstandard isn't installed")
+    def test_zstd_at_rest(self):
+        with override_settings(UPLOAD_COMPRESSION='zstd'):
+            datasource = self.compressed_upload('orders.csv', csv_file('orders.csv').read())
+        self.assertTrue(datasource.file.name.endswith('.csv.zst'))
+        self.assertEqual(datasource.schema.row_count, 20)
+
+    @unittest.skipIf(zstandard is None, "zstandard isn't installed")
+    def test_seekable_zstd(self):
+        data = bytes(range(256)) * 1000
+        compressed = io.BytesIO()
+        write_seekable_zstd(io.BytesIO(data), compressed, frame_size=10000)
+        # Any zstd decoder reads the file, skipping the seek table
+        self.assertEqual(zstandard.ZstdDecompressor().stream_reader(io.BytesIO(compressed.getvalue()),
+                                                                    read_across_frames=True).read(), data)
+
+        compressed.seek(0)
+        with open_zstd(compressed) as f:
+            f.seek(123456)
+            self.assertEqual(f.read(100), data[123456:123556])
+            self.assertEqual(f.seek(0, os.SEEK_END), len(data))
+
+    def test_diff_compressed_excel(self):
+        versions = []
+        for n, ids in enumerate([range(10), range(5, 15)]):
+            data = io.BytesIO()
+            pd.DataFrame({'id': ids, 'value': ['x'] * len(ids)}).to_excel(data, index=False)
+            datasource = self.compressed_upload(f'orders_v{n + 1}.xlsx.gz', gzip.compress(data.getvalue()),
+                                                source_type='excel')
+            datasource.schema.primary_keys.filter(column_name='id').update(is_confirmed=True)
+            versions.append(datasource)
+        result = diff_datasources(*versions)
+        self.assertEqual((result['inserted'], result['deleted'], result['unchanged']), (5, 5, 5))
+
+    def test_zstd_needs_zstandard(self):
+        with mock.patch('tracker.checks.find_spec', return_value=None):
+            self.assertEqual(check_upload_compression(None), [])
+            with override_settings(UPLOAD_COMPRESSION='zstd'):
+                self.assertEqual([error.id for error in check_upload_compression(None)], ['tracker.E002'])
+        with mock.patch.dict('sys.modules', {'zstandard': None}):
+            with self.assertRaisesMessage(ImportError, 'needs the zstandard package'):
+                open_zstd(io.BytesIO(b''))
+
+
+class WorkbookTests(QueryBudgetTestCase):
+
+    def workbook_file(self, sheets=4):
+        data = io.BytesIO()
+        with pd.ExcelWriter(data, engine='openpyxl') as writer:
+            for n in range(sheets):
+                pd.DataFrame({'id': range(10), f"value_{n}": [n] * 10}).to_excel(
+                    writer, sheet_name=f"Sheet {n}", index=False
+                )
+            # Sheets without columns are skipped
+            pd.DataFrame().to_excel(writer, sheet_name='Notes', index=False)
+        return SimpleUploadedFile('finance.xlsx', data.getvalue())
+
+    def upload(self):
+        return self.client.post(reverse('upload'), {
+            'file': self.workbook_file(), 'canonical_name': 'finance', 'source_type': 'excel', 'all_sheets': '1',
+        })
+
+    def test_upload_every_sheet(self):
+        response = self.upload()
+        workbook = Workbook.objects.get()
+        self.assertRedirects(response, reverse('workbook_detail', args=[workbook.pk]))
+
+        sheets = list(workbook.sheets.select_related('schema').order_by('pk'))
+        self.assertEqual([sheet.sheet_name for sheet in sheets], ['Sheet 0', 'Sheet 1', 'Sheet 2', 'Sheet 3'])
+        self.assertEqual(sheets[1].canonical_name, 'finance:Sheet 1')
+        self.assertEqual(sheets[1].schema.get_columns(), ['id', 'value_1'])
+        self.assertEqual({sheet.file.name for sheet in sheets}, {workbook.file.name})
+
+        self.assertContains(self.client.get(reverse('workbook_detail', args=[workbook.pk])), 'finance:Sheet 3')
+        self.assertContains(self.client.get(reverse('datasource_detail', args=[sheets[0].pk])),
+                            reverse('workbook_detail', args=[workbook.pk]))
+
+    def test_unreadable_workbook_is_logged(self):
+        with self.assertLogs('tracker.views', 'WARNING'):
+            self.client.post(reverse('upload'), {
+                'file': SimpleUploadedFile('finance.xlsx', b'not a workbook'), 'canonical_name': 'finance',
+                'source_type': 'excel', 'all_sheets': '1',
+            })
+        self.assertFalse(Workbook.objects.exists())
+
+    def test_sheets_are_versioned(self):
+        self.upload()
+        self.upload()
+        self.assertEqual(
+            sorted(DataSource.objects.filter(canonical_name='finance:Sheet 0').values_list('schema_version', flat=True)),
+            [1, 2]
+        )
+
+    def test_reprocess_reads_own_sheet(self):
+        self.upload()
+        sheet = DataSource.objects.get(canonical_name='finance:Sheet 2')
+        self.assertTrue(process_excel_file(sheet))
+        self.assertEqual(SchemaDefinition.objects.get(data_source=sheet).get_columns(), ['id', 'value_2'])
+
+    def test_retry_and_new_versions_keep_sheet(self):
+        self.upload()
+        sheet = DataSource.objects.get(canonical_name='finance:Sheet 2')
+        self.client.post(reverse('retry_detection', args=[sheet.pk]), {'file_type': 'excel', 'sheet_name': ''})
+        self.assertEqual(SchemaDefinition.objects.get(data_source=sheet).get_columns(), ['id', 'value_2'])
+
+        self.client.post(reverse('reprocess_file', args=[sheet.pk]),
+                         {'file_type': 'excel', 'sheet_name': '', 'create_new_version': 'on'})
+        version = DataSource.objects.get(canonical_name='finance:Sheet 2', schema_version=2)
+        self.assertEqual((version.workbook_id, version.sheet_name), (sheet.workbook_id, 'Sheet 2'))
+        self.assertEqual(version.schema.get_columns(), ['id', 'value_2'])
+
+    def test_diff_reads_each_versions_sheet(self):
+        self.upload()
+        self.upload()
+        old, new = DataSource.objects.filter(canonical_name='finance:Sheet 1').order_by('schema_version')
+        response = self.client.get(reverse('data_diff', args=[old.pk, new.pk]), {'key': 'id'})
+        self.assertEqual(response.context['result']['compared_columns'], ['value_1'])
+        self.assertEqual(response.context['result']['unchanged'], 10)
+
+
+class IngestCommandTests(QueryBudgetTestCase):
+
+    def test_sheet_name(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        with pd.ExcelWriter(os.path.join(directory, 'finance.xlsx'), engine='openpyxl') as writer:
+            for name in ['Summary', 'Ledger', 'Budget']:
+                pd.DataFrame({'id': range(10), f"{name} value": range(10)}).to_excel(writer, sheet_name=name,
+                                                                                     index=False)
+
+        # All digits is a position, anything else a name
+        for sheet, canonical_name in [('2', 'budget'), ('Ledger', 'ledger')]:
+            call_command('ingest', directory, '--sheet-name', sheet, '--canonical-name', canonical_name,
+                         '--workers', '1', '--skip-relationships', stdout=io.StringIO())
+            IngestedFile.objects.all().delete()
+        self.assertIn('Budget value', DataSource.objects.get(canonical_name='budget').schema.get_columns())
+        self.assertIn('Ledger value', DataSource.objects.get(canonical_name='ledger').schema.get_columns())
+
+
+class WatchTests(QueryBudgetTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def write(self, name, extra_column=False, age=60):
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as f:
+            f.write(csv_file(name, extra_column=extra_column).read())
+        mtime = time.time() - age
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def watch(self, debounce=30):
+        call_command('watch', self.directory, '--once', '--workers', '1', '--debounce', str(debounce),
+                     stdout=io.StringIO(), stderr=io.StringIO())
+
+    def test_ingests_new_and_changed_files(self):
+        self.write('orders.csv')
+        self.watch()
+        self.assertEqual(DataSource.objects.filter(canonical_name='orders').count(), 1)
+
+        # Unchanged files aren't opened again
+        with mock.patch('tracker.management.commands.ingest.read_file') as read_file:
+            self.watch()
+        read_file.assert_not_called()
+
+        self.write('orders.csv', extra_column=True, age=40)
+        self.watch()
+        latest = DataSource.objects.filter(canonical_name='orders').latest('schema_version')
+        self.assertEqual(latest.schema_version, 2)
+        self.assertEqual(latest.schema.get_columns(), ['id', 'name', 'amount', 'note'])
+
+    def test_debounce(self):
+        self.write('orders.csv', age=0)
+        self.watch()
+        self.assertFalse(DataSource.objects.filter(canonical_name='orders').exists())
+        self.watch(debounce=0)
+        self.assertTrue(DataSource.objects.filter(canonical_name='orders').exists())
+
+
+class StartupTests(SimpleTestCase):
+
+    def test_workers_start_without_analysis_modules(self):
+        # Raises CommandError if loading the URLconf imports pandas, numpy, ...
+        call_command('benchmark_startup', '--repeat', '1', '--no-heavy-modules', stdout=io.StringIO())
+
+    @mock.patch.object(DiscoverRunner, 'teardown_test_environment')
+    @mock.patch.object(DiscoverRunner, 'setup_test_environment')
+    def test_test_runner_restores_settings(self, setup, teardown):
+        runner = QueryBudgetTestRunner()
+        with override_settings(QUERY_BUDGET_RAISE=False):
+            runner.setup_test_environment()
+            self.assertTrue(settings.QUERY_BUDGET_RAISE)
+            runner.teardown_test_environment()
+            self.assertFalse(settings.QUERY_BUDGET_RAISE)
+
+    @unittest.skipIf(importlib.util.find_spec('psycopg_pool'), "psycopg's pool is installed")
+    def test_pool_needs_psycopg_3(self):
+        result = subprocess.run(
+            [sys.executable, '-c', 'import schemanavigator.settings'], capture_output=True, text=True,
+            cwd=settings.BASE_DIR, env=dict(os.environ, DB_ENGINE='postgresql', DB_POOL='True')
+        )
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn("ImproperlyConfigured: DB_POOL=True needs psycopg 3", result.stderr)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    Routing against two local SQLite databases: the test database as the
+    primary and a file copied from it with SQLite's backup API as a replica
+    that lags behind until replicate() is called.
+    """
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        replica_settings = dict(connections.settings['default'], NAME=os.path.join(directory, 'replica.sqlite3'))
+        connections['replica'] = connections['default'].__class__(replica_settings, alias='replica')
+        self.addCleanup(self.remove_replica)
+        # Earlier writes in this thread pin reads to the primary
+        token = db._use_primary.set(False)
+        self.addCleanup(db._use_primary.reset, token)
+
+    def remove_replica(self):
+        connections['replica'].close()
+        del connections['replica']
+
+    def replicate(self):
+        connections['replica'].close()
+        connections['default'].ensure_connection()
+        replica = sqlite3.connect(connections['replica'].settings_dict['NAME'])
+        connections['default'].connection.backup(replica)
+        replica.close()
+
+    def source_names(self, **cookies):
+        self.client.cookies.clear()
+        for name, value in cookies.items():
+            self.client.cookies[name] = value
+        response = self.client.get(reverse('api:datasource-list'))
+        return sorted(source['canonical_name'] for source in response.json()['results'])
+
+    def test_reads_go_to_replica_until_client_writes(self):
+        DataSource.objects.create(original_filename='orders.csv', canonical_name='orders')
+        self.replicate()
+        source = DataSource.objects.create(original_filename='customers.csv', canonical_name='customers')
+        candidate = PrimaryKeyCandidate.objects.create(
+            schema=SchemaDefinition.objects.create(data_source=source, columns=[['id', 'int64']]),
+            column_name='id', uniqueness_ratio=1.0
+        )
+
+        self.assertEqual(self.source_names(), ['orders'])
+        response = self.client.post(reverse('toggle_primary_key', args=[candidate.pk]))
+        self.assertEqual(response.cookies[db.PRIMARY_COOKIE]['max-age'], settings.REPLICA_LAG)
+        self.assertEqual(self.source_names(**{db.PRIMARY_COOKIE: '1'}), ['customers', 'orders'])
+
+        self.replicate()
+        self.assertEqual(self.source_names(), ['customers', 'orders'])
+
+    def test_router(self):
+        router = db.PrimaryReplicaRouter()
+        self.assertEqual(router.db_for_read(User), 'default')
+        self.assertEqual(router.db_for_read(DataSource), 'replica')
+        with transaction.atomic():
+            self.assertEqual(router.db_for_read(DataSource), 'default')
+        with db.use_primary():
+            self.assertEqual(router.db_for_read(DataSource), 'default')
+        self.assertFalse(router.allow_migrate('replica', 'tracker'))
+
+        self.assertEqual(router.db_for_write(DataSource), 'default')
+        self.assertEqual(router.db_for_read(DataSource), 'default')
+
+    def test_stage_counts_replica_queries(self):
+        self.replicate()
+        # As in production, where replicas are in DATABASES. Connected first, as
+        # the test framework only lets configured aliases it knows about connect.
+        connections['replica'].ensure_connection()
+        connections.settings['replica'] = connections['replica'].settings_dict
+        self.addCleanup(connections.settings.pop, 'replica')
+        metrics.reset_metrics()
+        with metrics.stage('compare'):
+            list(DataSource.objects.all())
+            list(DataSource.objects.using('default'))
+        self.assertIn('tracker_ingest_stage_queries_total{stage="compare"} 2', metrics.render_metrics())
+
+    def test_sqlite_pragmas(self):
+        with connections['replica'].cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+
+
+class RowIndexTests(QueryBudgetTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # Quoted fields with newlines, commas and escaped quotes in every fifth row
+        self.rows = [['id', 'comment']] + [
+            [str(n), f'line one\nline "two", {n}' if n % 5 == 0 else f'comment {n}'] for n in range(2500)
+        ]
+        text = io.StringIO()
+        csv.writer(text).writerows(self.rows)
+        self.data = text.getvalue().encode()
+
+    def browse(self, datasource, **params):
+        response = self.client.get(reverse('browse_rows', args=[datasource.pk]), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def upload(self, name, data):
+        self.client.post(reverse('upload'), {'file': SimpleUploadedFile(name, data), 'canonical_name': 'notes',
+                                             'source_type': 'csv'})
+        return DataSource.objects.get(canonical_name='notes')
+
+    def test_browse_rows(self):
+        datasource = self.upload('notes.csv', self.data)
+        self.assertTrue(default_storage.exists(index_name(datasource.file.name)))
+
+        page = self.browse(datasource, start=1234, count=7)
+        self.assertEqual(page['headers'], ['id', 'comment'])
+        self.assertEqual(page['total_rows'], 2500)
+        self.assertEqual(page['rows'], self.rows[1235:1242])
+        self.assertEqual(self.browse(datasource, start=2498, count=10)['rows'], self.rows[2499:])
+
+    def test_browse_compressed_rows(self):
+        datasource = self.upload('notes.csv.gz', gzip.compress(self.data))
+        self.assertEqual(self.browse(datasource, start=2000, count=3)['rows'], self.rows[2001:2004])
+
+    @unittest.skipIf(zstandard is None, "zstandard isn't installed")
+    def test_browse_zstd_at_rest(self):
+        with override_settings(UPLOAD_COMPRESSION='zstd'), mock.patch('tracker.compression.SEEKABLE_FRAME_SIZE', 4096):
+            datasource = self.upload('notes.csv', self.data)
+        self.assertEqual(self.browse(datasource, start=1500, count=3)['rows'], self.rows[1501:1504])
+
+    def test_index_interval(self):
+        path = os.path.join(self.media_root, 'notes.csv')
+        with open(path, 'wb') as f:
+            f.write(self.data)
+        index = build_row_index(path, interval=100)
+        self.assertEqual(len(index['offsets']), 25)
+        # Each entry points at the start of a record, not into a quoted field
+        with open(path, 'rb') as f:
+            f.seek(index['offsets'][3])
+            self.assertEqual(next(csv.reader(io.StringIO(f.read().decode(), newline=''))), self.rows[301])
+
+    def test_index_failures_are_logged(self):
+        with self.assertLogs('tracker.views', 'WARNING') as logs:
+            index_rows('missing.csv')
+        self.assertIn('missing.csv', logs.output[0])
+
+    def test_bad_requests(self):
+        url = reverse('browse_rows', args=[self.source.pk])
+        self.assertEqual(self.client.get(url, {'start': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'count': 0}).status_code, 400)
+
+
+class ColumnTableTests(QueryBudgetTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.wide = DataSource.objects.create(original_filename='wide.csv', canonical_name='wide')
+        cls.wide.file.save('wide.csv', csv_file('wide.csv'))
+        SchemaDefinition.objects.create(
+            data_source=cls.wide,
+            column_definitions={f"metric_{n}": {'type': 'float64', 'sample_values': [n]} for n in range(5000)},
+            row_count=1
+        )
+
+    def columns(self, datasource, **params):
+        response = self.client.get(reverse('datasource_columns', args=[datasource.pk]), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_detail_page_leaves_columns_to_the_table(self):
+        response = self.client.get(reverse('datasource_detail', args=[self.wide.pk]))
+        self.assertNotContains(response, 'metric_4999')
+        self.assertContains(response, reverse('datasource_columns', args=[self.wide.pk]))
+
+    def test_pages(self):
+        page = self.columns(self.wide, offset=4990, limit=20)
+        self.assertEqual(page['total'], 5000)
+        self.assertEqual([column['name'] for column in page['columns']], [f"metric_{n}" for n in range(4990, 5000)])
+        self.assertEqual(page['columns'][0], {'name': 'metric_4990', 'type': 'float64', 'sample_values': [4990]})
+
+    def test_filter(self):
+        page = self.columns(self.wide, q='METRIC_499')
+        self.assertEqual(page['total'], 11)
+        self.assertEqual(page['columns'][0]['name'], 'metric_499')
+
+    def test_missing_schema(self):
+        datasource = DataSource.objects.create(original_filename='empty.csv', canonical_name='empty')
+        self.assertEqual(self.client.get(reverse('datasource_columns', args=[datasource.pk])).status_code, 404)
+
+
+class SchemaStorageTests(TestCase):
+
+    def setUp(self):
+        self.source = DataSource.objects.create(original_filename='orders.csv', canonical_name='orders')
+        self.schema = SchemaDefinition.objects.create(
+            data_source=self.source,
+            column_definitions={
+                'order_id': {'type': 'int64', 'sample_values': [1, 2]},
+                'total': {'type': 'float64', 'sample_values': [9.5]},
+            }
+        )
+
+    def test_split(self):
+        schema = SchemaDefinition.objects.get(pk=self.schema.pk)
+        self.assertEqual(schema.columns, [['order_id', 'int64'], ['total', 'float64']])
+        self.assertEqual(SchemaSamples.objects.get(schema=schema).sample_values, [[1, 2], [9.5]])
+        with self.assertNumQueries(0):
+            self.assertEqual(schema.get_columns(), ['order_id', 'total'])
+            self.assertEqual(schema.get_column_type('total'), 'float64')
+            self.assertEqual(schema.get_column_definitions(sample_values=False)['total'], {'type': 'float64'})
+        with self.assertNumQueries(1):
+            self.assertEqual(schema.column_definitions['order_id'], {'type': 'int64', 'sample_values': [1, 2]})
+
+    def test_update(self):
+        self.schema.column_definitions = {'order_id': {'type': 'object', 'sample_values': ['A1']}}
+        self.schema.save()
+        schema = SchemaDefinition.objects.select_related('samples').get(pk=self.schema.pk)
+        self.assertEqual(schema.column_definitions, {'order_id': {'type': 'object', 'sample_values': ['A1']}})
+
+    def test_api_omit_sample_values(self):
+        url = reverse('api:schemadefinition-detail', args=[self.schema.pk])
+        with self.assertNumQueries(1):
+            data = self.client.get(url, {'omit': 'sample_values,path_stats'}).json()
+        self.assertEqual(data['column_definitions']['total'], {'type': 'float64'})
+        self.assertEqual(self.client.get(url).json()['column_definitions']['total']['sample_values'], [9.5])
+
+
+class GuidedReadTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def write_csv(self, rows):
+        path = os.path.join(self.directory, 'orders.csv')
+        with open(path, 'w', newline='') as f:
+            csv.writer(f).writerows(rows)
+        return path
+
+    def orders(self, status=lambda n: ['open', 'closed'][n % 2]):
+        return [['order_id', 'status', 'total']] + [[n, status(n), n * 1.5] for n in range(100)]
+
+    def test_same_types_as_inference(self):
+        path = self.write_csv(self.orders())
+        inferred = analyze_dataframe(read_csv_file(path))['column_definitions']
+        hints = [[name, details['type']] for name, details in inferred.items()]
+        self.assertEqual(hints, [['order_id', 'int64'], ['status', 'category'], ['total', 'float64']])
+
+        df = read_csv_file(path, column_hints=hints)
+        self.assertEqual(str(df['status'].dtype), 'category')
+        self.assertEqual(str(df['order_id'].dtype), 'int8')  # Downcast
+        self.assertEqual(analyze_dataframe(df)['column_definitions'], inferred)
+
+    def test_mismatched_columns_are_inferred(self):
+        rows = self.orders(status=lambda n: n % 3)
+        rows[5][0] = 'A-5'
+        path = self.write_csv(rows)
+        with self.assertLogs('tracker.ingest', 'INFO') as logs:
+            df = read_csv_file(path, column_hints=[['order_id', 'int64'], ['status', 'category'], ['gone', 'int64']])
+        self.assertIn("Inferring columns of", '\n'.join(logs.output))
+        self.assertEqual(str(df['order_id'].dtype), 'object')
+        self.assertEqual(str(df['status'].dtype), 'int64')
+        self.assertEqual(analyze_dataframe(df)['column_definitions']['status']['type'], 'int64')
+
+    def test_hints_come_from_the_latest_version(self):
+        for version, column_type in [(1, 'object'), (2, 'int64')]:
+            source = DataSource.objects.create(original_filename=f"orders_v{version}.csv", canonical_name='orders',
+                                               schema_version=version)
+            SchemaDefinition.objects.create(data_source=source, column_definitions={'id': {'type': column_type}})
+        new = DataSource.objects.create(original_filename='orders_v3.csv', canonical_name='orders', schema_version=3)
+        self.assertEqual(previous_column_hints(new), [['id', 'int64']])
+        with override_settings(GUIDED_INGEST=False):
+            self.assertIsNone(previous_column_hints(new))
+
+
+class JSONFlatteningTests(TestCase):
+
+    def read(self, document, **options):
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+            f.write(document if isinstance(document, str) else json.dumps(document))
+        self.addCleanup(os.remove, f.name)
+        return read_json_file(f.name, **options)
+
+    def test_nested_paths_and_exploded_arrays(self):
+        df = self.read([
+            {'id': 1, 'customer': {'name': 'Ann', 'address': {'city': 'Oslo'}},
+             'items': [{'sku': 'A', 'qty': 2}, {'sku': 'B', 'qty': 1}], 'tags': ['x', 'y']},
+            {'id': 2, 'customer': {'name': 'Bob', 'address': None}, 'items': []},
+        ])
+        self.assertEqual(df.columns.tolist(),
+                         ['id', 'customer.name', 'customer.address.city', 'tags', 'items.sku', 'items.qty',
+                          'customer.address', 'items'])
+        self.assertEqual(df['items.sku'].tolist()[:2], ['A', 'B'])
+        self.assertEqual(df['customer.name'].tolist(), ['Ann', 'Ann', 'Bob'])
+
+        stats = analyze_dataframe(df)['path_stats']
+        self.assertEqual((stats['records'], stats['rows'], stats['exploded_path']), (2, 3, 'items'))
+        self.assertEqual(stats['paths']['customer.address']['nulls'], 1)
+        self.assertEqual(stats['paths']['items']['array'],
+                         {'count': 2, 'min_length': 0, 'max_length': 2, 'mean_length': 1.0})
+        self.assertNotIn('path_stats', df.attrs)
+
+    def test_bounds(self):
+        df = self.read({'a': {'b': {'c': {'d': 1}}}, 'e': 2, 'f': 3}, max_depth=2, max_paths=2)
+        self.assertEqual(df.columns.tolist(), ['a.b', 'e'])
+        self.assertEqual(json.loads(df['a.b'][0]), {'c': {'d': 1}})
+        self.assertEqual(df.attrs['path_stats']['dropped_values'], 1)
+
+    def test_path_cache_is_bounded(self):
+        flattener = Flattener(max_paths=100)
+        for i in range(200):
+            flattener.add({f'key{i * 500 + j}': {'value': j} for j in range(500)})
+        self.assertEqual(len(flattener.paths), 100)
+        self.assertLessEqual(len(flattener.child_paths), 200)
+        self.assertEqual(flattener.dropped_values, 200 * 500 - 100)
+
+    def test_json_lines_and_columns(self):
+        self.assertEqual(self.read('{"id": 1}\n{"id": 2}\n')['id'].tolist(), [1, 2])
+        self.assertEqual(self.read({'id': [1, 2], 'name': ['a', 'b']})['name'].tolist(), ['a', 'b'])
+        self.assertIsNone(self.read('[]'))
+
+    def test_stream_reads_values_across_reads(self):
+        stream = JSONStream(io.StringIO('[1234567, "abcdefghij", {"a": [1, 2]}] 42'), read_size=3)
+        values = []
+        while stream.peek():
+            if stream.peek() in '[,]':
+                stream.skip()
+            else:
+                values.append(stream.value())
+        self.assertEqual(values, [1234567, 'abcdefghij', {'a': [1, 2]}, 42])
+
+    def test_path_stats_are_stored(self):
+        source = DataSource.objects.create(original_filename='orders.json', canonical_name='orders')
+        SchemaDefinition.objects.create(data_source=source, column_definitions={'id': {'type': 'int64'}},
+                                        path_stats={'records': 1})
+        self.assertEqual(SchemaDefinition.objects.get(pk=source.schema.pk).path_stats, {'records': 1})
+
+
+class FilenameNormalizationTests(SimpleTestCase):
+
+    def test_dates_versions_and_extensions_are_dropped(self):
+        for filename in ['customer.csv', 'Customer_2025-03-11_v2.csv', 'customer_v2 (1).csv.gz', 'customer-v1.3.csv',
+                         'customer version 4.xlsx', 'customer_ver2.csv', 'customer_final.csv', 'customer copy.csv',
+                         '03-11-2025 customer latest.json']:
+            self.assertEqual(normalize_filename(filename), 'customer', filename)
+
+    def test_version_words_inside_names_are_kept(self):
+        for name in ['ipv4', 'dev1', 'tv2', 'photocopy', 'hotfinal']:
+            self.assertEqual(normalize_filename(f'{name}.csv'), name)
+        self.assertEqual(normalize_filename('ipv4_v2.csv'), 'ipv4')
+
+    def test_names_that_are_only_a_version_keep_their_stem(self):
+        self.assertEqual(normalize_filename('v2.csv'), 'v2')
+        self.assertEqual(normalize_filename('2025-03-11.csv'), '2025 03 11')
+        self.assertEqual(normalize_filename(''), '')
+
+
+class InclusionTests(TestCase):
+
+    def schema(self, name, df):
+        source = DataSource.objects.create(original_filename=f'{name}.csv', canonical_name=name)
+        schema = SchemaDefinition.objects.create(data_source=source, column_definitions={})
+        profiles, value_hashes = profile_columns(df)
+        ColumnProfile.objects.bulk_create([ColumnProfile(schema=schema, **profile) for profile in profiles])
+        return schema, value_hashes
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        hashes = pd.util.hash_array(np.arange(50_000).astype(str).astype(object))
+        bloom_filter, hash_count = build_bloom_filter(hashes)
+        self.assertTrue(bloom_contains(bloom_filter, hash_count, hashes).all())
+
+        others = pd.util.hash_array(np.arange(50_000, 60_000).astype(str).astype(object))
+        self.assertLess(bloom_contains(bloom_filter, hash_count, others).mean(), 0.03)
+
+    def test_containment_of_known_overlaps(self):
+        self.schema('customers', pd.DataFrame({'id': range(1000)}))
+        customers = ColumnProfile.objects.get(column_name='id')
+        for start, expected in [(0, 1.0), (500, 0.5), (1000, 0.0)]:
+            with self.subTest(start=start):
+                _, value_hashes = self.schema(f'orders_{start}',
+                                              pd.DataFrame({'customer_id': range(start, start + 1000)}))
+                orders = ColumnProfile.objects.filter(column_name='customer_id').latest('pk')
+                # Exact with every value, within sampling error with the MinHash sample
+                self.assertAlmostEqual(containment(orders, customers, value_hashes['customer_id']), expected,
+                                       delta=0.02)
+                self.assertAlmostEqual(containment(orders, customers), expected, delta=0.15)
+
+    def test_relationships_are_created(self):
+        customers, _ = self.schema('customers', pd.DataFrame({
+            'id': range(100), 'name': [f'n{n}' for n in range(100)],
+        }))
+        orders, value_hashes = self.schema('orders', pd.DataFrame({
+            'order_id': range(1000, 1300), 'customer_id': [n % 80 for n in range(300)],
+        }))
+        self.assertEqual(len(find_inclusion_dependencies(orders, value_hashes)), 1)
+        relationship = SchemaRelationship.objects.get(details__method='inclusion')
+        self.assertEqual((relationship.source_schema, relationship.target_schema), (orders, customers))
+        self.assertEqual((relationship.source_columns, relationship.target_columns), (['customer_id'], ['id']))
+        self.assertEqual(relationship.relationship_type, 'related')
+        self.assertTrue(relationship.details['verified'])
+
+    def test_bulk_matches_single_schema_results(self):
+        # Each table's keys contain every earlier table's
+        schemas = [self.schema(f'table_{n}', pd.DataFrame({f'key_{n}': range(100 + n * 20)}))[0] for n in range(6)]
+        expected = sorted(
+            (relationship.source_schema_id, relationship.target_schema_id)
+            for schema in schemas
+            for relationship in find_inclusion_dependencies(
+                schema, other_profiles=ColumnProfile.objects.filter(schema__pk__lt=schema.pk), save=False
+            )
+        )
+        self.assertTrue(expected)
+        for batch_size in [1, 2, 1000]:
+            with self.subTest(batch_size=batch_size):
+                relationships = find_inclusion_dependencies_bulk(schemas[2:], batch_size=batch_size)
+                found = sorted((relationship.source_schema_id, relationship.target_schema_id)
+                               for relationship in relationships)
+                self.assertEqual(found, [pair for pair in expected if max(pair) >= schemas[2].pk])
+
+    def test_discover_command_rebuilds_every_pair_once(self):
+        schemas = [self.schema(f'table_{n}', pd.DataFrame({f'key_{n}': range(100 + n * 20)}))[0] for n in range(4)]
+        out = io.StringIO()
+        with CaptureQueriesContext(connections['default']) as queries:
+            call_command('discover_inclusion_dependencies', stdout=out)
+        pairs = sorted(SchemaRelationship.objects.filter(details__method='inclusion')
+                       .values_list('source_schema_id', 'target_schema_id'))
+        self.assertEqual(pairs, [(schemas[a].pk, schemas[b].pk) for a in range(4) for b in range(a + 1, 4)])
+        self.assertIn('Found 6 inclusion dependencies', out.getvalue())
+        # One pass over the profiles however many schemas there are
+        self.assertLess(len(queries), 10)
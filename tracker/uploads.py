@@ -0,0 +1,163 @@
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from .compression import compress_at_rest
+from .models import DataSource, UploadSession
+
+UPLOAD_READ_SIZE = 1024 * 1024  # Bytes read from the request at a time
+MAX_CHUNK_SIZE = 256 * 1024 * 1024
+
+CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+
+class UploadError(Exception):
+    """A chunk that can't be accepted; status is the HTTP status to answer with"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_content_range(header):
+    """Parse 'bytes start-end/total' into (start, end exclusive, total)"""
+    match = CONTENT_RANGE.match(header.strip()) if header else None
+    if not match:
+        raise UploadError("Content-Range must look like 'bytes start-end/total'")
+
+    start, last, total = (int(value) for value in match.groups())
+    if last < start or last >= total:
+        raise UploadError("Content-Range is out of bounds", status=416)
+    return start, last + 1, total
+
+
+def start_upload(filename, size, canonical_name, source_type='csv', options=None):
+    """
+    Create an upload session and reserve the file's name in media storage,
+    so chunks go straight to where the DataSource will point.
+    """
+    if size < 0:
+        raise UploadError("Size can't be negative")
+
+    name = DataSource._meta.get_field('file').generate_filename(None, os.path.basename(filename))
+    name = default_storage.save(name, ContentFile(b''))
+
+    return UploadSession.objects.create(
+        original_filename=os.path.basename(filename),
+        canonical_name=canonical_name,
+        source_type=source_type,
+        options=options or {},
+        file_name=name,
+        size=size
+    )
+
+
+def write_chunk(session, stream, start, end, expected_sha256=None):
+    """
+    Store one chunk read from a file-like stream, hashing it on the way.
+
+    Chunks have to arrive in order. A chunk that was already stored (e.g. a
+    retry after a lost response) is accepted without writing it again; a chunk
+    past the current offset is refused so the client resumes from there.
+
+    The chunk is staged in a temporary file first and only copied into the
+    upload once it has fully arrived and matched its checksum. The session's
+    row stays locked while the bytes are written and synced and the offset
+    advanced past them, so a failed or concurrent request never overwrites
+    stored bytes and the offset never covers bytes that aren't on disk.
+    """
+    length = end - start
+    if end > session.size:
+        raise UploadError("Chunk goes past the end of the file", status=416)
+    if length > MAX_CHUNK_SIZE:
+        raise UploadError(f"Chunks can be at most {MAX_CHUNK_SIZE} bytes", status=413)
+    if end <= session.received:
+        return session
+    if start != session.received:
+        raise UploadError(f"Expected a chunk starting at byte {session.received}", status=409)
+
+    path = default_storage.path(session.file_name)
+    digest = hashlib.sha256()
+    remaining = length
+    with tempfile.TemporaryFile(dir=os.path.dirname(path)) as part:
+        while remaining:
+            data = stream.read(min(UPLOAD_READ_SIZE, remaining))
+            if not data:
+                break
+            part.write(data)
+            digest.update(data)
+            remaining -= len(data)
+
+        if remaining:
+            raise UploadError("Chunk is shorter than its Content-Range")
+        if expected_sha256 and digest.hexdigest() != expected_sha256.lower():
+            raise UploadError("Chunk checksum doesn't match", status=422)
+
+        with transaction.atomic():
+            locked = UploadSession.objects.select_for_update().get(pk=session.pk)
+            if locked.received != start:
+                stored = True
+            else:
+                stored = False
+                part.seek(0)
+                with open(path, 'r+b') as f:
+                    f.seek(start)
+                    shutil.copyfileobj(part, f, UPLOAD_READ_SIZE)
+                    f.flush()
+                    os.fsync(f.fileno())
+                # If this fails the transaction rolls back and the bytes lie past the offset, ignored
+                locked.received = end
+                locked.chunk_digests = locked.chunk_digests + [digest.hexdigest()]
+                locked.save(update_fields=['received', 'chunk_digests', 'updated_at'])
+
+    if stored:
+        raise UploadError("Chunk was stored by another request", status=409)
+    return locked
+
+
+def upload_checksum(chunk_digests):
+    """
+    Checksum of an upload from the SHA-256 of its chunks: the SHA-256 of their
+    digests in order. The chunks are hashed as they arrive, so the assembled
+    file never has to be read again for it.
+    """
+    return hashlib.sha256(b''.join(bytes.fromhex(digest) for digest in chunk_digests)).hexdigest()
+
+
+def finish_upload(session):
+    """
+    Turn a complete upload into a DataSource pointing at the stored file.
+    The file is neither read nor copied, unless uploads are compressed at rest.
+    """
+    if session.data_source_id:
+        return session.data_source
+    if not session.is_complete:
+        raise UploadError(f"Upload is incomplete: {session.received} of {session.size} bytes", status=409)
+
+    if not session.checksum:
+        # Of the chunks as stored, so a client can compare it with its own
+        session.checksum = upload_checksum(session.chunk_digests)
+
+    datasource = DataSource.objects.create(
+        original_filename=session.original_filename,
+        file=session.file_name,
+        canonical_name=session.canonical_name,
+        source_type=session.source_type
+    )
+    session.data_source = datasource
+    session.save(update_fields=['checksum', 'data_source', 'updated_at'])
+    compress_at_rest(datasource)
+    return datasource
+
+
+def cancel_upload(session):
+    """Drop an unfinished upload and its partial file"""
+    if session.data_source_id is None:
+        default_storage.delete(session.file_name)
+    session.delete()
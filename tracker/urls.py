@@ -4,12 +4,25 @@ from . import views
 urlpatterns = [
     path('', views.home, name='home'),
     path('upload/', views.upload, name='upload'),
+    path('upload/chunked/', views.chunked_upload_start, name='chunked_upload_start'),
+    path('upload/chunked/<uuid:upload_id>/', views.chunked_upload, name='chunked_upload'),
+    path('upload/chunked/<uuid:upload_id>/finish/', views.chunked_upload_finish, name='chunked_upload_finish'),
     path('datasource/<int:pk>/', views.datasource_detail, name='datasource_detail'),
+    path('workbook/<int:pk>/', views.workbook_detail, name='workbook_detail'),
     path('schemas/', views.schema_list, name='schema_list'),
+    path('search/', views.search, name='search'),
     path('compare/<int:pk1>/<int:pk2>/', views.compare_schemas, name='compare_schemas'),
     path('datasource/<int:pk>/retry/', views.retry_detection, name='retry_detection'),
     path('datasource/<int:pk>/reprocess/', views.reprocess_file, name='reprocess_file'),
     path('datasource/<int:pk>/delete/', views.delete_datasource, name='delete_datasource'),
     path('datasource/<int:pk>/preview/', views.file_preview, name='file_preview'),
+    path('datasource/<int:pk>/columns/', views.datasource_columns, name='datasource_columns'),
+    path('datasource/<int:pk>/rows/', views.browse_rows, name='browse_rows'),
     path('datasource/<int:pk>/reanalyze/', views.reanalyze_file, name='reanalyze_file'),
+    path('diff/<int:pk1>/<int:pk2>/', views.data_diff, name='data_diff'),
+    path('primary-key/<int:pk>/toggle/', views.toggle_primary_key, name='toggle_primary_key'),
+    path('metrics', views.metrics, name='metrics'),
+    path('profiles/', views.profile_list, name='profile_list'),
+    path('profiles/<str:profile_id>/', views.profile_detail, name='profile_detail'),
+    path('profiles/<str:profile_id>/download/', views.profile_download, name='profile_download'),
 ]
\ No newline at end of file
@@ -1,122 +1,241 @@
-import os
-import pandas as pd
-import numpy as np
+import csv
 import json
-from django.shortcuts import render, redirect, get_object_or_404
+import logging
+from itertools import islice
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
 from django.contrib import messages
 from django.urls import reverse
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse, FileResponse, Http404
+from django.contrib.admin.views.decorators import staff_member_required
 from django.views.decorators.csrf import csrf_exempt
-from .models import DataSource, SchemaDefinition, PrimaryKeyCandidate, SchemaChange, SchemaRelationship
-from .forms import DataSourceUploadForm
-from fuzzywuzzy import fuzz
-from django.core.serializers.json import DjangoJSONEncoder
-
-
+from django.views.decorators.http import require_POST, require_http_methods
+from .models import (
+    DataSource, SchemaDefinition, PrimaryKeyCandidate, SchemaChange, SchemaRelationship, UploadSession, Workbook
+)
+from .forms import DataSourceUploadForm, ChunkedUploadForm
+from .caching import cached
+from .compression import compress_at_rest, detect_source_type, open_source, seekable_stream
+from .executor import ParserBusy, run_parse
+from .metrics import render_metrics
+from .profiling import list_profiles, load_profile, profile_path
+from .rowindex import MAX_PAGE_ROWS, read_rows, save_row_index
+from .search import search_schemas
+from schemanavigator.querybudget import query_budget
+from .uploads import UploadError, parse_content_range, start_upload, write_chunk, finish_upload, cancel_upload
+
+SEARCH_PAGE_SIZE = 50
+SCHEMA_PAGE_SIZE = 100
+COLUMN_PAGE_SIZE = 200
+MAX_COLUMN_PAGE_SIZE = 1000
+
+logger = logging.getLogger(__name__)
+
+
+def load_recent_sources():
+    return list(DataSource.objects.all().order_by('-upload_date')[:5])
+
+@query_budget(1)
 def home(request):
-    recent_sources = DataSource.objects.all().order_by('-upload_date')[:5]
+    recent_sources = cached('home', ['catalog'], load_recent_sources)
     return render(request, 'tracker/home.html', {
         'title': 'Schema Navigator',
         'recent_sources': recent_sources
     })
 
-def upload(request):
+def save_upload(form, filename):
+    """
+    Save an uploaded data source, unless it duplicates an existing one.
+    Returns (datasource, None) or (None, the existing source)
+    """
+    datasource = form.save(commit=False)
+    datasource.original_filename = filename
+    datasource.save()
+
+    # Check for similar existing files to avoid duplication
+    similar_sources = DataSource.objects.filter(
+        original_filename=datasource.original_filename,
+        canonical_name=datasource.canonical_name,
+        source_type=datasource.source_type
+    ).exclude(pk=datasource.pk)
+
+    if similar_sources.exists():
+        # Delete the new datasource and use the most recent similar source
+        datasource.delete()
+        return None, similar_sources.order_by('-upload_date').first()
+
+    compress_at_rest(datasource)
+    return datasource, None
+
+def upload_read_options(data, file_type):
+    """Options for read_file() from the upload form fields"""
+    if file_type == 'csv':
+        delimiter_preset = data.get('delimiter_preset', 'comma')
+        delimiter = ','  # Default
+
+        if delimiter_preset == 'tab':
+            delimiter = '\t'
+        elif delimiter_preset == 'semicolon':
+            delimiter = ';'
+        elif delimiter_preset == 'pipe':
+            delimiter = '|'
+        elif delimiter_preset == 'custom':
+            custom_delimiter = data.get('delimiter_custom', '')
+            if custom_delimiter:
+                delimiter = custom_delimiter
+
+        return {'delimiter': delimiter, 'encoding': data.get('encoding', 'utf-8')}
+
+    elif file_type == 'excel':
+        sheet_name = data.get('sheet_name', '')
+        # If sheet_name is a number, convert to int
+        if sheet_name and sheet_name.isdigit():
+            sheet_name = int(sheet_name)
+        # If empty, set to 0 (first sheet)
+        elif not sheet_name:
+            sheet_name = 0
+        return {'sheet_name': sheet_name}
+
+    elif file_type == 'json':
+        return {'encoding': data.get('encoding', 'utf-8')}
+
+    return {}
+
+async def aprocess_file(datasource, **options):
+    """
+    Async counterpart of the process_*_file() functions: the file is parsed and
+    analyzed on the parse executor and only the schema is saved from here.
+    Raises ParserBusy when the executor is saturated.
+    """
+    from .ingest import analyze_file, previous_column_hints, save_analysis
+
+    # Other types are detected from the file extension, as in process_file()
+    source_type = datasource.source_type if datasource.source_type in ('csv', 'excel', 'json') else None
+    if (source_type or detect_source_type(datasource.file.path)) == 'csv':
+        options.setdefault('column_hints', await sync_to_async(previous_column_hints)(datasource))
+    try:
+        analysis = await run_parse(analyze_file, datasource.file.path, source_type, **options)
+    except ParserBusy:
+        raise
+    except Exception as e:
+        print(f"Error processing file: {e}")
+        return False
+
+    if analysis is None:
+        # Unsupported file type or JSON structure
+        return False
+
+    try:
+        await sync_to_async(save_analysis)(datasource, analysis)
+    except Exception as e:
+        print(f"Error creating schema from DataFrame: {e}")
+        return False
+
+    if (source_type or detect_source_type(datasource.file.path)) == 'csv':
+        try:
+            await run_parse(index_rows, datasource.file.name)
+        except ParserBusy:
+            # Built on the first browse_rows() request instead
+            pass
+    return True
+
+async def aprocess_workbook(workbook):
+    """
+    Ingest every sheet of a workbook: it's parsed once and its sheets analyzed
+    on the parse executor, then saved together. Returns the sheets' data
+    sources, none if the workbook couldn't be read. Raises ParserBusy.
+    """
+    from .ingest import analyze_workbook, save_workbook
+
+    try:
+        analyses = await run_parse(analyze_workbook, workbook.file.path)
+    except ParserBusy:
+        raise
+    except Exception:
+        logger.warning("Could not read workbook %s", workbook.pk, exc_info=True)
+        return []
+
+    if not analyses:
+        return []
+    try:
+        return await sync_to_async(save_workbook)(workbook, analyses)
+    except Exception:
+        logger.warning("Could not save the sheets of workbook %s", workbook.pk, exc_info=True)
+        return []
+
+@query_budget(17)
+async def upload(request):
+    status = 200
     if request.method == 'POST':
         form = DataSourceUploadForm(request.POST, request.FILES)
-        if form.is_valid():
+        if form.is_valid() and form.cleaned_data['source_type'] == 'excel' and request.POST.get('all_sheets'):
+            # One data source per sheet, under a workbook
+            workbook = await Workbook.objects.acreate(
+                original_filename=request.FILES['file'].name,
+                file=request.FILES['file'],
+                canonical_name=form.cleaned_data['canonical_name']
+            )
+            try:
+                sheets = await aprocess_workbook(workbook)
+            except ParserBusy as e:
+                sheets = []
+                status = 503
+                messages.error(request, str(e))
+
+            if sheets:
+                messages.success(request, f'Workbook "{workbook.original_filename}" uploaded and schemas detected '
+                                          f'for {len(sheets)} sheets!')
+                return redirect('workbook_detail', pk=workbook.pk)
+            if status != 503:
+                messages.error(request, f'Error processing workbook "{workbook.original_filename}"')
+            await workbook.adelete()
+        elif form.is_valid():
             # Save the uploaded file
-            datasource = form.save(commit=False)
-            datasource.original_filename = request.FILES['file'].name
-            datasource.save()
+            datasource, similar_source = await sync_to_async(save_upload)(form, request.FILES['file'].name)
 
-            # Check for similar existing files to avoid duplication
-            similar_sources = DataSource.objects.filter(
-                original_filename=datasource.original_filename,
-                canonical_name=datasource.canonical_name,
-                source_type=datasource.source_type
-            ).exclude(pk=datasource.pk)
-
-            if similar_sources.exists():
-                # Use the most recent similar source
-                similar_source = similar_sources.order_by('-upload_date').first()
+            if similar_source:
                 messages.info(request, f'Using existing source "{similar_source.original_filename}" '
                                        f'(v{similar_source.schema_version}) instead of creating a duplicate')
-
-                # Delete the new datasource since we're using an existing one
-                datasource.delete()
                 return redirect('datasource_detail', pk=similar_source.pk)
 
-            # Get additional processing options
-            file_type = datasource.source_type
-
             # Process the file based on the type and options
-            success = False
-
-            if file_type == 'csv':
-                delimiter_preset = request.POST.get('delimiter_preset', 'comma')
-                delimiter = ','  # Default
-
-                if delimiter_preset == 'tab':
-                    delimiter = '\t'
-                elif delimiter_preset == 'semicolon':
-                    delimiter = ';'
-                elif delimiter_preset == 'pipe':
-                    delimiter = '|'
-                elif delimiter_preset == 'custom':
-                    custom_delimiter = request.POST.get('delimiter_custom', '')
-                    if custom_delimiter:
-                        delimiter = custom_delimiter
-
-                encoding = request.POST.get('encoding', 'utf-8')
-                success = process_csv_file(datasource, delimiter=delimiter, encoding=encoding)
-
-            elif file_type == 'excel':
-                sheet_name = request.POST.get('sheet_name', '')
-                # If sheet_name is a number, convert to int
-                if sheet_name and sheet_name.isdigit():
-                    sheet_name = int(sheet_name)
-                # If empty, set to 0 (first sheet)
-                elif not sheet_name:
-                    sheet_name = 0
-
-                success = process_excel_file(datasource, sheet_name=sheet_name)
-
-            elif file_type == 'json':
-                encoding = request.POST.get('encoding', 'utf-8')
-                success = process_json_file(datasource, encoding=encoding)
-
-            else:
-                # Default processing
-                success = process_file(datasource)
+            try:
+                success = await aprocess_file(datasource, **upload_read_options(request.POST, datasource.source_type))
+            except ParserBusy as e:
+                success = False
+                status = 503
+                messages.error(request, str(e))
 
             if success:
                 messages.success(request, f'File "{datasource.original_filename}" successfully uploaded and schema detected!')
                 return redirect('datasource_detail', pk=datasource.pk)
             else:
-                messages.error(request, f'Error processing file "{datasource.original_filename}"')
+                if status != 503:
+                    messages.error(request, f'Error processing file "{datasource.original_filename}"')
                 # Clean up the datasource since we couldn't process it
-                datasource.delete()
+                await datasource.adelete()
     else:
         form = DataSourceUploadForm()
 
-    return render(request, 'tracker/upload.html', {
+    # Rendering reads the session for messages, which isn't allowed from async code
+    return await sync_to_async(render)(request, 'tracker/upload.html', {
         'form': form,
         'title': 'Upload Data Source'
-    })
+    }, status=status)
+
 def process_file(datasource):
     """
     Process the uploaded file, detect schema, and identify primary keys
     """
-    file_path = datasource.file.path
-    _, file_extension = os.path.splitext(file_path)
+    source_type = detect_source_type(datasource.file.path)
 
     # Read the file based on its type
     try:
-        if file_extension.lower() in ['.xlsx', '.xls']:
+        if source_type == 'excel':
             return process_excel_file(datasource)
-        elif file_extension.lower() == '.csv':
+        elif source_type == 'csv':
             return process_csv_file(datasource)
-        elif file_extension.lower() == '.json':
+        elif source_type == 'json':
             return process_json_file(datasource)
         else:
             # Unsupported file type
@@ -126,87 +245,31 @@ def process_file(datasource):
         print(f"Error processing file: {e}")
         return False
 
-def find_related_sources(datasource):
-    """
-    Find potentially related sources based on filename similarity and schema
-    """
-    # Skip if this is the first source
-    if DataSource.objects.count() <= 1:
-        return
-
-    # Get the new source's schema
-    new_schema = SchemaDefinition.objects.get(data_source=datasource)
-    new_columns = set(new_schema.get_columns())
+def load_datasource_detail(pk, schema_pk):
+    """Primary keys, version history and relationships shown on a data source's page"""
+    primary_keys = list(PrimaryKeyCandidate.objects.filter(schema_id=schema_pk))
+    changes = list(SchemaChange.objects.filter(source_id=pk).select_related('previous_version'))
 
-    # Look for existing sources with similar names or schemas
-    existing_sources = DataSource.objects.exclude(pk=datasource.pk)
-
-    for existing in existing_sources:
-        try:
-            existing_schema = SchemaDefinition.objects.get(data_source=existing)
-            existing_columns = set(existing_schema.get_columns())
-
-            # Calculate name similarity
-            name_similarity = fuzz.ratio(datasource.original_filename, existing.original_filename) / 100
-
-            # Calculate schema similarity
-            common_columns = new_columns.intersection(existing_columns)
-            schema_similarity = len(common_columns) / max(len(new_columns), len(existing_columns))
-
-            # Overall similarity is a weighted combination
-            similarity = (name_similarity * 0.4) + (schema_similarity * 0.6)
-
-            # If similarity is above threshold, create a relationship
-            if similarity > 0.5:
-                relationship_type = 'version' if similarity > 0.8 else 'related'
-
-                # Check if this might be a newer version
-                if name_similarity > 0.7 and datasource.upload_date > existing.upload_date:
-                    # Record changes between versions
-                    added_columns = new_columns - existing_columns
-                    removed_columns = existing_columns - new_columns
-
-                    if added_columns:
-                        SchemaChange.objects.create(
-                            source=datasource,
-                            previous_version=existing,
-                            change_type='add_column',
-                            details={'columns': list(added_columns)}
-                        )
-
-                    if removed_columns:
-                        SchemaChange.objects.create(
-                            source=datasource,
-                            previous_version=existing,
-                            change_type='remove_column',
-                            details={'columns': list(removed_columns)}
-                        )
-
-                # Create relationship record
-                SchemaRelationship.objects.create(
-                    source_schema=existing_schema,
-                    target_schema=new_schema,
-                    relationship_type=relationship_type,
-                    source_columns=list(common_columns),
-                    target_columns=list(common_columns),
-                    similarity_score=similarity
-                )
-        except SchemaDefinition.DoesNotExist:
-            continue
+    # Get relationships, with the sources on both ends for the template
+    relationships = SchemaRelationship.objects.select_related(
+        'source_schema__data_source', 'target_schema__data_source'
+    ).defer('source_schema__columns', 'target_schema__columns')
+    outgoing = relationships.filter(source_schema_id=schema_pk)
+    incoming = relationships.filter(target_schema_id=schema_pk)
+    return primary_keys, changes, list(outgoing) + list(incoming)
 
+@query_budget(6)
 def datasource_detail(request, pk):
-    datasource = get_object_or_404(DataSource, pk=pk)
+    # Columns are fetched page by page by the table on the page, see datasource_columns()
+    datasource = get_object_or_404(
+        DataSource.objects.select_related('schema').defer('schema__columns'), pk=pk
+    )
 
     try:
-        schema = SchemaDefinition.objects.get(data_source=datasource)
-        primary_keys = PrimaryKeyCandidate.objects.filter(schema=schema)
-        changes = SchemaChange.objects.filter(source=datasource)
-
-        # Get relationships
-        outgoing = SchemaRelationship.objects.filter(source_schema=schema)
-        incoming = SchemaRelationship.objects.filter(target_schema=schema)
-        relationships = list(outgoing) + list(incoming)
-
+        schema = datasource.schema
+        primary_keys, changes, relationships = cached(
+            'datasource_detail', [f"source:{pk}", f"schema:{schema.pk}"], load_datasource_detail, pk, schema.pk
+        )
     except SchemaDefinition.DoesNotExist:
         schema = None
         primary_keys = []
@@ -222,16 +285,106 @@ def datasource_detail(request, pk):
         'title': f'Data Source: {datasource.original_filename}'
     })
 
+def load_columns(pk):
+    """[name, type, sample values] of each column of a data source's schema, or None without a schema"""
+    schema = SchemaDefinition.objects.filter(data_source_id=pk).values_list(
+        'columns', 'samples__sample_values'
+    ).first()
+    if schema is None:
+        return None
+    columns, sample_values = schema
+    sample_values = sample_values or []
+    return [
+        [column, column_type, sample_values[position] if position < len(sample_values) else []]
+        for position, (column, column_type) in enumerate(columns)
+    ]
+
+@query_budget(1)
+def datasource_columns(request, pk):
+    """
+    A page of a schema's columns for the column table, ?offset=&limit=,
+    filtered by name with ?q=. total is the number of matching columns.
+    """
+    columns = cached('datasource_columns', [f"source:{pk}"], load_columns, pk)
+    if columns is None:
+        raise Http404("No schema found for this data source")
+
+    try:
+        offset = max(0, int(request.GET.get('offset', 0)))
+        limit = min(max(1, int(request.GET.get('limit', COLUMN_PAGE_SIZE))), MAX_COLUMN_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({'error': 'offset and limit must be numbers'}, status=400)
+
+    query = request.GET.get('q', '').strip().lower()
+    if query:
+        columns = [column for column in columns if query in str(column[0]).lower()]
+
+    return JsonResponse({
+        'total': len(columns),
+        'offset': offset,
+        'columns': [
+            {'name': name, 'type': column_type, 'sample_values': sample_values}
+            for name, column_type, sample_values in columns[offset:offset + limit]
+        ],
+    })
+
+def load_schema_list(page):
+    # One extra schema tells us whether there's a next page
+    offset = (page - 1) * SCHEMA_PAGE_SIZE
+    return list(SchemaDefinition.objects.select_related('data_source')
+                .order_by('-detected_date', '-pk')[offset:offset + SCHEMA_PAGE_SIZE + 1])
+
+@query_budget(2)
+def workbook_detail(request, pk):
+    """The sheets of a workbook, each a data source with its own schema"""
+    workbook = get_object_or_404(Workbook, pk=pk)
+    sheets = workbook.sheets.select_related('schema').order_by('pk')
+    return render(request, 'tracker/workbook_detail.html', {
+        'workbook': workbook,
+        'sheets': sheets,
+        'title': f'Workbook: {workbook.original_filename}'
+    })
+
+@query_budget(1)
 def schema_list(request):
-    schemas = SchemaDefinition.objects.all().order_by('-detected_date')
+    try:
+        page = max(1, int(request.GET.get('page', 1)))
+    except ValueError:
+        page = 1
+
+    # Cached page by page, so a write only costs the pages that are read again
+    schemas = cached('schema_list', ['catalog'], load_schema_list, page)
     return render(request, 'tracker/schema_list.html', {
-        'schemas': schemas,
+        'schemas': schemas[:SCHEMA_PAGE_SIZE],
+        'previous_page': page - 1 if page > 1 else None,
+        'next_page': page + 1 if len(schemas) > SCHEMA_PAGE_SIZE else None,
         'title': 'All Schemas'
     })
 
-def compare_schemas(request, pk1, pk2):
-    schema1 = get_object_or_404(SchemaDefinition, pk=pk1)
-    schema2 = get_object_or_404(SchemaDefinition, pk=pk2)
+@query_budget(2)
+def search(request):
+    """Ranked full-text search over column names, canonical names, filenames and sample values"""
+    query = request.GET.get('q', '').strip()
+    try:
+        page = max(1, int(request.GET.get('page', 1)))
+    except ValueError:
+        page = 1
+
+    # One extra result tells us whether there's a next page
+    results = search_schemas(query, limit=SEARCH_PAGE_SIZE + 1, offset=(page - 1) * SEARCH_PAGE_SIZE)
+
+    return render(request, 'tracker/search.html', {
+        'query': query,
+        'results': results[:SEARCH_PAGE_SIZE],
+        'previous_page': page - 1 if page > 1 else None,
+        'next_page': page + 1 if len(results) > SEARCH_PAGE_SIZE else None,
+        'title': 'Search Columns'
+    })
+
+def load_schema_comparison(pk1, pk2):
+    """Column differences between two schemas for compare_schemas()"""
+    schema1 = get_object_or_404(SchemaDefinition.objects.select_related('data_source'), pk=pk1)
+    schema2 = get_object_or_404(SchemaDefinition.objects.select_related('data_source'), pk=pk2)
 
     # Get column sets
     columns1 = set(schema1.get_columns())
@@ -253,16 +406,21 @@ def compare_schemas(request, pk1, pk2):
                 'schema2_type': type2
             }
 
-    return render(request, 'tracker/compare_schemas.html', {
+    return {
         'schema1': schema1,
         'schema2': schema2,
         'common_columns': common_columns,
         'only_in_schema1': only_in_schema1,
         'only_in_schema2': only_in_schema2,
         'type_differences': type_differences,
-        'title': 'Compare Schemas'
-    })
+    }
+
+@query_budget(2)
+def compare_schemas(request, pk1, pk2):
+    comparison = cached('compare_schemas', [f"schema:{pk1}", f"schema:{pk2}"], load_schema_comparison, pk1, pk2)
+    return render(request, 'tracker/compare_schemas.html', dict(comparison, title='Compare Schemas'))
 
+@query_budget(33)
 def retry_detection(request, pk):
     datasource = get_object_or_404(DataSource, pk=pk)
 
@@ -300,9 +458,9 @@ def retry_detection(request, pk):
             # If sheet_name is a number, convert to int
             if sheet_name and sheet_name.isdigit():
                 sheet_name = int(sheet_name)
-            # If empty, set to 0 (first sheet)
+            # If empty, use the data source's own sheet (or the first)
             elif not sheet_name:
-                sheet_name = 0
+                sheet_name = None
 
             success = process_excel_file(datasource, sheet_name=sheet_name)
 
@@ -323,33 +481,34 @@ def retry_detection(request, pk):
 
 def process_csv_file(datasource, delimiter=',', encoding='utf-8'):
     """Process a CSV file with specific delimiter and encoding"""
+    from .ingest import read_csv_file, previous_column_hints
+
     try:
-        file_path = datasource.file.path
-        print(f"Processing CSV file: {file_path}")
-        print(f"Using delimiter: '{delimiter}' and encoding: {encoding}")
+        df = read_csv_file(datasource.file.path, delimiter=delimiter, encoding=encoding,
+                           column_hints=previous_column_hints(datasource))
+    except Exception as e:
+        print(f"Second attempt failed: {e}")
+        return False
+    success = create_schema_from_dataframe(df, datasource)
+    if success:
+        index_rows(datasource.file.name)
+    return success
 
-        # Try to read with pandas
-        df = pd.read_csv(file_path, delimiter=delimiter, encoding=encoding, engine='python')
-        print(f"CSV read successful. Columns: {df.columns.tolist()}")
-        print(f"Found {len(df)} rows")
+def index_rows(file_name):
+    """Build the row index used by browse_rows(); if it fails it's built on first use instead"""
+    try:
+        save_row_index(file_name)
+    except Exception:
+        logger.warning("Could not build the row index of %s", file_name, exc_info=True)
 
-        return create_schema_from_dataframe(df, datasource)
-    except Exception as e:
-        print(f"Error processing CSV file: {e}")
-        # Try with different engine as fallback
-        try:
-            print("Trying with C engine instead...")
-            df = pd.read_csv(file_path, delimiter=delimiter, encoding=encoding, engine='c')
-            return create_schema_from_dataframe(df, datasource)
-        except Exception as e2:
-            print(f"Second attempt failed: {e2}")
-            return False
+def process_excel_file(datasource, sheet_name=None):
+    """Process an Excel file with specific sheet, by default its own sheet of a workbook or the first"""
+    from .ingest import read_excel_file
 
-def process_excel_file(datasource, sheet_name=0):
-    """Process an Excel file with specific sheet"""
+    if sheet_name is None:
+        sheet_name = datasource.sheet_name or 0
     try:
-        file_path = datasource.file.path
-        df = pd.read_excel(file_path, sheet_name=sheet_name)
+        df = read_excel_file(datasource.file.path, sheet_name=sheet_name)
         return create_schema_from_dataframe(df, datasource)
     except Exception as e:
         print(f"Error processing Excel file: {e}")
@@ -357,31 +516,11 @@ def process_excel_file(datasource, sheet_name=0):
 
 def process_json_file(datasource, encoding='utf-8'):
     """Process a JSON file"""
+    from .ingest import read_json_file
+
     try:
-        file_path = datasource.file.path
-        with open(file_path, 'r', encoding=encoding) as f:
-            data = json.load(f)
-
-        # Convert to dataframe - this handles different JSON structures
-        if isinstance(data, list):
-            # List of records
-            df = pd.DataFrame(data)
-        elif isinstance(data, dict):
-            # Try to convert dictionary to dataframe
-            if all(isinstance(data[key], (list, dict)) for key in data):
-                # Nested structure - flatten first level
-                flattened = {}
-                for key, value in data.items():
-                    if isinstance(value, list):
-                        flattened[key] = value
-                    elif isinstance(value, dict):
-                        for subkey, subvalue in value.items():
-                            flattened[f"{key}_{subkey}"] = subvalue
-                df = pd.DataFrame(flattened)
-            else:
-                # Simple dict
-                df = pd.DataFrame([data])
-        else:
+        df = read_json_file(datasource.file.path, encoding=encoding)
+        if df is None:
             # Unsupported JSON structure
             return False
 
@@ -392,97 +531,27 @@ def process_json_file(datasource, encoding='utf-8'):
 
 def create_schema_from_dataframe(df, datasource):
     """Create schema definition from a pandas DataFrame"""
-    try:
-        # Remove any existing schema (in case this is a retry)
-        try:
-            old_schema = SchemaDefinition.objects.get(data_source=datasource)
-
-            # Remove related primary key candidates
-            PrimaryKeyCandidate.objects.filter(schema=old_schema).delete()
-
-            # Remove the schema itself
-            old_schema.delete()
-        except SchemaDefinition.DoesNotExist:
-            pass
-
-        # Detect schema
-        column_definitions = {}
-        for column in df.columns:
-            column_type = str(df[column].dtype)
-
-            # Check for categorical data
-            if column_type == 'object' and df[column].nunique() < len(df) * 0.5:
-                column_type = 'category'
-
-            column_definitions[column] = {
-                'type': column_type,
-                'sample_values': df[column].dropna().head(5).tolist()
-            }
-
-        # Create schema definition
-        schema = SchemaDefinition.objects.create(
-            data_source=datasource,
-            column_definitions=json.loads(json.dumps(column_definitions, cls=CustomJSONEncoder)),
-            row_count=len(df)
-        )
-
-        # Identify potential primary keys
-        for column in df.columns:
-            # Skip columns with NaN values
-            if df[column].isna().any():
-                continue
-
-            # Calculate uniqueness ratio
-            uniqueness = df[column].nunique() / len(df)
-
-            # Only consider columns with high uniqueness (>80%)
-            if uniqueness > 0.8:
-                PrimaryKeyCandidate.objects.create(
-                    schema=schema,
-                    column_name=column,
-                    uniqueness_ratio=uniqueness,
-                    is_confirmed=False  # Needs user confirmation
-                )
-
-        # Check for relationships with existing sources
-        find_related_sources(datasource)
-
-        # Record this as the initial version
-        SchemaChange.objects.create(
-            source=datasource,
-            change_type='initial',
-            details={'columns': list(column_definitions.keys())}
-        )
+    from .ingest import analyze_dataframe, save_analysis
 
+    try:
+        save_analysis(datasource, analyze_dataframe(df))
         return True
     except Exception as e:
         print(f"Error creating schema from DataFrame: {e}")
         return False
 
-def file_preview(request, pk):
-    """Get a preview of the file content with specified encoding and options"""
-    datasource = get_object_or_404(DataSource, pk=pk)
-
-    # Get parameters from request
-    file_type = request.GET.get('file_type', datasource.source_type)
-    encoding = request.GET.get('encoding', 'utf-8')
-    delimiter = request.GET.get('delimiter', ',')
-    sheet_name = request.GET.get('sheet_name', 0)
-
-    # Handle tab delimiter special case
-    if delimiter == 'tab':
-        delimiter = '\t'
+def build_preview(file_path, file_type, encoding='utf-8', delimiter=',', sheet_name=0):
+    """Preview text and table data for file_preview(); runs on the parse executor"""
+    import pandas as pd
 
     preview_text = "Unable to generate preview"
     response_data = {'preview': preview_text}
 
     try:
-        file_path = datasource.file.path
-
         if file_type == 'csv':
-            # Read as text file for preview
-            with open(file_path, 'r', encoding=encoding) as f:
-                lines = [line.strip() for line in f.readlines()[:10]]
+            # Read as text file for preview; compressed files are only decompressed this far
+            with open_source(file_path, encoding=encoding) as f:
+                lines = [line.strip() for line in islice(f, 10)]
                 preview_text = '\n'.join(lines)
 
             # Also provide the delimiter used for the client-side parser
@@ -490,7 +559,8 @@ def file_preview(request, pk):
 
             # Try to also parse as a DataFrame for table data
             try:
-                df = pd.read_csv(file_path, delimiter=delimiter, encoding=encoding, nrows=10, engine='python')
+                with open_source(file_path) as f:
+                    df = pd.read_csv(f, delimiter=delimiter, encoding=encoding, nrows=10, engine='python')
                 # Convert DataFrame to a simple format for the table view
                 response_data['table_data'] = {
                     'headers': df.columns.tolist(),
@@ -510,7 +580,8 @@ def file_preview(request, pk):
                 elif not sheet_name:
                     sheet_name = 0
 
-                df = pd.read_excel(file_path, sheet_name=sheet_name, nrows=10)
+                with open_source(file_path) as f:
+                    df = pd.read_excel(seekable_stream(f), sheet_name=sheet_name, nrows=10)
                 preview_text = df.to_string(index=False)
 
                 # Also provide table data - strictly limit to 10 rows total (including header)
@@ -524,7 +595,7 @@ def file_preview(request, pk):
         elif file_type == 'json':
             # Read JSON and format nicely
             try:
-                with open(file_path, 'r', encoding=encoding) as f:
+                with open_source(file_path, encoding=encoding) as f:
                     data = json.load(f)
                     # Format JSON with indentation for readability
                     preview_text = json.dumps(data, indent=2)
@@ -547,8 +618,8 @@ def file_preview(request, pk):
 
         else:
             # Generic text preview
-            with open(file_path, 'r', encoding=encoding) as f:
-                lines = [line.strip() for line in f.readlines()[:10]]
+            with open_source(file_path, encoding=encoding) as f:
+                lines = [line.strip() for line in islice(f, 10)]
                 preview_text = '\n'.join(lines)
 
     except Exception as e:
@@ -557,8 +628,66 @@ def file_preview(request, pk):
     # Update the preview text in the response
     response_data['preview'] = preview_text
 
+    return response_data
+
+@query_budget(1)
+async def file_preview(request, pk):
+    """Get a preview of the file content with specified encoding and options"""
+    datasource = await aget_object_or_404(DataSource, pk=pk)
+
+    # Get parameters from request
+    file_type = request.GET.get('file_type', datasource.source_type)
+    encoding = request.GET.get('encoding', 'utf-8')
+    delimiter = request.GET.get('delimiter', ',')
+    sheet_name = request.GET.get('sheet_name', 0)
+
+    # Handle tab delimiter special case
+    if delimiter == 'tab':
+        delimiter = '\t'
+
+    # Parsing is offloaded so that previews don't tie up the server
+    try:
+        response_data = await run_parse(build_preview, datasource.file.path, file_type, encoding=encoding,
+                                        delimiter=delimiter, sheet_name=sheet_name)
+    except ParserBusy as e:
+        return JsonResponse({'preview': str(e)}, status=503, headers={'Retry-After': '5'})
+
     return JsonResponse(response_data)
 
+@query_budget(1)
+async def browse_rows(request, pk):
+    """
+    A page of a CSV data source's rows, ?start=<row>&count=<rows> (rows
+    counted from 0 after the header), read by seeking through the row index
+    """
+    datasource = await aget_object_or_404(DataSource, pk=pk)
+    if not datasource.file or detect_source_type(datasource.file.name) != 'csv':
+        return JsonResponse({'error': 'Rows can only be browsed in CSV files'}, status=400)
+
+    try:
+        start = int(request.GET.get('start', 0))
+        count = int(request.GET.get('count', 100))
+    except ValueError:
+        return JsonResponse({'error': 'start and count must be numbers'}, status=400)
+    if start < 0 or not 0 < count <= MAX_PAGE_ROWS:
+        return JsonResponse({'error': f'start must be 0 or more and count between 1 and {MAX_PAGE_ROWS}'},
+                            status=400)
+
+    delimiter = request.GET.get('delimiter', ',')
+    if delimiter == 'tab':
+        delimiter = '\t'
+
+    try:
+        page = await run_parse(read_rows, datasource.file.name, start, count, delimiter=delimiter,
+                               encoding=request.GET.get('encoding', 'utf-8'))
+    except ParserBusy as e:
+        return JsonResponse({'error': str(e)}, status=503, headers={'Retry-After': '5'})
+    except (OSError, UnicodeDecodeError, csv.Error) as e:
+        return JsonResponse({'error': f"Error reading rows: {e}"}, status=400)
+
+    return JsonResponse(page)
+
+@query_budget(1)
 def reanalyze_file(request, pk):
     """Show file preview and options for re-analyzing a file"""
     datasource = get_object_or_404(DataSource, pk=pk)
@@ -568,6 +697,7 @@ def reanalyze_file(request, pk):
         'title': f'Re-analyze: {datasource.original_filename}'
     })
 
+@query_budget(32)
 def reprocess_file(request, pk):
     """Re-process a file with specified options"""
     datasource = get_object_or_404(DataSource, pk=pk)
@@ -590,7 +720,8 @@ def reprocess_file(request, pk):
             similar_sources = DataSource.objects.filter(
                 original_filename=datasource.original_filename,
                 canonical_name=datasource.canonical_name,
-                source_type=file_type
+                source_type=file_type,
+                sheet_name=datasource.sheet_name
             ).exclude(pk=datasource.pk)
 
             # If we found similar sources, don't create a duplicate
@@ -607,7 +738,9 @@ def reprocess_file(request, pk):
                 file=datasource.file,
                 canonical_name=datasource.canonical_name,
                 schema_version=datasource.schema_version + 1,
-                source_type=file_type
+                source_type=file_type,
+                workbook=datasource.workbook,
+                sheet_name=datasource.sheet_name
             )
 
             # Store the target datasource for processing
@@ -655,9 +788,9 @@ def reprocess_file(request, pk):
             # If sheet_name is a number, convert to int
             if sheet_name and sheet_name.isdigit():
                 sheet_name = int(sheet_name)
-            # If empty, set to 0 (first sheet)
+            # If empty, use the data source's own sheet (or the first)
             elif not sheet_name:
-                sheet_name = 0
+                sheet_name = None
 
             success = process_excel_file(target_datasource, sheet_name=sheet_name)
 
@@ -687,6 +820,7 @@ def reprocess_file(request, pk):
     # Redirect back to the datasource detail
     return redirect('datasource_detail', pk=datasource.pk)
 
+@query_budget(20)
 def delete_datasource(request, pk):
     """Delete a datasource and its associated schema"""
     datasource = get_object_or_404(DataSource, pk=pk)
@@ -701,16 +835,206 @@ def delete_datasource(request, pk):
 
     return redirect('schema_list')
 
+@query_budget(2)
+def toggle_primary_key(request, pk):
+    """Confirm or un-confirm a primary key candidate"""
+    candidate = get_object_or_404(PrimaryKeyCandidate.objects.select_related('schema'), pk=pk)
 
-class CustomJSONEncoder(DjangoJSONEncoder):
-    def default(self, obj):
-        from decimal import Decimal
-        import datetime
+    if request.method == 'POST':
+        candidate.is_confirmed = not candidate.is_confirmed
+        candidate.save(update_fields=['is_confirmed'])
 
-        if isinstance(obj, Decimal):
-            return float(obj)
-        elif isinstance(obj, datetime.datetime):
-            return obj.strftime('%Y-%m-%d %H:%M:%S')
-        elif isinstance(obj, datetime.date):
-            return obj.strftime('%Y-%m-%d')
-        return super().default(obj)
+        if candidate.is_confirmed:
+            messages.success(request, f'Confirmed "{candidate.column_name}" as a primary key')
+        else:
+            messages.info(request, f'"{candidate.column_name}" is no longer a confirmed primary key')
+
+    return redirect('datasource_detail', pk=candidate.schema.data_source_id)
+
+@query_budget(3)
+def data_diff(request, pk1, pk2):
+    """
+    Compare the rows of two data source versions on the key columns given as
+    ?key=a,b, by default the confirmed primary key
+    """
+    from .diff import diff_datasources
+
+    old = get_object_or_404(DataSource, pk=pk1)
+    new = get_object_or_404(DataSource, pk=pk2)
+
+    # Same read options as the file preview
+    encoding = request.GET.get('encoding', 'utf-8')
+    delimiter = request.GET.get('delimiter', ',')
+    sheet_name = request.GET.get('sheet_name') or None
+    key_columns = [column.strip() for column in request.GET.get('key', '').split(',') if column.strip()] or None
+
+    if delimiter == 'tab':
+        delimiter = '\t'
+    # By default each version is read from its own sheet
+    if sheet_name and sheet_name.isdigit():
+        sheet_name = int(sheet_name)
+
+    try:
+        result = diff_datasources(old, new, key_columns=key_columns, delimiter=delimiter, encoding=encoding,
+                                  sheet_name=sheet_name)
+    except Exception as e:
+        logger.warning("Could not diff data sources %s and %s", old.pk, new.pk, exc_info=True)
+        messages.error(request, f'Could not compare rows: {e}')
+        return redirect('datasource_detail', pk=new.pk)
+
+    return render(request, 'tracker/data_diff.html', {
+        'old': old,
+        'new': new,
+        'result': result,
+        'title': 'Compare Rows'
+    })
+
+def upload_status(session):
+    """JSON description of an upload session for the chunked upload client"""
+    return {
+        'id': str(session.pk),
+        'filename': session.original_filename,
+        'size': session.size,
+        'offset': session.received,
+        'complete': session.is_complete,
+        'checksum': session.checksum,
+        'datasource': session.data_source_id,
+        'url': reverse('datasource_detail', args=[session.data_source_id]) if session.data_source_id else None,
+    }
+
+@require_POST
+@query_budget(1)
+def chunked_upload_start(request):
+    """Start a resumable upload; the client then PUTs the file in chunks"""
+    form = ChunkedUploadForm(request.POST)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+
+    data = form.cleaned_data
+    session = start_upload(
+        data['filename'],
+        data['size'],
+        data['canonical_name'],
+        source_type=data['source_type'],
+        options={
+            'delimiter': data['delimiter'] or ',',
+            'encoding': data['encoding'] or 'utf-8',
+            'sheet_name': data['sheet_name'],
+        }
+    )
+    return JsonResponse(upload_status(session), status=201)
+
+@require_http_methods(['GET', 'PUT', 'DELETE'])
+@query_budget(5)
+def chunked_upload(request, upload_id):
+    """
+    GET reports how many bytes have been stored, so an interrupted client
+    knows where to resume. PUT stores the chunk given by the Content-Range
+    header (an optional X-Chunk-SHA256 header is checked). DELETE cancels.
+    """
+    session = get_object_or_404(UploadSession, pk=upload_id)
+
+    if request.method == 'DELETE':
+        cancel_upload(session)
+        return JsonResponse({'deleted': True})
+
+    if request.method == 'PUT':
+        try:
+            start, end, total = parse_content_range(request.headers.get('Content-Range'))
+            if total != session.size:
+                raise UploadError(f"Upload is {session.size} bytes, not {total}")
+            # The request body is streamed to storage, never loaded into memory
+            session = write_chunk(session, request, start, end, request.headers.get('X-Chunk-SHA256'))
+        except UploadError as e:
+            session.refresh_from_db()
+            return JsonResponse(dict(upload_status(session), error=str(e)), status=e.status)
+
+    return JsonResponse(upload_status(session))
+
+@require_POST
+@query_budget(19)
+async def chunked_upload_finish(request, upload_id):
+    """Create the data source from a complete upload and analyze it in place"""
+    session = await aget_object_or_404(UploadSession.objects.select_related('data_source'), pk=upload_id)
+    if session.data_source_id:
+        return JsonResponse(upload_status(session))
+
+    try:
+        datasource = await sync_to_async(finish_upload)(session)
+    except UploadError as e:
+        return JsonResponse(dict(upload_status(session), error=str(e)), status=e.status)
+
+    options = session.options
+    if datasource.source_type == 'csv':
+        read_options = {'delimiter': options.get('delimiter', ','), 'encoding': options.get('encoding', 'utf-8')}
+    elif datasource.source_type == 'excel':
+        sheet_name = options.get('sheet_name') or 0
+        if isinstance(sheet_name, str) and sheet_name.isdigit():
+            sheet_name = int(sheet_name)
+        read_options = {'sheet_name': sheet_name}
+    elif datasource.source_type == 'json':
+        read_options = {'encoding': options.get('encoding', 'utf-8')}
+    else:
+        read_options = {}
+
+    status = 422
+    error = f'Error processing file "{session.original_filename}"'
+    try:
+        success = await aprocess_file(datasource, **read_options)
+    except ParserBusy as e:
+        success = False
+        status = 503
+        error = str(e)
+
+    if not success:
+        # Keep the uploaded file so finishing can be retried
+        await datasource.adelete()
+        session.data_source = None
+        return JsonResponse(dict(upload_status(session), error=error), status=status,
+                            headers={'Retry-After': '5'} if status == 503 else None)
+
+    messages.success(request, f'File "{datasource.original_filename}" successfully uploaded and schema detected!')
+    return JsonResponse(upload_status(session))
+
+@query_budget(0)
+def metrics(request):
+    """Ingest stage timings and counters for Prometheus to scrape"""
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@staff_member_required
+@query_budget(0)
+def profile_list(request):
+    """Recently profiled requests; ?sort=duration puts the slowest first"""
+    profiles = list_profiles()
+    if request.GET.get('sort') == 'duration':
+        profiles.sort(key=lambda profile: profile['duration'], reverse=True)
+
+    return render(request, 'tracker/profile_list.html', {
+        'profiles': profiles,
+        'sort': request.GET.get('sort', 'recent'),
+        'title': 'Request Profiles'
+    })
+
+@staff_member_required
+@query_budget(0)
+def profile_detail(request, profile_id):
+    """Stats summary and query log of one profiled request"""
+    try:
+        profile = load_profile(profile_id)
+    except (OSError, ValueError):
+        raise Http404("Profile not found")
+
+    return render(request, 'tracker/profile_detail.html', {
+        'profile': profile,
+        'title': f"Profile of {profile['path']}"
+    })
+
+@staff_member_required
+@query_budget(0)
+def profile_download(request, profile_id):
+    """The raw cProfile output, for snakeviz or pstats"""
+    try:
+        return FileResponse(open(profile_path(profile_id, 'prof'), 'rb'), as_attachment=True,
+                            filename=f"{profile_id}.prof")
+    except (OSError, ValueError):
+        raise Http404("Profile not found")